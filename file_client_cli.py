@@ -1,178 +1,1217 @@
-# file_client_cli.py - Fixed version with streaming support
-import socket
-import json
-import base64
-import logging
-import time
-import os
-import struct
-
-server_address = ('0.0.0.0', 7771)
-
-def send_all(sock, data):
-    """Send all data, handling partial sends"""
-    total_sent = 0
-    while total_sent < len(data):
-        try:
-            sent = sock.send(data[total_sent:])
-            if sent == 0:
-                raise RuntimeError("Socket connection broken")
-            total_sent += sent
-        except Exception as e:
-            logging.error(f"Error sending data: {e}")
-            return False
-    return True
-
-def receive_all(sock, size):
-    """Receive exactly 'size' bytes from socket"""
-    data = b""
-    while len(data) < size:
-        try:
-            chunk = sock.recv(min(size - len(data), 8192))
-            if not chunk:
-                break
-            data += chunk
-        except Exception as e:
-            logging.error(f"Error receiving data: {e}")
-            break
-    return data
-
-def send_command(command_str="", timeout=300):
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(timeout)
-    
-    try:
-        logging.warning(f"Connecting to server...")
-        sock.connect(server_address)
-        
-        command_data = command_str.encode('utf-8')
-        command_length = len(command_data)
-        
-        logging.warning(f"Sending command length: {command_length}")
-        
-        # Send command length first (4 bytes)
-        length_bytes = struct.pack('!I', command_length)
-        if not send_all(sock, length_bytes):
-            return {"status": "ERROR", "data": "Failed to send command length"}
-        
-        # Send command data
-        logging.warning(f"Sending command data...")
-        if not send_all(sock, command_data):
-            return {"status": "ERROR", "data": "Failed to send command data"}
-        
-        # Receive response length
-        length_data = receive_all(sock, 4)
-        if len(length_data) != 4:
-            return {"status": "ERROR", "data": "Failed to receive response length"}
-        
-        response_length = struct.unpack('!I', length_data)[0]
-        logging.warning(f"Expecting response length: {response_length}")
-        
-        # Receive response data
-        response_data = receive_all(sock, response_length)
-        if len(response_data) != response_length:
-            return {"status": "ERROR", "data": "Failed to receive complete response"}
-        
-        response_str = response_data.decode('utf-8')
-        logging.warning(f"Received response: {response_str[:100]}...")
-        
-        return json.loads(response_str)
-        
-    except json.JSONDecodeError as e:
-        logging.error(f"JSON decode error: {e}")
-        return {"status": "ERROR", "data": "Invalid JSON response"}
-    except socket.timeout:
-        logging.error("Socket timeout")
-        return {"status": "ERROR", "data": "Connection timeout"}
-    except Exception as e:
-        logging.error(f"Error during data transfer: {e}")
-        return {"status": "ERROR", "data": str(e)}
-    finally:
-        try:
-            sock.close()
-        except:
-            pass
-
-def remote_list():
-    command_str = "LIST"
-    hasil = send_command(command_str, timeout=30)
-    if hasil and hasil.get('status') == 'OK':
-        print("Daftar file:")
-        for nmfile in hasil['data']:
-            print(f"- {nmfile}")
-        return True
-    else:
-        print(f"Gagal: {hasil}")
-        return False
-
-def remote_get(filename=""):
-    start_time = time.time()
-    command_str = f"GET {filename}"
-    hasil = send_command(command_str, timeout=300)
-    
-    if hasil and hasil.get('status') == 'OK':
-        try:
-            namafile = hasil['data_namafile']
-            isifile = base64.b64decode(hasil['data_file'])
-            os.makedirs('downloaded_files', exist_ok=True)
-            
-            with open(f"downloaded_files/{namafile}", 'wb') as fp:
-                fp.write(isifile)
-            
-            end_time = time.time()
-            file_size = len(isifile)
-            duration = end_time - start_time
-            throughput = file_size / duration if duration > 0 else 0
-            
-            logging.warning(f"Download successful: {filename}, size: {file_size}, duration: {duration:.2f}s")
-            return True, duration, throughput
-        except Exception as e:
-            logging.error(f"Error processing download response: {e}")
-            return False, 0, 0
-    else:
-        logging.error(f"Download gagal: {hasil}")
-        return False, 0, 0
-
-def remote_upload(filename=""):
-    start_time = time.time()
-    try:
-        filepath = os.path.join('files', filename)
-        if not os.path.exists(filepath):
-            logging.error(f"File {filepath} tidak ditemukan")
-            return False, 0, 0
-        
-        file_size = os.path.getsize(filepath)
-        logging.warning(f"Uploading file: {filename}, size: {file_size} bytes")
-        
-        with open(filepath, 'rb') as fp:
-            file_content = fp.read()
-            isifile = base64.b64encode(file_content).decode('utf-8')
-        
-        command_str = f"UPLOAD {filename} {isifile}"
-        
-        # Dynamic timeout based on file size
-        timeout = max(300, file_size // (1024 * 1024) * 30)  # 30 seconds per MB, minimum 5 minutes
-        
-        hasil = send_command(command_str, timeout=timeout)
-        
-        if hasil and hasil.get('status') == 'OK':
-            end_time = time.time()
-            duration = end_time - start_time
-            throughput = file_size / duration if duration > 0 else 0
-            
-            logging.warning(f"Upload successful: {filename}, duration: {duration:.2f}s, throughput: {throughput:.2f} B/s")
-            return True, duration, throughput
-        else:
-            logging.error(f"Upload failed: {hasil}")
-            return False, 0, 0
-            
-    except Exception as e:
-        logging.error(f"Upload error: {e}")
-        return False, 0, 0
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.WARNING)
-    server_address = ('0.0.0.0', 7771)
-    remote_list()
-    remote_get('10mb.mp4')
-    remote_upload('10mb.mp4')
\ No newline at end of file
+# file_client_cli.py - Fixed version with streaming support
+import socket
+import json
+import logging
+import time
+import os
+import struct
+import threading
+import random
+import mmap
+import tempfile
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from file_protocol import (PROTOCOL_V2_MAGIC, CHUNK_SIZE, END_CHUNK, END_ENTRY, BodyReader, ChunkedReader,
+                           ChunkEncoder, pack_header, unpack_header, read_exact)
+from file_framing import connect, recv_exact, recv_with_fds, send_buffers, tune_socket, SOCKET_BUFFER_SIZE
+from file_interface import (file_sha256, weak_checksum, strong_checksum, DELTA_OP_COPY, DELTA_OP_DATA,
+                            DELTA_COPY, DELTA_DATA, DELTA_SIGNATURE)
+
+server_address = ('0.0.0.0', 7771)  # or a str: the server's --unix-socket path, for same-host clients
+compression = None  # codec for the shared client: None, 'zlib' or 'lzma'
+socket_buffer = SOCKET_BUFFER_SIZE  # SO_SNDBUF/SO_RCVBUF for new connections; None keeps kernel autotuning
+DEFAULT_POOL_SIZE = 64
+MGET_BATCH_SIZE = 500  # file names per MGET request (they travel in the JSON header)
+MUPLOAD_BATCH_BYTES = 64 * 1024 * 1024  # MUPLOAD bodies are built in memory; larger files go alone
+MUPLOAD_BATCH_SIZE = 1000
+BUSY_RETRIES = 6  # times a request refused with BUSY is retried, with exponential backoff
+DELTA_MAX_LITERAL_RATIO = 0.5  # give up on a delta (and upload everything) past this share of new bytes
+
+def send_all(sock, *buffers):
+    """Send the buffers back to back, in one scatter-gather write where possible"""
+    try:
+        send_buffers(sock, buffers)
+    except Exception as e:
+        logging.error(f"Error sending data: {e}")
+        return False
+    return True
+
+def receive_all(sock, size):
+    """Receive exactly 'size' bytes from socket; fewer if it closed or failed"""
+    try:
+        return recv_exact(sock, size)
+    except Exception as e:
+        logging.error(f"Error receiving data: {e}")
+        return b""
+
+def receive_to_file(sock, size, fp):
+    """Receive exactly 'size' bytes from socket straight into an open file"""
+    buf = bytearray(min(size, CHUNK_SIZE))
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        try:
+            n = sock.recv_into(view, min(size - received, len(buf)))
+            if not n:
+                break
+            fp.write(view[:n])
+            received += n
+        except Exception as e:
+            logging.error(f"Error receiving data: {e}")
+            break
+    return received
+
+def read_region(fd, offset, length, fp):
+    """Copy length bytes at offset of a file the server passed us into an open file; returns bytes copied"""
+    buf = bytearray(min(length, CHUNK_SIZE))
+    view = memoryview(buf)
+    copied = 0
+    while copied < length:
+        n = os.preadv(fd, [view[:min(length - copied, len(buf))]], offset + copied)
+        if not n:
+            break  # the file was truncated under us
+        fp.write(view[:n])
+        copied += n
+    return copied
+
+def busy_delay(hasil, attempt):
+    """Wait before retrying a BUSY request: the server's retry_after, doubled per attempt, with jitter"""
+    delay = min(float(hasil.get('retry_after', 0.5)) * 2 ** attempt, 10.0)
+    return delay * random.uniform(0.5, 1.0)
+
+def busy_backoff(hasil, attempt):
+    time.sleep(busy_delay(hasil, attempt))
+
+def send_command(command_str="", timeout=300):
+    """Legacy request; retried with backoff while the server answers BUSY"""
+    for attempt in range(BUSY_RETRIES + 1):
+        hasil = send_command_once(command_str, timeout)
+        if hasil.get('status') != 'BUSY' or attempt == BUSY_RETRIES:
+            return hasil
+        logging.warning(f"Server busy, retrying: {hasil.get('data')}")
+        busy_backoff(hasil, attempt)
+
+def send_command_once(command_str="", timeout=300):
+    sock = socket.socket(socket.AF_UNIX if isinstance(server_address, str) else socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    
+    try:
+        logging.warning(f"Connecting to server...")
+        tune_socket(sock, socket_buffer)
+        sock.connect(server_address)
+        
+        command_data = command_str.encode('utf-8')
+        command_length = len(command_data)
+        
+        logging.warning(f"Sending command length: {command_length}")
+        
+        # Command length (4 bytes) and command data in one write
+        sent = send_all(sock, struct.pack('!I', command_length), command_data)
+        
+        # Receive response length; a refused (BUSY) command is answered without being read
+        length_data = receive_all(sock, 4)
+        if len(length_data) != 4:
+            if not sent:
+                return {"status": "ERROR", "data": "Failed to send command"}
+            return {"status": "ERROR", "data": "Failed to receive response length"}
+        
+        response_length = struct.unpack('!I', length_data)[0]
+        logging.warning(f"Expecting response length: {response_length}")
+        
+        # Receive response data
+        response_data = receive_all(sock, response_length)
+        if len(response_data) != response_length:
+            return {"status": "ERROR", "data": "Failed to receive complete response"}
+        
+        response_str = response_data.decode('utf-8')
+        logging.warning(f"Received response: {response_str[:100]}...")
+        
+        return json.loads(response_str)
+    
+    except json.JSONDecodeError as e:
+        logging.error(f"JSON decode error: {e}")
+        return {"status": "ERROR", "data": "Invalid JSON response"}
+    except socket.timeout:
+        logging.error("Socket timeout")
+        return {"status": "ERROR", "data": "Connection timeout"}
+    except Exception as e:
+        logging.error(f"Error during data transfer: {e}")
+        return {"status": "ERROR", "data": str(e)}
+    finally:
+        try:
+            sock.close()
+        except:
+            pass
+
+class PositionalWriter:
+    """File-like sink that writes at its own offset of a shared fd with os.pwrite"""
+    def __init__(self, fd, offset):
+        self.fd = fd
+        self.position = offset
+    
+    def write(self, data):
+        n = os.pwrite(self.fd, data, self.position)
+        self.position += n
+        return n
+
+class StaleConnectionError(ConnectionError):
+    """A pooled connection turned out to be closed before the server answered"""
+
+class TransferInterrupted(ConnectionError):
+    """The server answered, but its response body did not arrive in full"""
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+def interrupted_response(e):
+    """Error result for a TransferInterrupted: total and mtime say which copy of a file the bytes that did arrive are of"""
+    hasil = {"status": "ERROR", "data": str(e)}
+    hasil.update((key, e.response[key]) for key in ('total', 'mtime') if key in e.response)
+    return hasil
+
+class ConnectionPool:
+    """Bounded pool of persistent connections to one server address"""
+    def __init__(self, address, max_size=DEFAULT_POOL_SIZE):
+        self.address = address
+        self.max_size = max_size
+        self.idle = []
+        self.size = 0  # open connections, idle or in use
+        self.cond = threading.Condition()
+        self.pid = os.getpid()
+    
+    def _check_fork(self):
+        # Sockets inherited from a parent process must not be shared with it
+        if self.pid != os.getpid():
+            for sock in self.idle:
+                sock.close()
+            self.idle = []
+            self.size = 0
+            self.pid = os.getpid()
+    
+    def acquire(self, timeout):
+        """Returns (socket, reused); blocks while max_size connections are in use"""
+        with self.cond:
+            self._check_fork()
+            while not self.idle and self.size >= self.max_size:
+                self.cond.wait()
+            if self.idle:
+                sock = self.idle.pop()
+                sock.settimeout(timeout)
+                return sock, True
+            self.size += 1
+        
+        try:
+            logging.debug("Connecting to server...")
+            sock = connect(self.address, timeout)
+            tune_socket(sock, socket_buffer)
+            return sock, False
+        except:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+    
+    def release(self, sock, reusable=True):
+        with self.cond:
+            if reusable and self.pid == os.getpid():
+                self.idle.append(sock)
+            else:
+                try:
+                    sock.close()
+                except:
+                    pass
+                if self.pid == os.getpid():
+                    self.size -= 1
+            self.cond.notify()
+    
+    def close(self):
+        with self.cond:
+            for sock in self.idle:
+                sock.close()
+            self.size -= len(self.idle)
+            self.idle = []
+
+class FileClient:
+    """Protocol v2 client that reuses up to pool_size persistent connections.
+    
+    With compression set to a codec name ('zlib' or 'lzma') downloads ask for
+    compressed chunks and uploads send them, if the server supports the codec.
+    With address set to the path of the server's unix socket and pass_fd on,
+    large downloads are read from a file descriptor the server passes instead
+    of being copied through the socket.
+    """
+    def __init__(self, address=None, pool_size=DEFAULT_POOL_SIZE, timeout=300, compression=None, pass_fd=True):
+        self.address = address or server_address
+        self.timeout = timeout
+        self.compression = compression
+        self.pass_fd = pass_fd and isinstance(self.address, str)
+        self.server_info = None
+        self.digests = {}  # (path, inode, mtime, size) -> SHA-256, for dedup checks
+        self.pool = ConnectionPool(self.address, pool_size)
+    
+    def close(self):
+        self.pool.close()
+    
+    def request(self, header, body=b'', timeout=None, sink=None):
+        """Send a protocol v2 request (JSON header + raw body); returns (response header, raw body).
+        
+        body may be bytes or an open binary file, which is sent from its current
+        position to EOF with sendfile. If sink (an open binary file) is given, the
+        response body is streamed into it instead of being returned.
+        """
+        timeout = timeout or self.timeout
+        body_start = body.tell() if hasattr(body, 'fileno') else 0
+        busy_attempts = 0
+        
+        # Every stale pooled connection is discarded and retried; a fresh one is not
+        while True:
+            reusable = False
+            try:
+                sock, reused = self.pool.acquire(timeout)
+            except Exception as e:
+                logging.error(f"Error connecting to server: {e}")
+                # A connect timeout may just be a busy server; anything else means nobody is listening
+                return {"status": "ERROR", "data": str(e), "unreachable": not isinstance(e, socket.timeout)}, b""
+            
+            try:
+                response, payload = self._exchange(sock, header, body, sink)
+                # A server that refused a request without reading its body closes the connection
+                reusable = not response.get('close')
+                if response.get('status') == 'BUSY' and busy_attempts < BUSY_RETRIES:
+                    # Refused under load before any work was done: back off and send it again
+                    logging.warning(f"Server busy, retrying {header.get('command')}")
+                    self.pool.release(sock, reusable)
+                    sock = None
+                    busy_backoff(response, busy_attempts)
+                    busy_attempts += 1
+                    if hasattr(body, 'fileno'):
+                        body.seek(body_start)
+                    continue
+                return response, payload
+            except StaleConnectionError as e:
+                if reused:
+                    # The server dropped this idle connection; retry on a fresh one
+                    logging.warning(f"Pooled connection was closed, retrying: {e}")
+                    if hasattr(body, 'fileno'):
+                        body.seek(body_start)
+                    continue
+                logging.error(f"Error during data transfer: {e}")
+                return {"status": "ERROR", "data": str(e)}, b""
+            except TransferInterrupted as e:
+                logging.error(f"Error during data transfer: {e}")
+                return interrupted_response(e), b""
+            except json.JSONDecodeError as e:
+                logging.error(f"JSON decode error: {e}")
+                return {"status": "ERROR", "data": "Invalid JSON response"}, b""
+            except socket.timeout:
+                logging.error("Socket timeout")
+                return {"status": "ERROR", "data": "Connection timeout"}, b""
+            except Exception as e:
+                logging.error(f"Error during data transfer: {e}")
+                return {"status": "ERROR", "data": str(e)}, b""
+            finally:
+                if sock is not None:
+                    self.pool.release(sock, reusable)
+    
+    def _exchange(self, sock, header, body, sink):
+        is_file = hasattr(body, 'fileno')
+        body_size = os.fstat(body.fileno()).st_size - body.tell() if is_file else len(body)
+        if not header.get('chunked'):
+            header = dict(header, size=body_size)
+        logging.debug("Sending binary request: %s, body: %d bytes", header.get('command'), body_size)
+        
+        send_error = None
+        try:
+            if header.get('chunked'):
+                send_buffers(sock, (PROTOCOL_V2_MAGIC, pack_header(header)))
+                self._send_chunked(sock, body, header.get('encoding'))
+            elif is_file:
+                send_buffers(sock, (PROTOCOL_V2_MAGIC, pack_header(header)))
+                if body_size and sock.sendfile(body, body.tell(), body_size) != body_size:
+                    raise ConnectionError("Failed to send request body")
+            else:
+                # Magic, header and body in one scatter-gather write
+                send_buffers(sock, (PROTOCOL_V2_MAGIC, pack_header(header), body))
+        except (BrokenPipeError, ConnectionResetError) as e:
+            # The server may have refused the request (BUSY) and closed without reading the body: look for its answer
+            send_error = e
+        try:
+            # Receive response header (with the file descriptor, if the server passes one)
+            if header.get('pass_fd'):
+                length_data, fds = recv_with_fds(sock, 4)
+            else:
+                length_data, fds = receive_all(sock, 4), []
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise StaleConnectionError(str(send_error or e))
+        if send_error is not None and len(length_data) != 4:
+            raise StaleConnectionError(str(send_error))
+        try:
+            if not length_data:
+                raise StaleConnectionError("Connection closed by server")
+            if len(length_data) != 4:
+                raise ConnectionError("Failed to receive response header length")
+            
+            header_length = struct.unpack('!I', length_data)[0]
+            header_data = receive_all(sock, header_length)
+            if len(header_data) != header_length:
+                raise ConnectionError("Failed to receive response header")
+            
+            response = unpack_header(header_data)
+            try:
+                return response, self._receive_body(sock, response, fds, sink)
+            except Exception as e:
+                raise TransferInterrupted(str(e), response) from e
+        finally:
+            for fd in fds:
+                os.close(fd)
+    
+    def _receive_body(self, sock, response, fds, sink):
+        if response.get('fd'):
+            return self._receive_fd(fds, response, sink)
+        if response.get('chunked'):
+            return self._receive_chunked(sock, response, sink)
+        if response.get('batch'):
+            return self._receive_batch(sock, sink)
+        
+        # Receive raw response body
+        body_size = response.get('size', 0)
+        if sink is not None and response.get('status') == 'OK':
+            payload = b""
+            received = receive_to_file(sock, body_size, sink)
+        else:
+            payload = receive_all(sock, body_size)
+            received = len(payload)
+        if received != body_size:
+            raise ConnectionError("Failed to receive complete response")
+        
+        logging.debug("Received binary response: %s, body: %d bytes", response.get('status'), body_size)
+        return payload
+    
+    def _receive_fd(self, fds, response, sink):
+        """Read a response body from the file the server passed, into sink or as bytes"""
+        if not fds:
+            raise ConnectionError("Server did not pass the file descriptor")
+        length = response['length']
+        if sink is not None:
+            payload = b""
+            received = read_region(fds[0], response.get('offset', 0), length, sink)
+        else:
+            payload = os.pread(fds[0], length, response.get('offset', 0))
+            received = len(payload)
+        if received != length:
+            raise ConnectionError("Failed to read complete response from the passed file")
+        logging.debug("Received binary response: %s, body: %d bytes (passed file)", response.get('status'), length)
+        return payload
+    
+    def _send_chunked(self, sock, body, codec):
+        """Send body (bytes or a file from its current position) as chunked frames"""
+        encoder = ChunkEncoder(codec)
+        if hasattr(body, 'fileno'):
+            while chunk := body.read(CHUNK_SIZE):
+                sock.sendall(encoder.encode(chunk))
+        else:
+            view = memoryview(body)
+            for start in range(0, len(view), CHUNK_SIZE):
+                sock.sendall(encoder.encode(view[start:start + CHUNK_SIZE]))
+        sock.sendall(END_CHUNK)
+    
+    def _receive_chunked(self, sock, response, sink):
+        """Decode a chunked response body into sink, or return it as bytes"""
+        reader = ChunkedReader(BodyReader(sock, None), response.get('encoding'))
+        out = bytearray()
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        received = 0
+        while n := reader.readinto(view):
+            if sink is not None:
+                sink.write(view[:n])
+            else:
+                out += view[:n]
+            received += n
+        logging.debug("Received binary response: %s, body: %d bytes (%s)", response.get('status'), received,
+                      response.get('encoding'))
+        return bytes(out)
+    
+    def hello(self):
+        """The server's HELLO answer (codecs, dedup), asked once; {} for servers without HELLO"""
+        if self.server_info is None:
+            hasil, _ = self.request(dict(command='HELLO'), timeout=30)
+            if hasil.get('status') == 'OK':
+                self.server_info = hasil
+            elif 'size' in hasil:
+                self.server_info = {}  # an older server without HELLO
+            else:
+                return {}  # could not reach the server; ask again next time
+        return self.server_info
+    
+    def _receive_batch(self, sock, directory):
+        """Store the files of an MGET response in directory; returns the per-file entries"""
+        reader = BodyReader(sock, None)
+        entries = []
+        while True:
+            length = struct.unpack('!I', read_exact(reader, 4))[0]
+            if not length:
+                break
+            entry = unpack_header(read_exact(reader, length))
+            if entry['status'] == 'OK':
+                # Written under a temp name and renamed, so a broken batch leaves no torn files
+                filepath = os.path.join(directory, os.path.basename(entry['name']))
+                with open(filepath + '.part', 'wb') as fp:
+                    received = receive_to_file(sock, entry['size'], fp)
+                if received != entry['size']:
+                    raise ConnectionError(f"Failed to receive {entry['name']}")
+                os.replace(filepath + '.part', filepath)
+            entries.append(entry)
+        logging.debug("Received batch of %d files", len(entries))
+        return entries
+    
+    def supports_compression(self):
+        """Whether the server accepts our compression codec"""
+        return bool(self.compression) and self.compression in self.hello().get('codecs', [])
+    
+    def local_sha256(self, filepath):
+        """SHA-256 of a local file, remembered while the file is unchanged"""
+        st = os.stat(filepath)
+        key = (os.path.abspath(filepath), st.st_ino, st.st_mtime_ns, st.st_size)
+        if key not in self.digests:
+            self.digests[key] = file_sha256(filepath)
+        return self.digests[key]
+    
+    def list(self, prefix='', after=None, limit=None, detail=False, timeout=30):
+        """One page of the server's file list; pass hasil['next'] as after= for the next page"""
+        header = dict(command='LIST', prefix=prefix, detail=detail)
+        if after is not None:
+            header['after'] = after
+        if limit is not None:
+            header['limit'] = limit
+        hasil, _ = self.request(header, timeout=timeout)
+        return hasil
+    
+    def stats(self, timeout=30):
+        """Server metrics: per-command counts, bytes and latency percentiles, connections, cache"""
+        hasil, _ = self.request(dict(command='STATS'), timeout=timeout)
+        return hasil
+    
+    def stat(self, filename, checksum=False, timeout=30):
+        hasil, _ = self.request(dict(command='STAT', params=[filename], checksum=checksum), timeout=timeout)
+        return hasil
+    
+    def get(self, filename, fp, offset=0, length=None, timeout=None):
+        """Download filename (or length bytes of it from offset) into the open binary file fp"""
+        header = dict(command='GET', params=[filename], offset=offset)
+        if length is not None:
+            header['length'] = length
+        if self.compression:
+            # Servers that do not know the codec (or the field) just send raw bytes
+            header['accept_encoding'] = [self.compression]
+        if self.pass_fd:
+            # Over the unix socket a large file comes back as an open descriptor, not bytes
+            header['pass_fd'] = True
+        hasil, _ = self.request(header, timeout=timeout, sink=fp)
+        return hasil
+    
+    def upload(self, filename, fp, offset=0, total=None, timeout=None):
+        """Upload the rest of the open binary file fp as filename.
+        
+        With total set the upload is resumable and the bytes are stored at offset
+        of the server's partial copy; see FileInterface.upload_stream.
+        """
+        header = dict(command='UPLOAD', params=[filename])
+        if total is not None:
+            header.update(offset=offset, total=total)
+        if self.supports_compression():
+            header.update(chunked=True, encoding=self.compression)
+        hasil, _ = self.request(header, fp, timeout=timeout)
+        return hasil
+    
+    def mget(self, filenames, directory, timeout=None):
+        """Download many files into directory with one request per MGET_BATCH_SIZE names.
+        
+        Returns dict(status, results) with one entry (name, status, size or
+        data) per file; status is OK only if every file arrived.
+        """
+        os.makedirs(directory, exist_ok=True)
+        results = []
+        for start in range(0, len(filenames), MGET_BATCH_SIZE):
+            batch = list(filenames[start:start + MGET_BATCH_SIZE])
+            hasil, entries = self.request(dict(command='MGET', params=batch), timeout=timeout, sink=directory)
+            if hasil.get('status') != 'OK':
+                results.extend(dict(name=name, status='ERROR', data=hasil.get('data')) for name in batch)
+            else:
+                results.extend(entries)
+        failed = sum(1 for r in results if r['status'] != 'OK')
+        return dict(status='OK' if not failed else 'ERROR', results=results, failed=failed)
+    
+    def mupload(self, filepaths, filenames=None, timeout=None):
+        """Upload many local files, packed MUPLOAD_BATCH_BYTES at a time into single requests.
+        
+        filenames are the names to store them under (default: the basenames).
+        Files larger than a batch are sent on their own with upload_file.
+        """
+        filenames = filenames or [os.path.basename(path) for path in filepaths]
+        results = []
+        body = bytearray()
+        batch = []
+        
+        def flush():
+            body.extend(END_ENTRY)
+            hasil, payload = self.request(dict(command='MUPLOAD'), body, timeout=timeout)
+            if hasil.get('status') == 'OK':
+                results.extend(json.loads(payload))
+            else:
+                results.extend(dict(name=name, status='ERROR', data=hasil.get('data')) for name in batch)
+            body.clear()
+            batch.clear()
+        
+        for filepath, filename in zip(filepaths, filenames):
+            size = os.path.getsize(filepath)
+            if size > MUPLOAD_BATCH_BYTES:
+                hasil = self.upload_file(filename, filepath, timeout=timeout)
+                results.append(dict(name=filename, status=hasil.get('status'), data=hasil.get('data')))
+                continue
+            if batch and (len(body) + size > MUPLOAD_BATCH_BYTES or len(batch) >= MUPLOAD_BATCH_SIZE):
+                flush()
+            with open(filepath, 'rb') as fp:
+                content = fp.read()
+            body += pack_header(dict(name=filename, size=len(content)))
+            body += content
+            batch.append(filename)
+        if batch:
+            flush()
+        failed = sum(1 for r in results if r['status'] != 'OK')
+        return dict(status='OK' if not failed else 'ERROR', results=results, failed=failed)
+    
+    def download(self, filename, filepath, retries=3, timeout=None):
+        """Download filename to filepath, resuming from filepath + '.part' after a failure.
+        
+        A resumed attempt only keeps the partial bytes if the server still has
+        the same copy (total and mtime) they were read from; a .part file left
+        by an earlier call is never trusted and is overwritten.
+        """
+        partpath = filepath + '.part'
+        version = None  # (total, mtime) of the server copy the partial file holds the start of
+        for attempt in range(retries + 1):
+            with open(partpath, 'ab' if version else 'wb') as fp:
+                offset = fp.tell()
+                hasil = self.get(filename, fp, offset, timeout=timeout)
+            
+            if 'mtime' in hasil:
+                served = (hasil['total'], hasil['mtime'])
+                if offset and served != version:
+                    # The file was replaced on the server: the bytes cannot be combined
+                    logging.warning(f"{filename} changed on the server during the download, restarting")
+                    version = None
+                    hasil = dict(status='ERROR', data=f"File {filename} changed during download")
+                    continue
+                version = served
+            if hasil.get('status') == 'OK':
+                os.replace(partpath, filepath)
+                return hasil
+            if 'size' in hasil or attempt == retries:
+                # The server itself answered with an error (e.g. no such file; v2 responses
+                # always carry size): retrying will not help
+                break
+            logging.warning(f"Download of {filename} interrupted at {os.path.getsize(partpath)} bytes, resuming")
+            time.sleep(min(0.5 * 2 ** attempt, 5))
+        os.remove(partpath)
+        return hasil
+    
+    def download_segmented(self, filename, filepath, segments=4, retries=3, verify=True, timeout=None):
+        """Download filename as `segments` byte ranges fetched in parallel over separate connections.
+        
+        Each range is written straight to its place in a preallocated file with
+        os.pwrite and resumes from where it stopped if its connection fails.
+        With verify=True the result is checked against the server's SHA-256.
+        """
+        st = self.stat(filename, checksum=verify)
+        if st.get('status') != 'OK':
+            return st
+        if not st['exists']:
+            return dict(status='ERROR', data=f"File {filename} does not exist")
+        
+        total = st['filesize']
+        segment_size = -(-total // max(segments, 1)) or 1
+        ranges = [(start, min(segment_size, total - start)) for start in range(0, total, segment_size)]
+        partpath = filepath + '.part'
+        
+        def fetch(start, length):
+            position = start
+            for attempt in range(retries + 1):
+                sink = PositionalWriter(fd, position)
+                hasil = self.get(filename, sink, position, start + length - position, timeout=timeout)
+                position = sink.position
+                if hasil.get('mtime', st['mtime']) != st['mtime']:
+                    return dict(status='ERROR', data=f"File {filename} changed during download")
+                if hasil.get('status') == 'OK' or 'size' in hasil or attempt == retries:
+                    return hasil
+                logging.warning(f"Segment {start}+{length} of {filename} interrupted at {position}, resuming")
+                time.sleep(min(0.5 * 2 ** attempt, 5))
+        
+        fd = os.open(partpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, total)
+            with ThreadPoolExecutor(max_workers=max(len(ranges), 1)) as executor:
+                results = list(executor.map(lambda r: fetch(*r), ranges))
+        finally:
+            os.close(fd)
+        
+        for hasil in results:
+            if hasil.get('status') != 'OK':
+                os.remove(partpath)
+                return hasil
+        
+        if verify and file_sha256(partpath) != st['sha256']:
+            os.remove(partpath)
+            return dict(status='ERROR', data=f"Checksum mismatch for {filename}")
+        
+        os.replace(partpath, filepath)
+        return dict(status='OK', data_namafile=filename, total=total, segments=len(ranges))
+    
+    def upload_file(self, filename, filepath, retries=3, resume=False, timeout=None):
+        """Upload filepath as filename, resuming from the server's partial copy after a failure.
+        
+        With resume=True a partial copy left by an earlier call is continued too.
+        If the server deduplicates and already holds the content, nothing is sent.
+        """
+        total = os.path.getsize(filepath)
+        if self.hello().get('dedup'):
+            hasil, _ = self.request(dict(command='HAVE', params=[filename], sha256=self.local_sha256(filepath)),
+                                    timeout=timeout)
+            if hasil.get('have'):
+                return hasil
+        for attempt in range(retries + 1):
+            offset = 0
+            if resume or attempt:
+                st = self.stat(filename)
+                if st.get('status') == 'OK' and st['partial_size'] <= total:
+                    offset = st['partial_size']
+            
+            with open(filepath, 'rb') as fp:
+                fp.seek(offset)
+                hasil = self.upload(filename, fp, offset, total, timeout=timeout)
+            if hasil.get('status') == 'OK':
+                return hasil
+            
+            logging.warning(f"Upload of {filename} failed at offset {offset}: {hasil.get('data')}")
+            if attempt < retries:
+                time.sleep(min(0.5 * 2 ** attempt, 5))
+        return hasil
+    
+    def sync_file(self, filename, filepath, timeout=None):
+        """Upload filepath as filename sending only what differs from the server's copy (rsync style).
+        
+        The server's block signatures are matched against every offset of the
+        local file with a rolling checksum; matching blocks are sent as copy
+        instructions, everything else as literal data. Falls back to
+        upload_file when there is no server copy or the files differ too much.
+        """
+        sig, body = self.request(dict(command='SIGNATURES', params=[filename]), timeout=timeout)
+        if sig.get('status') != 'OK' or not os.path.getsize(filepath):
+            return self.upload_file(filename, filepath, timeout=timeout)
+        
+        total = os.path.getsize(filepath)
+        with open(filepath, 'rb') as fp, tempfile.TemporaryFile() as delta:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                literal = make_delta(data, body, sig['block_size'], sig['filesize'], delta)
+            if literal is None:
+                logging.warning(f"{filename} differs too much from the server copy, uploading all of it")
+                return self.upload_file(filename, filepath, timeout=timeout)
+            
+            delta.seek(0)
+            header = dict(command='DELTA', params=[filename], version=sig['version'],
+                          block_size=sig['block_size'], total=total)
+            if self.supports_compression():
+                header.update(chunked=True, encoding=self.compression)
+            logging.warning(f"Syncing {filename}: {literal} of {total} bytes changed")
+            hasil, _ = self.request(header, delta, timeout=timeout)
+        
+        if hasil.get('status') != 'OK' and 'size' in hasil:
+            # Typically the server copy changed after the signatures were taken
+            logging.warning(f"Delta upload of {filename} rejected ({hasil.get('data')}), uploading all of it")
+            return self.upload_file(filename, filepath, timeout=timeout)
+        return hasil
+
+def make_delta(data, signatures, block_size, base_size, out):
+    """Write the delta instructions that turn the server copy into data (a bytes-like) to out.
+    
+    signatures is the SIGNATURES body for a base_size byte file. Returns the
+    number of literal bytes, or None once more than DELTA_MAX_LITERAL_RATIO of
+    the scanned data turned out to be new (a plain upload is cheaper then).
+    """
+    blocks = {}
+    strong_by_index = []
+    for index, (weak, strong) in enumerate(DELTA_SIGNATURE.iter_unpack(signatures)):
+        blocks.setdefault(weak, {}).setdefault(strong, index)
+        strong_by_index.append(strong)
+    
+    n = len(data)
+    literal = 0
+    literal_start = 0
+    copy = None  # pending [index, count], merged while matches are consecutive
+    
+    def flush_literal(end):
+        nonlocal literal, copy
+        if end > literal_start:
+            if copy:
+                out.write(DELTA_COPY.pack(DELTA_OP_COPY, *copy))
+                copy = None
+            out.write(DELTA_DATA.pack(DELTA_OP_DATA, end - literal_start))
+            out.write(data[literal_start:end])
+            literal += end - literal_start
+    
+    def add_copy(index):
+        nonlocal copy
+        if copy and copy[0] + copy[1] == index:
+            copy[1] += 1
+            return
+        if copy:
+            out.write(DELTA_COPY.pack(DELTA_OP_COPY, *copy))
+        copy = [index, 1]
+    
+    pos = 0
+    a = b = None
+    while pos + block_size <= n:
+        if a is None:
+            a, b = weak_checksum(data[pos:pos + block_size])
+        candidates = blocks.get(a | b << 16)
+        if candidates:
+            index = candidates.get(strong_checksum(data[pos:pos + block_size]))
+            if index is not None:
+                flush_literal(pos)
+                add_copy(index)
+                pos += block_size
+                literal_start = pos
+                a = None
+                continue
+        if pos - literal_start >= block_size:
+            # A whole block of new data: check whether a delta is still worth it
+            if pos > 16 * block_size and literal + pos - literal_start > DELTA_MAX_LITERAL_RATIO * pos:
+                return None
+        if pos + block_size < n:
+            old, new = data[pos], data[pos + block_size]
+            a = (a - old + new) & 0xffff
+            b = (b - block_size * old + a) & 0xffff
+        pos += 1
+    
+    # The server's last block is usually shorter than block_size; try it at the very end
+    tail = base_size % block_size
+    if tail and n - literal_start >= tail and strong_checksum(data[n - tail:n]) == strong_by_index[-1]:
+        flush_literal(n - tail)
+        add_copy(len(strong_by_index) - 1)
+        literal_start = n
+    flush_literal(n)
+    if copy:
+        out.write(DELTA_COPY.pack(DELTA_OP_COPY, *copy))
+    return literal
+
+class AsyncConnectionPool:
+    """ConnectionPool for AsyncFileClient: (reader, writer) pairs of one event loop"""
+    def __init__(self, address, max_size=DEFAULT_POOL_SIZE):
+        self.address = address
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_size)
+    
+    async def acquire(self, timeout):
+        """Returns ((reader, writer), reused); waits while max_size connections are in use"""
+        await self.slots.acquire()
+        if self.idle:
+            return self.idle.pop(), True
+        try:
+            logging.debug("Connecting to server...")
+            if isinstance(self.address, str):
+                connecting = asyncio.open_unix_connection(self.address, limit=CHUNK_SIZE)
+            else:
+                connecting = asyncio.open_connection(*self.address, limit=CHUNK_SIZE)
+            reader, writer = await asyncio.wait_for(connecting, timeout)
+            tune_socket(writer.get_extra_info('socket'), socket_buffer)
+            return (reader, writer), False
+        except BaseException:
+            self.slots.release()
+            raise
+    
+    def release(self, conn, reusable=True):
+        if reusable:
+            self.idle.append(conn)
+        else:
+            conn[1].close()
+        self.slots.release()
+    
+    async def close(self):
+        idle, self.idle = self.idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+class AsyncFileClient:
+    """asyncio version of FileClient's plain transfers, for driving many of them from one process.
+    
+    list/stat/stats/get/upload and the resuming download/upload_file helpers
+    behave like FileClient's; bodies stream between disk and socket in
+    CHUNK_SIZE pieces (uploads with loop.sendfile). Compression, MGET and
+    the dedup pre-check are left to FileClient. Use an instance from one
+    event loop only.
+    """
+    def __init__(self, address=None, pool_size=DEFAULT_POOL_SIZE, timeout=300):
+        self.address = address or server_address
+        self.timeout = timeout
+        self.pool = AsyncConnectionPool(self.address, pool_size)
+    
+    async def close(self):
+        await self.pool.close()
+    
+    async def request(self, header, body=b'', timeout=None, sink=None):
+        """Send a protocol v2 request; returns (response header, raw body). See FileClient.request"""
+        timeout = timeout or self.timeout
+        body_start = body.tell() if hasattr(body, 'fileno') else 0
+        busy_attempts = 0
+        
+        while True:
+            try:
+                conn, reused = await self.pool.acquire(timeout)
+            except Exception as e:
+                logging.error(f"Error connecting to server: {e}")
+                return {"status": "ERROR", "data": str(e) or "Connection timeout",
+                        "unreachable": not isinstance(e, asyncio.TimeoutError)}, b""
+            
+            reusable = False
+            try:
+                response, payload = await self._exchange(conn, header, body, sink, timeout)
+                reusable = not response.get('close')
+                if response.get('status') == 'BUSY' and busy_attempts < BUSY_RETRIES:
+                    logging.warning(f"Server busy, retrying {header.get('command')}")
+                    self.pool.release(conn, reusable)
+                    conn = None
+                    await asyncio.sleep(busy_delay(response, busy_attempts))
+                    busy_attempts += 1
+                    if hasattr(body, 'fileno'):
+                        body.seek(body_start)
+                    continue
+                return response, payload
+            except StaleConnectionError as e:
+                if reused:
+                    logging.warning(f"Pooled connection was closed, retrying: {e}")
+                    if hasattr(body, 'fileno'):
+                        body.seek(body_start)
+                    continue
+                logging.error(f"Error during data transfer: {e}")
+                return {"status": "ERROR", "data": str(e)}, b""
+            except TransferInterrupted as e:
+                logging.error(f"Error during data transfer: {e}")
+                return interrupted_response(e), b""
+            except json.JSONDecodeError as e:
+                logging.error(f"JSON decode error: {e}")
+                return {"status": "ERROR", "data": "Invalid JSON response"}, b""
+            except asyncio.TimeoutError:
+                logging.error("Socket timeout")
+                return {"status": "ERROR", "data": "Connection timeout"}, b""
+            except Exception as e:
+                logging.error(f"Error during data transfer: {e}")
+                return {"status": "ERROR", "data": str(e)}, b""
+            finally:
+                if conn is not None:
+                    self.pool.release(conn, reusable)
+    
+    async def _exchange(self, conn, header, body, sink, timeout):
+        reader, writer = conn
+        is_file = hasattr(body, 'fileno')
+        body_size = os.fstat(body.fileno()).st_size - body.tell() if is_file else len(body)
+        header = dict(header, size=body_size)
+        logging.debug("Sending binary request: %s, body: %d bytes", header.get('command'), body_size)
+        
+        send_error = None
+        try:
+            writer.write(PROTOCOL_V2_MAGIC + pack_header(header))
+            if is_file:
+                if body_size:
+                    await asyncio.get_running_loop().sendfile(writer.transport, body, body.tell(), body_size)
+            elif body_size:
+                writer.write(body)
+            await asyncio.wait_for(writer.drain(), timeout)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            send_error = e  # perhaps refused (BUSY) without the body being read; see FileClient._exchange
+        try:
+            length_data = await asyncio.wait_for(reader.readexactly(4), timeout)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise StaleConnectionError(str(send_error or e))
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                raise StaleConnectionError(str(send_error or "Connection closed by server"))
+            raise ConnectionError("Failed to receive response header length")
+        
+        header_length = struct.unpack('!I', length_data)[0]
+        response = unpack_header(await asyncio.wait_for(reader.readexactly(header_length), timeout))
+        if response.get('chunked') or response.get('batch'):
+            # Never asked for: this client sends no accept_encoding and no MGET
+            raise ConnectionError("Unexpected chunked response")
+        
+        body_size = response.get('size', 0)
+        try:
+            if sink is None or response.get('status') != 'OK':
+                payload = await asyncio.wait_for(reader.readexactly(body_size), timeout)
+            else:
+                payload = b""
+                remaining = body_size
+                while remaining:
+                    data = await asyncio.wait_for(reader.read(min(remaining, CHUNK_SIZE)), timeout)
+                    if not data:
+                        raise ConnectionError("Failed to receive complete response")
+                    # Small writes into the page cache; not worth a round trip to an executor
+                    sink.write(data)
+                    remaining -= len(data)
+        except Exception as e:
+            raise TransferInterrupted(str(e) or "Connection timeout", response) from e
+        
+        logging.debug("Received binary response: %s, body: %d bytes", response.get('status'), body_size)
+        return response, payload
+    
+    async def list(self, prefix='', after=None, limit=None, detail=False, timeout=30):
+        header = dict(command='LIST', prefix=prefix, detail=detail)
+        if after is not None:
+            header['after'] = after
+        if limit is not None:
+            header['limit'] = limit
+        hasil, _ = await self.request(header, timeout=timeout)
+        return hasil
+    
+    async def stats(self, timeout=30):
+        hasil, _ = await self.request(dict(command='STATS'), timeout=timeout)
+        return hasil
+    
+    async def stat(self, filename, checksum=False, timeout=30):
+        hasil, _ = await self.request(dict(command='STAT', params=[filename], checksum=checksum), timeout=timeout)
+        return hasil
+    
+    async def get(self, filename, fp, offset=0, length=None, timeout=None):
+        header = dict(command='GET', params=[filename], offset=offset)
+        if length is not None:
+            header['length'] = length
+        hasil, _ = await self.request(header, timeout=timeout, sink=fp)
+        return hasil
+    
+    async def upload(self, filename, fp, offset=0, total=None, timeout=None):
+        header = dict(command='UPLOAD', params=[filename])
+        if total is not None:
+            header.update(offset=offset, total=total)
+        hasil, _ = await self.request(header, fp, timeout=timeout)
+        return hasil
+    
+    async def download(self, filename, filepath, retries=3, timeout=None):
+        """Download filename to filepath, resuming from filepath + '.part' after a failure. See FileClient.download"""
+        partpath = filepath + '.part'
+        version = None
+        for attempt in range(retries + 1):
+            with open(partpath, 'ab' if version else 'wb') as fp:
+                offset = fp.tell()
+                hasil = await self.get(filename, fp, offset, timeout=timeout)
+            
+            if 'mtime' in hasil:
+                served = (hasil['total'], hasil['mtime'])
+                if offset and served != version:
+                    logging.warning(f"{filename} changed on the server during the download, restarting")
+                    version = None
+                    hasil = dict(status='ERROR', data=f"File {filename} changed during download")
+                    continue
+                version = served
+            if hasil.get('status') == 'OK':
+                os.replace(partpath, filepath)
+                return hasil
+            if 'size' in hasil or attempt == retries:
+                break
+            logging.warning(f"Download of {filename} interrupted at {os.path.getsize(partpath)} bytes, resuming")
+            await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+        os.remove(partpath)
+        return hasil
+    
+    async def download_segmented(self, filename, filepath, segments=4, retries=3, timeout=None):
+        """Download filename as `segments` concurrent byte ranges written in place with os.pwrite"""
+        st = await self.stat(filename)
+        if st.get('status') != 'OK':
+            return st
+        if not st['exists']:
+            return dict(status='ERROR', data=f"File {filename} does not exist")
+        
+        total = st['filesize']
+        segment_size = -(-total // max(segments, 1)) or 1
+        ranges = [(start, min(segment_size, total - start)) for start in range(0, total, segment_size)]
+        partpath = filepath + '.part'
+        
+        async def fetch(start, length):
+            position = start
+            for attempt in range(retries + 1):
+                sink = PositionalWriter(fd, position)
+                hasil = await self.get(filename, sink, position, start + length - position, timeout=timeout)
+                position = sink.position
+                if hasil.get('mtime', st['mtime']) != st['mtime']:
+                    return dict(status='ERROR', data=f"File {filename} changed during download")
+                if hasil.get('status') == 'OK' or 'size' in hasil or attempt == retries:
+                    return hasil
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+        
+        fd = os.open(partpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, total)
+            results = await asyncio.gather(*(fetch(*r) for r in ranges))
+        finally:
+            os.close(fd)
+        
+        for hasil in results:
+            if hasil.get('status') != 'OK':
+                os.remove(partpath)
+                return hasil
+        os.replace(partpath, filepath)
+        return dict(status='OK', data_namafile=filename, total=total, segments=len(ranges))
+    
+    async def upload_file(self, filename, filepath, retries=3, resume=False, timeout=None):
+        """Upload filepath as filename, resuming from the server's partial copy after a failure"""
+        total = os.path.getsize(filepath)
+        for attempt in range(retries + 1):
+            offset = 0
+            if resume or attempt:
+                st = await self.stat(filename)
+                if st.get('status') == 'OK' and st['partial_size'] <= total:
+                    offset = st['partial_size']
+            
+            with open(filepath, 'rb') as fp:
+                fp.seek(offset)
+                hasil = await self.upload(filename, fp, offset, total, timeout=timeout)
+            if hasil.get('status') == 'OK':
+                return hasil
+            
+            logging.warning(f"Upload of {filename} failed at offset {offset}: {hasil.get('data')}")
+            if attempt < retries:
+                await asyncio.sleep(min(0.5 * 2 ** attempt, 5))
+        return hasil
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client():
+    """Shared FileClient for server_address, recreated when the address or compression changes"""
+    global _default_client
+    with _default_client_lock:
+        if (_default_client is None or _default_client.address != server_address
+                or _default_client.compression != compression):
+            if _default_client is not None:
+                _default_client.close()
+            _default_client = FileClient(server_address, compression=compression)
+        return _default_client
+
+def send_request(header, body=b'', timeout=300, sink=None):
+    """Send a protocol v2 request over the shared connection pool; see FileClient.request"""
+    return get_client().request(header, body, timeout, sink)
+
+def remote_list(prefix=''):
+    hasil = get_client().list(prefix, detail=True)
+    if hasil and hasil.get('status') == 'OK':
+        print("Daftar file:")
+        for nmfile in hasil['data']:
+            print(f"- {nmfile['name']} ({nmfile['size']} bytes)")
+        return True
+    else:
+        print(f"Gagal: {hasil}")
+        return False
+
+def remote_stats():
+    hasil = get_client().stats()
+    if hasil and hasil.get('status') == 'OK':
+        print(json.dumps(hasil['stats'], indent=2))
+        return hasil['stats']
+    else:
+        print(f"Gagal: {hasil}")
+        return None
+
+def remote_get(filename="", segments=1):
+    start_time = time.time()
+    os.makedirs('downloaded_files', exist_ok=True)
+    filepath = os.path.join('downloaded_files', filename)
+    
+    try:
+        if segments > 1:
+            hasil = get_client().download_segmented(filename, filepath, segments, timeout=300)
+        else:
+            hasil = get_client().download(filename, filepath, timeout=300)
+        
+        if hasil and hasil.get('status') == 'OK':
+            end_time = time.time()
+            file_size = hasil['total']
+            duration = end_time - start_time
+            throughput = file_size / duration if duration > 0 else 0
+            
+            logging.warning(f"Download successful: {filename}, size: {file_size}, duration: {duration:.2f}s")
+            return True, duration, throughput
+        else:
+            logging.error(f"Download gagal: {hasil}")
+            return False, 0, 0
+    except Exception as e:
+        logging.error(f"Error processing download response: {e}")
+        return False, 0, 0
+
+def remote_mget(filenames):
+    """Download many (small) files in batched round trips"""
+    start_time = time.time()
+    hasil = get_client().mget(filenames, 'downloaded_files', timeout=300)
+    duration = time.time() - start_time
+    ok = len(hasil['results']) - hasil['failed']
+    logging.warning(f"Batch download: {ok}/{len(filenames)} files in {duration:.2f}s")
+    for entry in hasil['results']:
+        if entry['status'] != 'OK':
+            logging.error(f"Download gagal: {entry['name']}: {entry.get('data')}")
+    return hasil['status'] == 'OK', duration
+
+def remote_mupload(filenames):
+    """Upload many (small) files from files/ in batched round trips"""
+    start_time = time.time()
+    hasil = get_client().mupload([os.path.join('files', name) for name in filenames], filenames, timeout=300)
+    duration = time.time() - start_time
+    ok = len(hasil['results']) - hasil['failed']
+    logging.warning(f"Batch upload: {ok}/{len(filenames)} files in {duration:.2f}s")
+    for entry in hasil['results']:
+        if entry['status'] != 'OK':
+            logging.error(f"Upload failed: {entry['name']}: {entry.get('data')}")
+    return hasil['status'] == 'OK', duration
+
+def remote_upload(filename="", delta=False):
+    start_time = time.time()
+    try:
+        filepath = os.path.join('files', filename)
+        if not os.path.exists(filepath):
+            logging.error(f"File {filepath} tidak ditemukan")
+            return False, 0, 0
+        
+        file_size = os.path.getsize(filepath)
+        logging.warning(f"Uploading file: {filename}, size: {file_size} bytes")
+        
+        # Dynamic timeout based on file size
+        timeout = max(300, file_size // (1024 * 1024) * 30)  # 30 seconds per MB, minimum 5 minutes
+        
+        if delta:
+            # Only the blocks that differ from the server's copy are sent
+            hasil = get_client().sync_file(filename, filepath, timeout=timeout)
+        else:
+            hasil = get_client().upload_file(filename, filepath, timeout=timeout)
+        
+        if hasil and hasil.get('status') == 'OK':
+            end_time = time.time()
+            duration = end_time - start_time
+            throughput = file_size / duration if duration > 0 else 0
+            
+            logging.warning(f"Upload successful: {filename}, duration: {duration:.2f}s, throughput: {throughput:.2f} B/s")
+            return True, duration, throughput
+        else:
+            logging.error(f"Upload failed: {hasil}")
+            return False, 0, 0
+    
+    except Exception as e:
+        logging.error(f"Upload error: {e}")
+        return False, 0, 0
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    server_address = ('0.0.0.0', 7771)
+    remote_list()
+    remote_get('10mb.mp4')
+    remote_upload('10mb.mp4')
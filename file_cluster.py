@@ -0,0 +1,348 @@
+# file_cluster.py - Client-side cluster of file servers: consistent-hash routing and replication
+import os
+import sys
+import time
+import bisect
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from file_client_cli import FileClient, DEFAULT_POOL_SIZE
+
+VIRTUAL_NODES = 64  # points per node on the hash ring; more spreads names more evenly
+REPLICAS = 2  # copies of every file
+DOWN_COOLDOWN = 5.0  # seconds a node that refused a connection is skipped before being tried again
+LATENCY_SMOOTHING = 0.2  # weight of the newest sample in a node's moving average latency
+
+def node_name(address):
+    return f"{address[0]}:{address[1]}"
+
+def unreachable(hasil):
+    """Whether a client call failed because nobody accepted the connection, as opposed to being slow"""
+    return hasil.get('status') == 'ERROR' and bool(hasil.get('unreachable'))
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'big')
+
+class HashRing:
+    """Consistent hashing of names onto nodes.
+    
+    Each node owns VIRTUAL_NODES points on a 64-bit ring; a name belongs to
+    the nodes met walking clockwise from its hash. Adding or removing a node
+    therefore only moves the names next to that node's points.
+    """
+    def __init__(self, nodes=(), vnodes=VIRTUAL_NODES):
+        self.vnodes = vnodes
+        self.points = []  # sorted (hash, node)
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+    
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            bisect.insort(self.points, (ring_hash(f"{node_name(node)}#{i}"), node))
+    
+    def remove(self, node):
+        self.nodes.remove(node)
+        self.points = [point for point in self.points if point[1] != node]
+    
+    def preference(self, name):
+        """Every node, in the order name should be placed on them"""
+        if not self.points:
+            return []
+        start = bisect.bisect(self.points, (ring_hash(name),))
+        order = []
+        for i in range(len(self.points)):
+            node = self.points[(start + i) % len(self.points)][1]
+            if node not in order:
+                order.append(node)
+                if len(order) == len(self.nodes):
+                    break
+        return order
+
+class NodeState:
+    """What the cluster client knows about one node: its connections, load and health"""
+    def __init__(self, address, pool_size, timeout, endpoint=None):
+        self.address = address
+        self.client = FileClient(endpoint or address, pool_size=pool_size, timeout=timeout)
+        self.inflight = 0
+        self.latency = 0.0  # moving average of request latency, seconds
+        self.down_until = 0.0
+        self.hints = {}  # filename -> node holding a write this node missed
+        self.repairing = False
+    
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+class ClusterClient:
+    """FileClient for several file servers that share no storage.
+    
+    Every file name maps to `replicas` nodes through a HashRing. Uploads go to
+    all of them in parallel; reads go to the replica with the fewest requests
+    in flight (then the lowest recent latency, i.e. the nearest) and fail over
+    to the next one. A node that cannot be reached is skipped for
+    DOWN_COOLDOWN seconds, and writes meant for it go to the next node on the
+    ring, where reads look as well. A replica that missed a write keeps a
+    hint naming a node that took it: reads try it last, and once it answers
+    again the file is copied back to it (hinted handoff). Hints live in this
+    client only. Results are the server's dicts, plus the node that served a
+    read ('node') or the nodes that took a write ('nodes').
+    
+    endpoints optionally maps a node's address to where to connect to it
+    instead (e.g. a proxy in front of it); placement always hashes the node
+    addresses, so every client of the same nodes places names alike.
+    """
+    def __init__(self, addresses, replicas=REPLICAS, write_quorum=None, pool_size=DEFAULT_POOL_SIZE, timeout=300,
+                 endpoints=None):
+        self.addresses = [tuple(address) for address in addresses]
+        self.endpoints = {address: tuple((endpoints or {}).get(address, address)) for address in self.addresses}
+        self.replicas = min(replicas, len(self.addresses))
+        # Writes acknowledged by fewer nodes than this report an error
+        self.write_quorum = write_quorum or self.replicas
+        self.ring = HashRing(self.addresses)
+        self.nodes = {address: NodeState(address, pool_size, timeout, self.endpoints[address])
+                      for address in self.addresses}
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)  # writes of a file wait here while it is repaired
+        self.writing = {}  # filename -> writes in flight
+        self.repairs = set()  # filenames being copied back to a node that missed them
+        self.executor = ThreadPoolExecutor(max_workers=max(pool_size, self.replicas))
+    
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for node in self.nodes.values():
+            node.client.close()
+    
+    def call(self, node, method, *args, **kwargs):
+        """method of node's FileClient, with load, latency and health bookkeeping"""
+        with self.lock:
+            node.inflight += 1
+        started = time.monotonic()
+        try:
+            hasil = method(node.client, *args, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            with self.lock:
+                node.inflight -= 1
+                node.latency += LATENCY_SMOOTHING * (elapsed - node.latency)
+        if unreachable(hasil):
+            logging.warning(f"Node {node_name(node.address)} failed: {hasil.get('data')}")
+            node.down_until = time.monotonic() + DOWN_COOLDOWN
+        elif node.hints and not node.repairing:
+            with self.lock:
+                repair, node.repairing = not node.repairing, True
+            if repair:
+                self.executor.submit(self.handoff, node)
+        return hasil
+    
+    def placement(self, filename):
+        """Nodes a new copy of filename goes to: its first replicas reachable nodes on the ring"""
+        order = self.ring.preference(filename)
+        live = [address for address in order if self.nodes[address].available()]
+        return (live or order)[:self.replicas]
+    
+    def read_order(self, filename):
+        """Nodes to read filename from: its replicas, least loaded first, then the rest of the ring.
+        
+        Replicas that missed the latest write come last, so they only answer
+        when no node has a newer copy.
+        """
+        order = self.ring.preference(filename)
+        replicas, rest = order[:self.replicas], order[self.replicas:]
+        with self.lock:
+            replicas.sort(key=lambda address: (not self.nodes[address].available(), self.nodes[address].inflight,
+                                               self.nodes[address].latency))
+            stale = [address for address in replicas if filename in self.nodes[address].hints]
+        return [self.nodes[address] for address in replicas + rest if address not in stale] + \
+               [self.nodes[address] for address in stale]
+    
+    def read(self, filename, method, *args, **kwargs):
+        """First OK answer of method for filename, failing over along read_order()"""
+        hasil = dict(status='ERROR', data='No nodes')
+        for node in self.read_order(filename):
+            hasil = self.call(node, method, *args, **kwargs)
+            if hasil.get('status') == 'OK' and hasil.get('exists', True):
+                return dict(hasil, node=node_name(node.address))
+            logging.debug("Read of %s from %s failed, trying the next node", filename, node_name(node.address))
+        return hasil
+    
+    def write(self, filename, method, *args, **kwargs):
+        """Run method for filename on all its replicas at once; a node that fails is replaced by the next on the ring"""
+        with self.idle:
+            self.idle.wait_for(lambda: filename not in self.repairs)
+            self.writing[filename] = self.writing.get(filename, 0) + 1
+        done = []
+        try:
+            return self._write(filename, done, method, *args, **kwargs)
+        finally:
+            with self.idle:
+                self.writing[filename] -= 1
+                if not self.writing[filename]:
+                    del self.writing[filename]
+                # Replicas that took the write are current; the others need it copied back
+                for address in self.ring.preference(filename)[:self.replicas]:
+                    if address in done:
+                        self.nodes[address].hints.pop(filename, None)
+                    elif done:
+                        self.nodes[address].hints[filename] = done[0]
+    
+    def _write(self, filename, done, method, *args, **kwargs):
+        targets = self.placement(filename)
+        spare = [address for address in self.ring.preference(filename) if address not in targets]
+        spare.sort(key=lambda address: not self.nodes[address].available())
+        hasil = dict(status='ERROR', data='No nodes')
+        pending = {self.executor.submit(self.call, self.nodes[address], method, *args, **kwargs): address
+                   for address in targets}
+        while pending:
+            future = next(iter(pending))
+            address = pending.pop(future)
+            result = future.result()
+            if result.get('status') == 'OK':
+                done.append(address)
+                hasil = result
+                continue
+            hasil = result if not done else hasil
+            if unreachable(result) and spare:
+                # Unreachable: keep the replica count by writing to the next node instead
+                replacement = spare.pop(0)
+                pending[self.executor.submit(self.call, self.nodes[replacement], method, *args, **kwargs)] = replacement
+        if len(done) < self.write_quorum:
+            return dict(status='ERROR', data=f"Stored on {len(done)} of {self.write_quorum} required nodes: "
+                                             f"{hasil.get('data')}", nodes=[node_name(a) for a in done])
+        return dict(hasil, nodes=[node_name(address) for address in done])
+    
+    def handoff(self, node):
+        """Copy the writes node missed back to it from the nodes that took them"""
+        with self.lock:
+            hints = list(node.hints.items())
+        try:
+            for filename, source in hints:
+                with self.lock:
+                    if filename in self.writing or node.hints.get(filename) != source:
+                        continue  # the write in flight settles this hint itself
+                    self.repairs.add(filename)
+                hasil = dict(status='ERROR', data='Copy failed')
+                try:
+                    hasil = self.copy(filename, self.nodes[source], node)
+                finally:
+                    with self.idle:
+                        self.repairs.discard(filename)
+                        if hasil.get('status') == 'OK':
+                            node.hints.pop(filename, None)
+                        self.idle.notify_all()
+                if hasil.get('status') != 'OK':
+                    logging.warning(f"Handoff of {filename} to {node_name(node.address)} failed: {hasil.get('data')}")
+                    break  # retried after the node's next answer
+                logging.debug("Handed %s off from %s to %s", filename, node_name(source), node_name(node.address))
+        finally:
+            node.repairing = False
+    
+    def copy(self, filename, source, target):
+        """Copy filename from one node to another through a temp file"""
+        with tempfile.TemporaryFile() as fp:
+            hasil = self.call(source, FileClient.get, filename, fp)
+            if hasil.get('status') != 'OK':
+                return hasil
+            fp.seek(0)
+            return self.call(target, FileClient.upload, filename, fp)
+    
+    def list(self, prefix='', after=None, limit=None, detail=False, timeout=30):
+        """One page of the names stored anywhere in the cluster, merged across nodes"""
+        names = {}
+        more = False
+        for node in self.nodes.values():
+            if not node.available():
+                continue
+            hasil = self.call(node, FileClient.list, prefix, after, limit, detail, timeout)
+            if hasil.get('status') != 'OK':
+                continue
+            more = more or hasil.get('next') is not None
+            for entry in hasil['data']:
+                names.setdefault(entry['name'] if detail else entry, entry)
+        data = [names[name] for name in sorted(names)]
+        next_cursor = None
+        if limit is not None and (len(data) > limit or (more and len(data) == limit)):
+            data = data[:limit]
+            next_cursor = data[-1]['name'] if detail else data[-1]
+        return dict(status='OK', data=data, next=next_cursor)
+    
+    def stats(self, timeout=30):
+        """Each node's STATS, and the client's view of its load and health"""
+        nodes = {}
+        for node in self.nodes.values():
+            hasil = self.call(node, FileClient.stats, timeout)
+            nodes[node_name(node.address)] = dict(stats=hasil.get('stats'), inflight=node.inflight,
+                                                  latency_ms=round(node.latency * 1000, 3),
+                                                  available=node.available())
+        return dict(status='OK', nodes=nodes)
+    
+    def stat(self, filename, checksum=False, timeout=30):
+        return self.read(filename, FileClient.stat, filename, checksum, timeout)
+    
+    def get(self, filename, fp, offset=0, length=None, timeout=None):
+        """Download (a range of) filename into the seekable file fp; a failed replica's bytes are discarded"""
+        start = fp.tell()
+        for node in self.read_order(filename):
+            fp.seek(start)
+            fp.truncate()
+            hasil = self.call(node, FileClient.get, filename, fp, offset, length, timeout)
+            if hasil.get('status') == 'OK':
+                return dict(hasil, node=node_name(node.address))
+        return hasil
+    
+    def upload(self, filename, data, timeout=None):
+        """Store bytes as filename on every replica"""
+        return self.write(filename, lambda client: client.request(dict(command='UPLOAD', params=[filename]), data,
+                                                                    timeout)[0])
+    
+    def download(self, filename, filepath, timeout=None):
+        """FileClient.download from the best replica, failing over to the others instead of retrying one"""
+        return self.read(filename, FileClient.download, filename, filepath, 0, timeout)
+    
+    def download_segmented(self, filename, filepath, segments=4, verify=True, timeout=None):
+        return self.read(filename, FileClient.download_segmented, filename, filepath, segments, 0, verify, timeout)
+    
+    def upload_file(self, filename, filepath, retries=3, resume=False, timeout=None):
+        """FileClient.upload_file to every replica in parallel"""
+        return self.write(filename, FileClient.upload_file, filename, filepath, retries, resume, timeout)
+
+def start_local_nodes(count, base_port=7771, directory='cluster', server_args=()):
+    """Start count file_server.py processes on consecutive ports, each storing into its own directory.
+    
+    Returns (addresses, processes); the servers log to <directory>/node<i>.log.
+    """
+    addresses, processes = [], []
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        storage = os.path.join(directory, f"node{i}")
+        args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_server.py'),
+                *server_args, f"--port={base_port + i}", f"--storage={storage}"]
+        with open(os.path.join(directory, f"node{i}.log"), 'ab') as log:
+            processes.append(subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT))
+        addresses.append(('127.0.0.1', base_port + i))
+    return addresses, processes
+
+if __name__ == '__main__':
+    # Demo: three local nodes, two replicas; a file stays readable after its first node dies
+    logging.basicConfig(level=logging.ERROR)
+    addresses, processes = start_local_nodes(3)
+    time.sleep(1.0)
+    cluster = ClusterClient(addresses, replicas=2)
+    try:
+        with open('cluster_demo.bin', 'wb') as fp:
+            fp.write(os.urandom(1024 * 1024))
+        print(cluster.upload_file('cluster_demo.bin', 'cluster_demo.bin'))
+        first = cluster.ring.preference('cluster_demo.bin')[0]
+        processes[addresses.index(first)].terminate()
+        print(cluster.download('cluster_demo.bin', 'cluster_demo.out'))
+        print(cluster.list())
+    finally:
+        cluster.close()
+        for proc in processes:
+            proc.terminate()
+            proc.wait()
@@ -1,91 +1,1106 @@
-# file_interface.py - Same as before, no changes needed
-import os
-import json
-import base64
-from glob import glob
-import logging
-
-class FileInterface:
-    def __init__(self):
-        self.base_dir = os.getcwd()
-        self.files_dir = os.path.join(self.base_dir, 'files')
-        self.uploaded_dir = os.path.join(self.base_dir, 'files')
-        
-        os.makedirs(self.files_dir, exist_ok=True)
-        os.makedirs(self.uploaded_dir, exist_ok=True)
-        
-        logging.warning(f"FileInterface initialized - base: {self.base_dir}, files: {self.files_dir}")
-    
-    def list(self, params=[]):
-        try:
-            os.chdir(self.files_dir)
-            filelist = glob('*.*')
-            os.chdir(self.base_dir)
-            
-            logging.warning(f"Listing files: {filelist}")
-            return dict(status='OK', data=filelist)
-        except Exception as e:
-            logging.error(f"Error in list: {str(e)}")
-            os.chdir(self.base_dir)
-            return dict(status='ERROR', data=str(e))
-    
-    def get(self, params=[]):
-        try:
-            if not params:
-                return dict(status='ERROR', data='No filename provided')
-                
-            filename = params[0]
-            filepath = os.path.join(self.files_dir, filename)
-            
-            logging.warning(f"Attempting to get file: {filepath}")
-            
-            if not os.path.exists(filepath):
-                logging.error(f"File {filepath} does not exist")
-                return dict(status='ERROR', data=f"File {filename} does not exist")
-            
-            with open(filepath, 'rb') as fp:
-                file_content = fp.read()
-                isifile = base64.b64encode(file_content).decode('utf-8')
-            
-            logging.warning(f"File {filename} read successfully, size: {len(file_content)} bytes")
-            return dict(status='OK', data_namafile=filename, data_file=isifile)
-            
-        except Exception as e:
-            logging.error(f"Error in get: {str(e)}")
-            return dict(status='ERROR', data=str(e))
-    
-    def upload(self, params=[]):
-        try:
-            if len(params) < 2:
-                return dict(status='ERROR', data='Insufficient parameters')
-                
-            filename = params[0]
-            filedata_b64 = params[1]
-            
-            logging.warning(f"Uploading file: {filename}, base64 length: {len(filedata_b64)}")
-            
-            # Decode base64 data
-            try:
-                filedata = base64.b64decode(filedata_b64)
-            except Exception as e:
-                logging.error(f"Base64 decode error: {e}")
-                return dict(status='ERROR', data='Invalid base64 data')
-            
-            filepath = os.path.join(self.uploaded_dir, filename)
-            
-            with open(filepath, 'wb') as fp:
-                fp.write(filedata)
-            
-            logging.warning(f"File {filename} uploaded successfully, size: {len(filedata)} bytes")
-            return dict(status='OK', data='File uploaded successfully')
-            
-        except Exception as e:
-            logging.error(f"Error in upload: {str(e)}")
-            return dict(status='ERROR', data=str(e))
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.WARNING)
-    f = FileInterface()
-    print(f.list())
-    print(f.get(['10mb.mp4']))
-    print(f.upload(['test.txt', base64.b64encode(b'test data').decode()]))
\ No newline at end of file
+# file_interface.py - File storage behind the protocol: streaming uploads and downloads, cache, dedup and layout
+import os
+import json
+import base64
+import fcntl
+import hashlib
+import tempfile
+import threading
+import time
+import bisect
+import heapq
+import math
+import struct
+import itertools
+from collections import OrderedDict
+import logging
+
+CHUNK_SIZE = 256 * 1024  # buffer size for streamed bodies
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # memory budget of the shared file cache
+CACHE_MAX_ENTRY_BYTES = 128 * 1024 * 1024  # larger values are never cached
+SMALL_FILE_BYTES = 256 * 1024  # v2 GETs of files up to this size are served from the cache
+DELTA_MIN_BLOCK = 2 * 1024  # block size bounds for delta uploads; sqrt(file size) in between
+DELTA_MAX_BLOCK = 128 * 1024
+GROUP_COMMIT_DELAY = 0.005  # how long a group commit waits for more uploads to join it
+STORAGE_ROOTS = ['files']  # default storage: one flat directory under the cwd
+
+# Durability of completed uploads: 'none' leaves flushing to the OS, 'fsync'
+# syncs every file before it is renamed into place (and its directory after),
+# 'group' does the same but shares each flush among concurrent uploads
+DURABILITY_POLICIES = ('none', 'fsync', 'group')
+
+# Flushes a file's data and size; its name is covered by syncing the directory
+_fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(filepath, 'rb', buffering=0) as fp:
+        while True:
+            n = fp.readinto(view)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+def delta_block_size(size):
+    """Block size used for the delta signatures of a file of the given size"""
+    return max(DELTA_MIN_BLOCK, min(DELTA_MAX_BLOCK, math.isqrt(size)))
+
+def weak_checksum(block):
+    """rsync's rolling checksum of a block, as (a, b); combine with a | b << 16"""
+    a = sum(block) & 0xffff
+    b = sum(itertools.accumulate(block)) & 0xffff
+    return a, b
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).digest()
+
+# Delta upload instruction stream: DELTA_COPY copies `count` blocks of the
+# server's current copy starting at block `index`, DELTA_DATA is followed by
+# `length` literal bytes. The stream ends with the request body.
+DELTA_OP_COPY = 1
+DELTA_OP_DATA = 2
+DELTA_COPY = struct.Struct('!BII')  # op, index, count
+DELTA_DATA = struct.Struct('!BI')  # op, length
+DELTA_SIGNATURE = struct.Struct('!I16s')  # weak checksum, strong checksum per block
+
+def read_exact(reader, size):
+    """Read exactly size bytes from anything with readinto"""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    got = 0
+    while got < size:
+        n = reader.readinto(view[got:])
+        if not n:
+            raise ConnectionError(f"Body ended {size - got} bytes early")
+        got += n
+    return buf
+
+class FileRegion:
+    """A byte range of an open file, sent to the client without loading it into memory"""
+    def __init__(self, fileobj, offset, length):
+        self.fileobj = fileobj
+        self.offset = offset
+        self.length = length
+    
+    def __len__(self):
+        return self.length
+    
+    def close(self):
+        self.fileobj.close()
+
+class FileCache:
+    """Byte-budgeted LRU of file contents, shared by every FileInterface in the process.
+    
+    Entries are keyed by (path, kind), e.g. kind 'raw' for the content and 'b64'
+    for the legacy protocol's encoded form, and are only valid while the file's
+    inode, mtime and size match; installing a file over a path invalidates its
+    entries. Concurrent misses on one key load it once.
+    """
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, max_entry_bytes=CACHE_MAX_ENTRY_BYTES):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.entries = OrderedDict()  # (path, kind) -> (version, value)
+        self.loading = {}  # (path, kind) -> [version, Event, value, error]
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+    
+    def get_or_load(self, path, kind, st, loader):
+        """Cached value for path/kind if still valid for stat result st, else loader()"""
+        key = (path, kind)
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            pending = self.loading.get(key)
+            owner = pending is None or pending[0] != version
+            if owner:
+                self.misses += 1
+                pending = [version, threading.Event(), None, None]
+                self.loading[key] = pending
+            else:
+                self.hits += 1  # served by the load already in flight
+        
+        if not owner:
+            pending[1].wait()
+            if pending[3] is not None:
+                raise pending[3]
+            return pending[2]
+        
+        try:
+            pending[2] = value = loader()
+            self.put(key, version, value)
+            return value
+        except Exception as e:
+            pending[3] = e
+            raise
+        finally:
+            with self.lock:
+                if self.loading.get(key) is pending:
+                    del self.loading[key]
+            pending[1].set()
+    
+    def put(self, key, version, value):
+        if len(value) > self.max_entry_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old[1])
+            self.entries[key] = (version, value)
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+    
+    def invalidate(self, path):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == path]:
+                self.current_bytes -= len(self.entries.pop(key)[1])
+    
+    def stats(self):
+        with self.lock:
+            return dict(entries=len(self.entries), bytes=self.current_bytes, max_bytes=self.max_bytes,
+                        hits=self.hits, misses=self.misses, evictions=self.evictions)
+
+file_cache = FileCache()
+
+class GroupCommit:
+    """Batches the syncs of concurrent uploads.
+    
+    commit(fd, install, dirs) syncs fd, calls install() (the rename into
+    place) and then syncs the directories in dirs, returning what install
+    returned. The first caller of a batch waits GROUP_COMMIT_DELAY for others
+    to join, then does this for the whole batch while the rest wait: every
+    file is synced, every rename made, and each directory synced once, so an
+    upload costs one batch. Only the batched descriptors and directories are
+    flushed. Callers must keep their descriptors open until commit returns.
+    """
+    def __init__(self, delay=GROUP_COMMIT_DELAY):
+        self.delay = delay
+        self.pending = None  # [entries, done] of the batch still collecting
+        self.batches = 0
+        self.synced = 0
+        self.cond = threading.Condition()
+    
+    def commit(self, fd=None, install=None, dirs=()):
+        entry = [fd, install, dirs, None, None]  # ..., result, error
+        with self.cond:
+            batch = self.pending
+            if batch is not None:
+                batch[0].append(entry)
+                while not batch[1]:
+                    self.cond.wait()
+            else:
+                batch = self.pending = [[entry], False]
+        
+        if batch[0][0] is entry:
+            # This caller leads the batch
+            time.sleep(self.delay)
+            with self.cond:
+                self.pending = None  # later arrivals start the next batch
+            self._flush(batch[0])
+            with self.cond:
+                batch[1] = True
+                self.batches += 1
+                self.synced += len(batch[0])
+                self.cond.notify_all()
+        if entry[4] is not None:
+            raise entry[4]
+        return entry[3]
+    
+    def _flush(self, entries):
+        for entry in entries:
+            if entry[0] is not None:
+                try:
+                    _fdatasync(entry[0])
+                except OSError as e:
+                    entry[4] = e
+        waiting = {}  # directory -> entries whose renames it holds
+        for entry in entries:
+            if entry[4] is not None:
+                continue
+            try:
+                if entry[1] is not None:
+                    entry[3] = entry[1]()
+            except Exception as e:
+                entry[4] = e
+                continue
+            for path in entry[2]:
+                waiting.setdefault(path, []).append(entry)
+        for path, owners in waiting.items():
+            try:
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                for entry in owners:
+                    if entry[4] is None:
+                        entry[4] = OSError(e.errno, f"Group commit failed: {e.strerror}")
+    
+    def stats(self):
+        with self.cond:
+            return dict(batches=self.batches, synced=self.synced,
+                        per_batch=round(self.synced / self.batches, 2) if self.batches else 0.0)
+
+class ContentStore:
+    """Content-addressed object store for deduplicated uploads.
+    
+    Every distinct content is kept once, as .objects/<sha256> inside the storage
+    root, and each stored name with that content is a hard link to its object.
+    Reads therefore need no indirection at all, and a client that already
+    knows the hash can store a name without sending any data (see
+    FileInterface.have). Hard links cannot cross filesystems, so with several
+    roots each has its own objects. Objects no name links to any more are
+    removed by collect().
+    """
+    COLLECT_INTERVAL = 300.0
+    
+    def __init__(self, storage):
+        self.storage = storage
+        self.objects_dirs = [os.path.join(root, '.objects') for root in storage.roots]
+        for objects_dir in self.objects_dirs:
+            os.makedirs(objects_dir, exist_ok=True)
+        self.last_collect = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def objects_dir(self, filepath):
+        """The objects directory on the root that holds filepath"""
+        return self.objects_dirs[self.storage.roots.index(self.storage.root_of(filepath))]
+    
+    def object_path(self, digest, filepath):
+        digest = str(digest).lower()
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid SHA-256: {digest}")
+        return os.path.join(self.objects_dir(filepath), digest)
+    
+    def has(self, digest, filepath=None):
+        """Whether the content is stored on filepath's root, or on any root without filepath"""
+        paths = [filepath] if filepath is not None else self.storage.roots
+        return any(os.path.isfile(self.object_path(digest, path)) for path in paths)
+    
+    def link(self, digest, filepath):
+        """Make filepath a hard link to the object for digest; False if there is no such object"""
+        linkpath = os.path.join(os.path.dirname(filepath),
+                                f".{os.path.basename(filepath)}.{os.getpid()}.{threading.get_ident()}.link")
+        try:
+            os.link(self.object_path(digest, filepath), linkpath)
+        except FileNotFoundError:
+            return False  # never stored, or just collected
+        os.replace(linkpath, filepath)
+        return True
+    
+    def commit(self, tmppath, digest, filepath):
+        """Move a freshly written file into place as filepath; returns True if its content was already stored"""
+        try:
+            os.link(tmppath, self.object_path(digest, filepath))
+        except FileExistsError:
+            if self.link(digest, filepath):
+                os.remove(tmppath)
+                return True
+        os.replace(tmppath, filepath)
+        self.collect()
+        return False
+    
+    def collect(self, force=False):
+        """Remove objects whose names were all overwritten or deleted; at most every COLLECT_INTERVAL seconds"""
+        with self.lock:
+            if not force and time.monotonic() - self.last_collect < self.COLLECT_INTERVAL:
+                return 0
+            self.last_collect = time.monotonic()
+        removed = 0
+        for objects_dir in self.objects_dirs:
+            with os.scandir(objects_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.stat(follow_symlinks=False).st_nlink == 1:
+                            os.remove(entry.path)
+                            removed += 1
+                    except FileNotFoundError:
+                        pass
+        if removed:
+            logging.warning(f"Removed {removed} unreferenced objects")
+        return removed
+
+class DirectoryIndex:
+    """Cached, sorted index of the visible regular files in one directory.
+    
+    Refreshed lazily: when the directory's mtime changes it is re-read with
+    os.scandir and only new entries, or entries whose inode changed (files
+    replaced by rename), are stat'ed again. Every full_refresh seconds all
+    entries are re-stat'ed to catch in-place edits made behind our back.
+    """
+    def __init__(self, path, full_refresh=60.0):
+        self.path = path
+        self.full_refresh = full_refresh
+        self.entries = {}  # name -> (inode, size, mtime_ns)
+        self.names = []  # sorted, for prefix and cursor lookups
+        self.dir_mtime = None
+        self.last_full = None
+        self.lock = threading.Lock()
+    
+    def refresh(self):
+        with self.lock:
+            now = time.monotonic()
+            full = self.last_full is None or now - self.last_full > self.full_refresh
+            dir_mtime = os.stat(self.path).st_mtime_ns
+            if dir_mtime == self.dir_mtime and not full:
+                return
+            
+            entries = {}
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    # Hidden names are temp and partial uploads
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        old = self.entries.get(entry.name)
+                        if old is not None and old[0] == entry.inode() and not full:
+                            entries[entry.name] = old
+                        else:
+                            st = entry.stat()
+                            entries[entry.name] = (entry.inode(), st.st_size, st.st_mtime_ns)
+                    except FileNotFoundError:
+                        continue
+            
+            if entries.keys() != self.entries.keys():
+                self.names = sorted(entries)
+            self.entries = entries
+            self.dir_mtime = dir_mtime
+            if full:
+                self.last_full = now
+    
+    def touch(self, name):
+        """Re-stat one entry after FileInterface changed it"""
+        if name.startswith('.') or os.path.basename(name) != name:
+            return
+        try:
+            st = os.stat(os.path.join(self.path, name))
+        except FileNotFoundError:
+            st = None
+        with self.lock:
+            if self.dir_mtime is None:
+                return
+            if st is None:
+                if self.entries.pop(name, None) is not None:
+                    self.names.remove(name)
+                return
+            if name not in self.entries:
+                bisect.insort(self.names, name)
+            self.entries[name] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    
+    def page(self, prefix='', after=None, limit=None):
+        """Entries (name, size, mtime_ns) with the given prefix, sorted by name, after cursor `after`.
+        
+        Returns (entries, next) where next is the cursor for the following page, or None.
+        """
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        self.refresh()
+        with self.lock:
+            start = bisect.bisect_left(self.names, prefix)
+            if after is not None:
+                start = max(start, bisect.bisect_right(self.names, after))
+            result = []
+            for name in self.names[start:]:
+                if not name.startswith(prefix):
+                    break
+                if limit is not None and len(result) >= limit:
+                    return result, result[-1][0]
+                _, size, mtime = self.entries[name]
+                result.append((name, size, mtime))
+            return result, None
+
+class StorageLayout:
+    """Where stored files live: spread over root directories and hashed shards of them.
+    
+    A name's hash picks one of the roots (typically one per disk) and, with
+    shards > 0, one of that many subdirectories of it, so concurrent uploads
+    go to different devices and no directory grows huge. One root without
+    shards is the original flat layout.
+    
+    A DirectoryIndex per directory maps names to where they actually are. It
+    is what LIST pages through, and it also finds files that are not where
+    their hash says, e.g. in a root's top level from before sharding was
+    turned on, or placed before a root was added. Those stay where they are.
+    """
+    def __init__(self, roots=STORAGE_ROOTS, shards=0):
+        if not roots:
+            raise ValueError("At least one storage root is required")
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.shards = int(shards)
+        if self.shards:
+            width = len(f"{self.shards - 1:x}")
+            self.dirs = [os.path.join(root, f"{i:0{width}x}") for root in self.roots for i in range(self.shards)]
+        else:
+            self.dirs = list(self.roots)
+        for path in self.dirs:
+            os.makedirs(path, exist_ok=True)
+        # Roots are indexed too when sharded: files stored there before still count
+        self.indexes = [DirectoryIndex(path) for path in dict.fromkeys(self.dirs + self.roots)]
+        self.by_dir = {index.path: index for index in self.indexes}
+        self.misplaced = {}  # name -> path, for files found outside their hashed directory
+        self.scan()
+    
+    def __repr__(self):
+        return f"StorageLayout({self.roots}, shards={self.shards})"
+    
+    def placement(self, name):
+        """Where a new file called name goes"""
+        h = int.from_bytes(hashlib.blake2b(name.encode('utf-8', 'surrogateescape'), digest_size=8).digest(), 'big')
+        if self.shards:
+            root, shard = h % len(self.roots), h // len(self.roots) % self.shards
+            return os.path.join(self.dirs[root * self.shards + shard], name)
+        return os.path.join(self.dirs[h % len(self.roots)], name)
+    
+    def path(self, name):
+        """Path of the stored file called name: where it is, or where it will go"""
+        filepath = self.placement(name)
+        moved = self.misplaced.get(name)
+        if moved is not None and not os.path.lexists(filepath) and os.path.lexists(moved):
+            return moved
+        return filepath
+    
+    def root_of(self, filepath):
+        filepath = os.path.abspath(filepath)
+        for root in self.roots:
+            if filepath == root or filepath.startswith(root + os.sep):
+                return root
+        raise ValueError(f"{filepath} is outside the storage roots")
+    
+    def scan(self):
+        """Read every directory and note the files that are not at their placement"""
+        misplaced = {}
+        for index in self.indexes:
+            index.refresh()
+            with index.lock:
+                names = list(index.entries)
+            for name in names:
+                filepath = os.path.join(index.path, name)
+                if self.placement(name) != filepath:
+                    misplaced[name] = filepath
+        self.misplaced = misplaced
+        if misplaced:
+            logging.warning(f"{len(misplaced)} files are outside their hashed directory; they are served in place")
+    
+    def touch(self, name, filepath):
+        """Re-stat one entry after FileInterface wrote it.
+        
+        A file written at its placement supersedes a copy of the same name
+        found elsewhere by scan(), which is removed so LIST and GET agree.
+        """
+        filepath = os.path.abspath(filepath)
+        moved = self.misplaced.get(name)
+        if moved is not None and moved != filepath and filepath == self.placement(name):
+            try:
+                os.remove(moved)
+            except FileNotFoundError:
+                pass
+            self.misplaced.pop(name, None)
+            self._touch(name, moved)
+            logging.debug("Removed the stale copy of %s at %s", name, moved)
+        self._touch(name, filepath)
+    
+    def _touch(self, name, filepath):
+        index = self.by_dir.get(os.path.dirname(filepath))
+        if index is not None:
+            index.touch(name)
+    
+    def page(self, prefix='', after=None, limit=None):
+        """DirectoryIndex.page over every directory, merged by name"""
+        if limit is not None and limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        if len(self.indexes) == 1:
+            return self.indexes[0].page(prefix, after, limit)
+        pages = [index.page(prefix, after, limit) for index in self.indexes]
+        more = any(next_cursor is not None for _, next_cursor in pages)
+        result = []
+        # (name, index number, entry): merged by name, never comparing the entries themselves
+        tagged = ([(entry[0], i, entry) for entry in entries] for i, (entries, _) in enumerate(pages))
+        for name, group in itertools.groupby(heapq.merge(*tagged), key=lambda item: item[0]):
+            group = list(group)
+            entry = group[0][2]
+            if len(group) > 1:
+                # The same name in several places: list the copy GET serves
+                home = os.path.dirname(self.path(name))
+                entry = next((e for _, i, e in group if self.indexes[i].path == home), entry)
+            if limit is not None and len(result) >= limit:
+                return result, result[-1][0]
+            result.append(entry)
+        if more and limit is not None and len(result) >= limit:
+            return result, result[-1][0]
+        return result, None
+
+class Upload:
+    """An upload being written to disk: write() each piece of the body as it arrives, then finish() or abort().
+    
+    FileInterface.open_upload starts one. upload_stream feeds it from a body
+    it reads itself; the asyncio server feeds it the pieces it receives, so
+    either way the bytes go straight into the file that is renamed into place.
+    """
+    def __init__(self, interface, filename, filepath, partpath, fd, offset, total, resumable):
+        self.interface = interface
+        self.filename = filename
+        self.filepath = filepath
+        self.partpath = partpath
+        self.total = total
+        self.resumable = resumable
+        self.fp = os.fdopen(fd, 'r+b')
+        self.fp.truncate(offset)
+        self.fp.seek(offset)
+        self.size = offset
+        # Hash on the fly for the content store unless the body continues an earlier upload
+        self.digest = hashlib.sha256() if interface.store is not None and not offset else None
+    
+    def write(self, data):
+        self.fp.write(data)
+        if self.digest is not None:
+            self.digest.update(data)
+        self.size += len(data)
+        if self.total is not None and self.size > self.total:
+            raise ValueError(f"Upload is larger than the declared {self.total} bytes")
+    
+    def finish(self):
+        """Install the file once the body is complete; returns the result dict"""
+        with self.fp:
+            if self.total is None or self.size == self.total:
+                self.fp.flush()
+                self.interface._install(self.partpath, self.filepath, self.digest.hexdigest() if self.digest else None)
+        
+        if self.total is not None and self.size < self.total:
+            if not self.resumable:
+                os.remove(self.partpath)
+                return dict(status='ERROR', data=f"Incomplete upload: {self.size} of {self.total} bytes")
+            logging.debug("Partial upload of %s stored, %d of %d bytes", self.filename, self.size, self.total)
+            return dict(status='OK', data='Partial upload stored', partial_size=self.size)
+        
+        self.interface.storage.touch(self.filename, self.filepath)
+        logging.debug("File %s uploaded successfully, size: %d bytes", self.filename, self.size)
+        return dict(status='OK', data='File uploaded successfully')
+    
+    def abort(self):
+        """Give up on the body: a resumable partial keeps what arrived, anything else is thrown away"""
+        self.fp.close()
+        if not self.resumable or self.size > self.total:
+            try:
+                os.remove(self.partpath)
+            except FileNotFoundError:
+                pass
+
+class FileInterface:
+    def __init__(self, cache=None, dedup=False, durability='none', storage=None):
+        self.cache = cache if cache is not None else file_cache
+        self.base_dir = os.getcwd()
+        self.store = None
+        self.set_storage(storage or StorageLayout())
+        if dedup:
+            self.enable_dedup()
+        self.group_commit = None
+        self.set_durability(durability)
+        
+        logging.warning(f"FileInterface initialized - base: {self.base_dir}, storage: {self.storage}")
+    
+    def set_storage(self, storage):
+        """Store files according to a StorageLayout"""
+        if not isinstance(storage, StorageLayout):
+            raise TypeError("storage must be a StorageLayout")
+        self.storage = storage
+        self.files_dir = self.uploaded_dir = storage.roots[0]
+        if self.store is not None:
+            self.enable_dedup()
+    
+    def enable_dedup(self):
+        """Store uploads in a ContentStore so identical contents share one copy on disk"""
+        self.store = ContentStore(self.storage)
+    
+    def set_durability(self, policy):
+        """How completed uploads reach stable storage: one of DURABILITY_POLICIES"""
+        if policy not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy: {policy}")
+        self.durability = policy
+        if policy == 'group' and self.group_commit is None:
+            self.group_commit = GroupCommit()
+    
+    def list(self, params=[], prefix='', after=None, limit=None, detail=False):
+        """List stored files by name, optionally filtered by prefix and paginated.
+        
+        Options come as keyword arguments (v2) or as key=value params (legacy,
+        e.g. "LIST prefix=log limit=100 detail=1"). Without limit everything is
+        returned; with it, 'next' is the cursor to pass as after= for the next
+        page. detail=True returns dicts with name, size and mtime.
+        """
+        try:
+            options = dict(p.split('=', 1) for p in params if '=' in p)
+            prefix = options.get('prefix', prefix) or ''
+            after = options.get('after', after)
+            limit = options.get('limit', limit)
+            limit = int(limit) if limit is not None else None
+            detail = str(options.get('detail', detail)).lower() in ('1', 'true', 'yes')
+            
+            entries, next_cursor = self.storage.page(prefix, after, limit)
+            if detail:
+                filelist = [dict(name=name, size=size, mtime=mtime) for name, size, mtime in entries]
+            else:
+                filelist = [name for name, _, _ in entries]
+            
+            logging.debug("Listing %d files (prefix=%r, after=%r, limit=%s)", len(filelist), prefix, after, limit)
+            return dict(status='OK', data=filelist, next=next_cursor)
+        except Exception as e:
+            logging.error(f"Error in list: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def get(self, params=[]):
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            
+            logging.debug("Attempting to get file: %s", filepath)
+            
+            if not os.path.isfile(filepath):
+                logging.error(f"File {filepath} does not exist")
+                return dict(status='ERROR', data=f"File {filename} does not exist")
+            
+            # The base64 form is what costs: keep it cached for repeated GETs
+            isifile = self.cache.get_or_load(filepath, 'b64', os.stat(filepath),
+                                             lambda: base64.b64encode(self._read_path(filepath)).decode('ascii'))
+            
+            logging.debug("File %s read successfully, base64 length: %d", filename, len(isifile))
+            return dict(status='OK', data_namafile=filename, data_file=isifile)
+        
+        except Exception as e:
+            logging.error(f"Error in get: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def get_stream(self, params=[], offset=0, length=None):
+        """Open (a byte range of) a file for a streaming download.
+        
+        data_file is a FileRegion instead of the content, or a memoryview of the
+        cached content for small files. offset is clamped to the file size, so a
+        client resuming past the end sees offset == total.
+        """
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            
+            if not os.path.isfile(filepath):
+                logging.error(f"File {filepath} does not exist")
+                return dict(status='ERROR', data=f"File {filename} does not exist")
+            
+            st = os.stat(filepath)
+            if st.st_size <= SMALL_FILE_BYTES:
+                # Small files: a memory copy beats open + sendfile + close
+                fp = None
+                content = memoryview(self.cache.get_or_load(filepath, 'raw', st, lambda: self._read_path(filepath)))
+            else:
+                fp = open(filepath, 'rb')
+                st = os.fstat(fp.fileno())
+            
+            offset = min(max(int(offset or 0), 0), st.st_size)
+            count = st.st_size - offset
+            if length is not None:
+                count = max(0, min(int(length), count))
+            data_file = FileRegion(fp, offset, count) if fp else content[offset:offset + count]
+            
+            logging.debug("Streaming file %s, bytes %d-%d of %d", filename, offset, offset + count, st.st_size)
+            return dict(status='OK', data_namafile=filename, offset=offset, total=st.st_size,
+                        mtime=st.st_mtime_ns, data_file=data_file)
+        
+        except Exception as e:
+            logging.error(f"Error in get_stream: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def stat(self, params=[], checksum=False):
+        """Size and mtime of a stored file, plus the size of any resumable partial upload.
+        
+        With checksum=True the SHA-256 of the file is included as well.
+        """
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            result = dict(status='OK', data_namafile=filename, exists=False, filesize=0, mtime=None, partial_size=0)
+            
+            if os.path.isfile(filepath):
+                st = os.stat(filepath)
+                result.update(exists=True, filesize=st.st_size, mtime=st.st_mtime_ns)
+                if checksum:
+                    result['sha256'] = file_sha256(filepath)
+            
+            partpath = self._partial_path(self.storage.path(filename))
+            if os.path.exists(partpath):
+                result['partial_size'] = os.path.getsize(partpath)
+            
+            return result
+        
+        except Exception as e:
+            logging.error(f"Error in stat: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def have(self, params, sha256):
+        """Whether content with this SHA-256 is stored; with a filename, also store it under that name.
+        
+        Lets a client skip uploading content the server already holds.
+        """
+        try:
+            if self.store is None:
+                return dict(status='ERROR', data='Deduplication is not enabled')
+            if not self.store.has(sha256):
+                return dict(status='OK', have=False)
+            if not params:
+                return dict(status='OK', have=True)
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            if not self.store.link(sha256, filepath):
+                return dict(status='OK', have=False)
+            self._sync_path(os.path.dirname(filepath))
+            self.storage.touch(filename, filepath)
+            logging.debug("File %s stored from existing content %.12s", filename, sha256)
+            return dict(status='OK', have=True, data='File uploaded successfully')
+        
+        except Exception as e:
+            logging.error(f"Error in have: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def signatures(self, params=[], block_size=None):
+        """Block signatures of a stored file, the base for a delta upload.
+        
+        data_file holds one DELTA_SIGNATURE per block; version identifies the
+        file's current content and must be passed back to apply_delta.
+        """
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            if not os.path.isfile(filepath):
+                return dict(status='ERROR', data=f"File {filename} does not exist")
+            
+            with open(filepath, 'rb') as fp:
+                st = os.fstat(fp.fileno())
+                block_size = int(block_size or delta_block_size(st.st_size))
+                if not DELTA_MIN_BLOCK <= block_size <= DELTA_MAX_BLOCK:
+                    return dict(status='ERROR', data=f"Block size must be {DELTA_MIN_BLOCK}-{DELTA_MAX_BLOCK} bytes")
+                # Re-syncing the same file again is common; keep its signatures in the file cache
+                data = self.cache.get_or_load(filepath, f'sig{block_size}', st,
+                                              lambda: self._signatures(fp, block_size))
+            
+            return dict(status='OK', data_namafile=filename, block_size=block_size, filesize=st.st_size,
+                        version=[st.st_ino, st.st_mtime_ns, st.st_size], data_file=data)
+        
+        except Exception as e:
+            logging.error(f"Error in signatures: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def _signatures(self, fp, block_size):
+        out = bytearray()
+        while block := fp.read(block_size):
+            a, b = weak_checksum(block)
+            out += DELTA_SIGNATURE.pack(a | b << 16, strong_checksum(block))
+        return bytes(out)
+    
+    def apply_delta(self, params, body, version, block_size, total):
+        """Build a new version of a file from a delta instruction stream and rename it into place.
+        
+        COPY instructions are served from the current copy, which must still be
+        the one described by version (see signatures()); DATA comes from body.
+        """
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            block_size = int(block_size)
+            total = int(total)
+            
+            with open(filepath, 'rb') as base:
+                st = os.fstat(base.fileno())
+                if [st.st_ino, st.st_mtime_ns, st.st_size] != list(version or []):
+                    return dict(status='ERROR', data=f"File {filename} changed since its signatures were taken")
+                blocks = -(-st.st_size // block_size)
+                
+                fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                               prefix=f".{os.path.basename(filepath)}.", suffix='.tmp')
+                os.fchmod(fd, 0o644)
+                try:
+                    with os.fdopen(fd, 'wb', buffering=0) as fp:
+                        size = 0
+                        copied = 0
+                        op = bytearray(1)
+                        while body.readinto(op):
+                            if op[0] == DELTA_OP_COPY:
+                                _, index, count = DELTA_COPY.unpack(op + read_exact(body, DELTA_COPY.size - 1))
+                                if index + count > blocks:
+                                    raise ValueError(f"Copy of blocks {index}-{index + count} is beyond the file")
+                                start = index * block_size
+                                length = min(count * block_size, st.st_size - start)
+                                self._copy_range(base, fp, start, length)
+                                copied += length
+                            elif op[0] == DELTA_OP_DATA:
+                                _, length = DELTA_DATA.unpack(op + read_exact(body, DELTA_DATA.size - 1))
+                                self._copy_exact(body, fp, length)
+                            else:
+                                raise ValueError(f"Unknown delta instruction {op[0]}")
+                            size += length
+                            if size > total:
+                                raise ValueError(f"Delta is larger than the declared {total} bytes")
+                        if size != total:
+                            raise ValueError(f"Incomplete delta: {size} of {total} bytes")
+                    self._install(tmppath, filepath)
+                except BaseException:
+                    os.remove(tmppath)
+                    raise
+            
+            self.storage.touch(filename, filepath)
+            logging.debug("File %s rebuilt from delta, %d of %d bytes sent", filename, total - copied, total)
+            return dict(status='OK', data='File uploaded successfully', copied=copied, literal=total - copied)
+        
+        except Exception as e:
+            logging.error(f"Error in apply_delta: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def _copy_exact(self, body, fp, length):
+        """Copy exactly length bytes of a request body into fp"""
+        view = memoryview(bytearray(min(length, CHUNK_SIZE)))
+        while length > 0:
+            n = body.readinto(view[:min(length, len(view))])
+            if not n:
+                raise ValueError(f"Body ended {length} bytes early")
+            fp.write(view[:n])
+            length -= n
+    
+    def _copy_range(self, src, dst, offset, length):
+        """Copy length bytes at offset of src to the current position of the unbuffered dst"""
+        if hasattr(os, 'copy_file_range'):
+            while length > 0:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), length, offset)
+                if not n:
+                    raise ValueError("Base file shrank during the delta upload")
+                offset += n
+                length -= n
+            return
+        src.seek(offset)
+        while length > 0:
+            chunk = src.read(min(length, CHUNK_SIZE))
+            if not chunk:
+                raise ValueError("Base file shrank during the delta upload")
+            dst.write(chunk)
+            length -= len(chunk)
+    
+    def upload(self, params=[]):
+        try:
+            if len(params) < 2:
+                return dict(status='ERROR', data='Insufficient parameters')
+            
+            filename = params[0]
+            filedata_b64 = params[1]
+            
+            logging.debug("Uploading file: %s, base64 length: %d", filename, len(filedata_b64))
+            
+            # Decode base64 data
+            try:
+                filedata = base64.b64decode(filedata_b64)
+            except Exception as e:
+                logging.error(f"Base64 decode error: {e}")
+                return dict(status='ERROR', data='Invalid base64 data')
+            
+            self._write_file(filename, filedata)
+            
+            logging.debug("File %s uploaded successfully, size: %d bytes", filename, len(filedata))
+            return dict(status='OK', data='File uploaded successfully')
+        
+        except Exception as e:
+            logging.error(f"Error in upload: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def upload_stream(self, params, body, offset=0, total=None):
+        """Stream an upload body (anything with readinto) to disk.
+        
+        Without total the body goes to a private temp file that is renamed into
+        place. With total the upload is resumable: the body is written at offset
+        into a hidden .<name>.part file that survives a dropped connection (see
+        stat()), and the file is renamed into place once it holds total bytes.
+        """
+        upload = self.open_upload(params, offset, total)
+        if isinstance(upload, dict):
+            return upload
+        try:
+            try:
+                self._copy_body(body, upload)
+                return upload.finish()
+            except BaseException:
+                upload.abort()
+                raise
+        except Exception as e:
+            logging.error(f"Error in upload_stream: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def open_upload(self, params, offset=0, total=None):
+        """Start an upload whose body is fed to it a piece at a time; returns an Upload or an error dict"""
+        try:
+            if not params:
+                return dict(status='ERROR', data='No filename provided')
+            
+            filename = params[0]
+            filepath = self.storage.path(filename)
+            offset = int(offset or 0)
+            
+            fd = None
+            if total is not None:
+                total = int(total)
+                partpath = self._partial_path(filepath)
+                fd = self._lock_partial(partpath)
+                if fd is None and offset:
+                    return dict(status='ERROR', data=f"Upload of {filename} already in progress")
+                if fd is not None and offset > os.fstat(fd).st_size:
+                    os.close(fd)
+                    return dict(status='ERROR', data=f"Offset {offset} is beyond the partial upload")
+            
+            resumable = fd is not None
+            if not resumable:
+                # Plain upload, or the partial file is busy with another upload of the same name
+                offset = 0
+                fd, partpath = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                                prefix=f".{os.path.basename(filepath)}.", suffix='.tmp')
+                os.fchmod(fd, 0o644)
+            return Upload(self, filename, filepath, partpath, fd, offset, total, resumable)
+        
+        except Exception as e:
+            logging.error(f"Error in open_upload: {str(e)}")
+            return dict(status='ERROR', data=str(e))
+    
+    def _copy_body(self, body, fp, digest=None):
+        """Copy a request body into fp (a file or an Upload) through one preallocated buffer; returns the byte count"""
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        size = 0
+        while True:
+            n = body.readinto(view)
+            if not n:
+                break
+            fp.write(view[:n])
+            if digest is not None:
+                digest.update(view[:n])
+            size += n
+        return size
+    
+    def _install(self, tmppath, filepath, sha256=None):
+        """Rename a completely written temp file to filepath, through the content store if enabled.
+        
+        Readers see either the old file or the complete new one. Unless the
+        durability policy is 'none', the data is synced before the rename and
+        the directory after it, so a crash cannot leave a torn file behind.
+        """
+        dirs = [os.path.dirname(filepath)]
+        if self.store is not None:
+            sha256 = sha256 or file_sha256(tmppath)
+            dirs.append(self.store.objects_dir(filepath))
+        if self.durability == 'group':
+            fd = os.open(tmppath, os.O_RDONLY)
+            try:
+                deduplicated = self.group_commit.commit(fd, lambda: self._rename(tmppath, filepath, sha256), dirs)
+            finally:
+                os.close(fd)
+        else:
+            self._sync_path(tmppath)
+            deduplicated = self._rename(tmppath, filepath, sha256)
+            for path in dirs:
+                self._sync_path(path)
+        if deduplicated:
+            logging.debug("Content of %s was already stored, deduplicated", os.path.basename(filepath))
+    
+    def _rename(self, tmppath, filepath, sha256):
+        """Move tmppath into place; True if the content store already had its content"""
+        if self.store is None:
+            os.replace(tmppath, filepath)
+            deduplicated = False
+        else:
+            deduplicated = self.store.commit(tmppath, sha256, filepath)
+        # The version check would miss the old entries anyway; drop them now instead of at eviction
+        self.cache.invalidate(filepath)
+        return deduplicated
+    
+    def _sync_path(self, path):
+        """Flush a file or directory according to the durability policy"""
+        if self.durability == 'none':
+            return
+        if self.durability == 'group':
+            self.group_commit.commit(dirs=[path])
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    
+    def _partial_path(self, filepath):
+        return os.path.join(os.path.dirname(filepath), f".{os.path.basename(filepath)}.part")
+    
+    def _lock_partial(self, partpath):
+        """Open and exclusively lock a partial upload file; None if another upload holds it"""
+        while True:
+            fd = os.open(partpath, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                if os.stat(partpath).st_ino == os.fstat(fd).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            # The previous holder completed and renamed it away; open the new one
+            os.close(fd)
+    
+    def _read_path(self, filepath):
+        with open(filepath, 'rb') as fp:
+            return fp.read()
+    
+    def _write_file(self, filename, filedata):
+        filepath = self.storage.path(filename)
+        
+        # Never rewrite in place: a concurrent GET would see a half-written file,
+        # and with the content store the inode may be a shared object
+        fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                       prefix=f".{os.path.basename(filepath)}.", suffix='.tmp')
+        os.fchmod(fd, 0o644)
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(filedata)
+            self._install(tmppath, filepath, hashlib.sha256(filedata).hexdigest() if self.store is not None else None)
+        except BaseException:
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+            raise
+        self.storage.touch(filename, filepath)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    f = FileInterface()
+    print(f.list())
+    print(f.get(['10mb.mp4']))
+    print(f.upload(['test.txt', base64.b64encode(b'test data').decode()]))
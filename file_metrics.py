@@ -0,0 +1,277 @@
+# file_metrics.py - Low-overhead request counters and latency histograms for the server
+import os
+import json
+import time
+import bisect
+import cProfile
+import itertools
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Latency bucket upper bounds in seconds: 50us doubling up to ~105s, plus +inf
+LATENCY_BOUNDS = [0.00005 * 2 ** i for i in range(22)]
+
+class Histogram:
+    """Fixed log-scale histogram; percentiles are estimated from bucket bounds"""
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+    
+    def record(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+    
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                # Interpolate inside the bucket, never beyond the largest value seen
+                low = self.bounds[i - 1] if i else 0.0
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(low + (high - low) * (rank - (seen - n)) / n, self.max)
+        return self.max
+    
+    def snapshot(self, scale=1000.0):
+        """Summary in milliseconds (scale=1000), with the bucket counts so snapshots can be diffed"""
+        return dict(count=self.count,
+                    mean=round(self.total / self.count * scale, 3) if self.count else 0.0,
+                    p50=round(self.percentile(50) * scale, 3),
+                    p95=round(self.percentile(95) * scale, 3),
+                    p99=round(self.percentile(99) * scale, 3),
+                    max=round(self.max * scale, 3),
+                    buckets=list(self.counts))
+    
+    def add(self, snapshot, sign=1, scale=1000.0):
+        """Add (sign=-1: subtract) the values recorded in a snapshot() of a histogram with the same bounds.
+        
+        after.add(before, -1) leaves what was recorded between two snapshots;
+        adding snapshots of several processes merges them. The maximum is only
+        known per snapshot, so it becomes the top of the highest bucket in use,
+        capped at the largest maximum added.
+        """
+        for i, n in enumerate(snapshot.get('buckets', ())):
+            self.counts[i] += sign * n
+        self.count += sign * snapshot['count']
+        self.total += sign * snapshot['mean'] * snapshot['count'] / scale
+        top = max((i for i, n in enumerate(self.counts) if n > 0), default=None)
+        if sign > 0:
+            self.max = max(self.max, snapshot['max'] / scale)
+        if top is None:
+            self.max = 0.0
+        elif top < len(self.bounds):
+            self.max = min(self.max, self.bounds[top])
+
+class CommandStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram()
+    
+    def snapshot(self):
+        return dict(count=self.count, errors=self.errors, bytes_in=self.bytes_in, bytes_out=self.bytes_out,
+                    latency_ms=self.latency.snapshot())
+
+class Metrics:
+    """Per-command request counters and histograms, plus connection and executor queue stats.
+    
+    One instance per server process; every update is a few integer operations
+    under a single lock, cheap next to a socket round trip.
+    """
+    def __init__(self):
+        self.started = time.time()
+        self.commands = {}
+        self.queue_wait = Histogram()
+        self.active_connections = 0
+        self.total_connections = 0
+        self.connection_errors = 0
+        self.sources = {}  # name -> callable returning a dict, e.g. admission control state
+        self.lock = threading.Lock()
+    
+    def request(self, command, latency, bytes_in=0, bytes_out=0, error=False):
+        command = str(command or '').upper() or 'UNKNOWN'
+        with self.lock:
+            stats = self.commands.get(command)
+            if stats is None:
+                stats = self.commands[command] = CommandStats()
+            stats.count += 1
+            stats.errors += bool(error)
+            stats.bytes_in += bytes_in
+            stats.bytes_out += bytes_out
+            stats.latency.record(latency)
+    
+    def queued(self, wait):
+        """Time a connection or request waited for an executor thread"""
+        with self.lock:
+            self.queue_wait.record(wait)
+    
+    def connection_opened(self):
+        with self.lock:
+            self.active_connections += 1
+            self.total_connections += 1
+    
+    def connection_closed(self, error=False):
+        with self.lock:
+            self.active_connections -= 1
+            self.connection_errors += bool(error)
+    
+    def add_source(self, name, source):
+        """Include source() in every snapshot under name"""
+        self.sources[name] = source
+    
+    def snapshot(self):
+        with self.lock:
+            snapshot = dict(pid=os.getpid(), uptime=round(time.time() - self.started, 3),
+                            connections=dict(active=self.active_connections, total=self.total_connections,
+                                             errors=self.connection_errors),
+                            queue_wait_ms=self.queue_wait.snapshot(),
+                            commands={name: stats.snapshot() for name, stats in sorted(self.commands.items())})
+        for name, source in list(self.sources.items()):
+            snapshot[name] = source()
+        return snapshot
+    
+    def dump(self, path, extra=None):
+        """Write a JSON snapshot to path atomically"""
+        data = self.snapshot()
+        if extra:
+            data.update(extra)
+        tmppath = f"{path}.{os.getpid()}.tmp"
+        with open(tmppath, 'w') as fp:
+            json.dump(data, fp, indent=2)
+        os.replace(tmppath, path)
+
+class Trace:
+    """Stage timings of one request; only created while instrumentation is on.
+    
+    mark(stage) charges the time since the previous mark to stage, so a stage
+    that happens in several pieces (e.g. receiving a streamed body) adds up.
+    """
+    __slots__ = ('stages', 'last', 'sampled', 'profile', 'command', 'status')
+    
+    def __init__(self, sampled=False):
+        self.stages = {}
+        self.last = time.perf_counter()
+        self.sampled = sampled
+        self.profile = None  # path of the cProfile dump, for a sampled request
+        self.command = None
+        self.status = None
+    
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+class Instrumentation:
+    """Per-stage request timings, hooks, and sampled profiling for the server.
+    
+    While no hook is registered and sampling is off, begin() returns None and
+    the request path skips every other call. Hooks are called with each
+    finished Trace. With sample_every=N, the protocol work (parse, execute,
+    encode) of every Nth request runs under cProfile, and under tracemalloc
+    if trace_memory is set; the results are written to profile_dir.
+    """
+    def __init__(self, sample_every=0, profile_dir='profiles', trace_memory=False):
+        self.hooks = []
+        self.stage_latency = {}
+        self.requests = 0
+        self.captured = 0
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.capturing = threading.Lock()  # the profilers are process-wide: one capture at a time
+        self.configure(sample_every, profile_dir, trace_memory)
+    
+    def configure(self, sample_every=0, profile_dir='profiles', trace_memory=False):
+        self.sample_every = sample_every
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.enabled = bool(self.hooks or sample_every)
+    
+    def add_hook(self, hook):
+        """Call hook(trace) after every request"""
+        self.hooks.append(hook)
+        self.enabled = True
+    
+    def begin(self):
+        if not self.enabled:
+            return None
+        return Trace(bool(self.sample_every) and next(self.counter) % self.sample_every == 0)
+    
+    def end(self, trace, command, status):
+        trace.command = str(command or '').upper() or 'UNKNOWN'
+        trace.status = status
+        with self.lock:
+            self.requests += 1
+            for stage, elapsed in trace.stages.items():
+                histogram = self.stage_latency.get(stage)
+                if histogram is None:
+                    histogram = self.stage_latency[stage] = Histogram()
+                histogram.record(elapsed)
+        if trace.profile:
+            timings = ', '.join(f"{stage} {elapsed * 1000:.2f}ms" for stage, elapsed in trace.stages.items())
+            logging.warning(f"Profiled {trace.command} request ({timings}) into {trace.profile}")
+        for hook in self.hooks:
+            try:
+                hook(trace)
+            except Exception as e:
+                logging.error(f"Instrumentation hook failed: {e}")
+    
+    @contextmanager
+    def capture(self, trace):
+        """Profile the calling thread while the block runs, unless another capture is in progress"""
+        if not self.capturing.acquire(blocking=False):
+            yield
+            return
+        try:
+            memory = self.trace_memory and not tracemalloc.is_tracing()
+            if memory:
+                tracemalloc.start()
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+                # Allocations of requests running concurrently on other threads show up too
+                snapshot = tracemalloc.take_snapshot() if memory else None
+                peak = tracemalloc.get_traced_memory()[1] if memory else 0
+                if memory:
+                    tracemalloc.stop()
+                self.write_capture(trace, profile, snapshot, peak)
+        finally:
+            self.capturing.release()
+    
+    def write_capture(self, trace, profile, snapshot, peak):
+        with self.lock:
+            self.captured += 1
+            number = self.captured
+        path = os.path.join(self.profile_dir, f"request-{os.getpid()}-{number}")
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile.dump_stats(path + '.prof')
+            if snapshot is not None:
+                with open(path + '.mem.txt', 'w') as fp:
+                    fp.write(f"peak traced memory: {peak} bytes\n")
+                    for stat in snapshot.statistics('lineno')[:25]:
+                        fp.write(f"{stat}\n")
+            trace.profile = path + '.prof'
+        except OSError as e:
+            logging.error(f"Failed to write profile to {path}: {e}")
+    
+    def stats(self):
+        with self.lock:
+            return dict(enabled=self.enabled, requests=self.requests, sample_every=self.sample_every,
+                        captured=self.captured,
+                        stages_ms={stage: histogram.snapshot() for stage, histogram in self.stage_latency.items()})
@@ -1,51 +1,452 @@
-# file_protocol.py - Same as before, no changes needed
-import json
-import logging
-import shlex
-from file_interface import FileInterface
-
-class FileProtocol:
-    def __init__(self):
-        self.file = FileInterface()
-    
-    def proses_string(self, string_datamasuk=''):
-        try:
-            logging.warning(f"Processing command of length: {len(string_datamasuk)}")
-            
-            # Handle UPLOAD command specially due to base64 content
-            if string_datamasuk.upper().startswith('UPLOAD'):
-                parts = string_datamasuk.split(' ', 2)
-                if len(parts) >= 3:
-                    command = parts[0].strip().lower()
-                    filename = parts[1].strip()
-                    filedata = parts[2].strip()
-                    params = [filename, filedata]
-                else:
-                    return json.dumps(dict(status='ERROR', data='Invalid UPLOAD command format'))
-            else:
-                c = shlex.split(string_datamasuk)
-                if not c:
-                    return json.dumps(dict(status='ERROR', data='Empty command'))
-                command = c[0].strip().lower()
-                params = c[1:] if len(c) > 1 else []
-            
-            logging.warning(f"Processing request: {command} with {len(params)} params")
-            
-            if not hasattr(self.file, command):
-                return json.dumps(dict(status='ERROR', data=f'Unknown command: {command}'))
-            
-            method = getattr(self.file, command)
-            result = method(params)
-            return json.dumps(result)
-            
-        except Exception as e:
-            logging.error(f"Error processing command: {e}")
-            return json.dumps(dict(status='ERROR', data=f'Processing error: {str(e)}'))
-
-if __name__ == '__main__':
-    import base64
-    logging.basicConfig(level=logging.WARNING)
-    fp = FileProtocol()
-    print(fp.proses_string("LIST"))
-    print(fp.proses_string("GET 10mb.mp4"))
-    print(fp.proses_string("UPLOAD test.txt " + base64.b64encode(b'test data').decode()))
\ No newline at end of file
+# file_protocol.py - Parses legacy text commands and binary (v2) requests and dispatches them to FileInterface
+import io
+import os
+import json
+import logging
+import shlex
+import struct
+import zlib
+import lzma
+from file_interface import FileInterface, FileRegion, CHUNK_SIZE, read_exact
+
+# Binary protocol (v2). A v2 request starts with PROTOCOL_V2_MAGIC where a legacy
+# request has its 4-byte command length (the value is far above any sane legacy
+# length), followed by a 4-byte header length, a small JSON header and then
+# header['size'] raw body bytes. Responses use the same layout minus the magic.
+PROTOCOL_V2_MAGIC = b'\xffFP2'
+MAX_HEADER_SIZE = 64 * 1024
+MAX_LEGACY_MESSAGE = 256 * 1024 * 1024  # longest legacy command: a 100 MB upload is about 134 MB of base64
+# FileInterface methods a legacy text command may call; everything else is unknown
+LEGACY_COMMANDS = ('list', 'get', 'upload')
+BUSY_RETRY_AFTER = 0.5  # seconds a client should wait before retrying a BUSY request
+
+def pack_header(header):
+    """Encode a v2 header as 4-byte length + compact JSON"""
+    data = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return struct.pack('!I', len(data)) + data
+
+def unpack_header(data):
+    return json.loads(data.decode('utf-8'))
+
+# Chunked transfer encoding. A body sent with header['chunked'] (and an optional
+# header['encoding'] codec) is a sequence of frames: 1-byte flag, 4-byte length,
+# data. CHUNK_COMPRESSED frames hold one independently compressed chunk of at
+# most CHUNK_SIZE bytes, CHUNK_RAW frames hold it as is, and a zero-length
+# frame ends the body. Codecs are negotiated with HELLO / accept_encoding.
+CHUNK_RAW = 0
+CHUNK_COMPRESSED = 1
+END_CHUNK = struct.pack('!BI', CHUNK_RAW, 0)
+MIN_COMPRESSION_RATIO = 0.9  # a compressed chunk must be at least 10% smaller to be worth it
+
+def _decompressor(factory):
+    def decompress(data):
+        d = factory()
+        out = d.decompress(data, CHUNK_SIZE)
+        if not d.eof:
+            raise ValueError("Compressed chunk is truncated or larger than CHUNK_SIZE")
+        return out
+    return decompress
+
+CODECS = {
+    'zlib': (lambda data: zlib.compress(data, 1), _decompressor(zlib.decompressobj)),
+    'lzma': (lambda data: lzma.compress(data, preset=1), _decompressor(lzma.LZMADecompressor)),
+}
+
+def decode_chunk(flag, data, codec):
+    """The plain bytes of one chunked frame's data"""
+    if flag != CHUNK_COMPRESSED:
+        return data
+    if codec not in CODECS:
+        raise ValueError(f"Unsupported encoding: {codec}")
+    return CODECS[codec][1](data)
+
+def choose_codec(accepted):
+    """First codec in the peer's preference list that we support, or None"""
+    for codec in accepted or []:
+        if codec in CODECS:
+            return codec
+    return None
+
+class ChunkEncoder:
+    """Compresses chunks one at a time, falling back to raw for chunks that do not shrink.
+    
+    After a run of incompressible chunks (media, archives) it stops trying and
+    only probes every SKIP_CHUNKS chunks, so such data costs almost no CPU.
+    """
+    MAX_MISSES = 4
+    SKIP_CHUNKS = 16
+    
+    def __init__(self, codec):
+        self.compress = CODECS[codec][0] if codec else None
+        self.misses = 0
+        self.skip = 0
+    
+    def encode(self, chunk):
+        """One frame for chunk (bytes-like, at most CHUNK_SIZE bytes)"""
+        if self.compress is not None and not self.skip:
+            data = self.compress(chunk)
+            if len(data) < len(chunk) * MIN_COMPRESSION_RATIO:
+                self.misses = 0
+                return struct.pack('!BI', CHUNK_COMPRESSED, len(data)) + data
+            self.misses += 1
+            if self.misses >= self.MAX_MISSES:
+                self.skip = self.SKIP_CHUNKS
+        elif self.skip:
+            self.skip -= 1
+        return struct.pack('!BI', CHUNK_RAW, len(chunk)) + chunk
+
+class EncodedPayload:
+    """Chunked (and per chunk compressed) form of a response payload; iterates over wire frames"""
+    def __init__(self, payload, codec):
+        self.payload = payload
+        self.encoder = ChunkEncoder(codec)
+        self.frames = self._frames()
+        self.produced = 0
+    
+    def _frames(self):
+        payload = self.payload
+        if isinstance(payload, FileRegion):
+            payload.fileobj.seek(payload.offset)
+            remaining = payload.length
+            while remaining > 0:
+                chunk = payload.fileobj.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break  # file shrank; the client notices the short body
+                remaining -= len(chunk)
+                yield self.encoder.encode(chunk)
+        else:
+            view = memoryview(payload)
+            for start in range(0, len(view), CHUNK_SIZE):
+                yield self.encoder.encode(view[start:start + CHUNK_SIZE])
+        yield END_CHUNK
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        frame = next(self.frames)
+        self.produced += len(frame)
+        return frame
+    
+    def __len__(self):
+        """Bytes of frames produced so far (the encoded size is only known at the end)"""
+        return self.produced
+    
+    def close(self):
+        close_payload(self.payload)
+
+# Batch commands. MGET's response body and MUPLOAD's request body are a stream
+# of entries, each a pack_header() JSON entry header followed by entry['size']
+# bytes of file content, ended by a zero header length (END_ENTRY).
+END_ENTRY = struct.pack('!I', 0)
+
+class BatchPayload:
+    """MGET response body, produced one file at a time.
+    
+    Iterating yields entry headers (bytes) and file contents (memoryviews or
+    FileRegions), so the first file is on the wire before the last is opened.
+    """
+    def __init__(self, file, filenames):
+        self.file = file
+        self.filenames = filenames
+        self.current = None
+        self.parts = self._parts()
+        self.produced = 0
+    
+    def _parts(self):
+        for filename in self.filenames:
+            result = self.file.get_stream([filename])
+            data = result.pop('data_file', b'')
+            entry = dict(name=filename, status=result['status'], size=len(data))
+            if result['status'] == 'OK':
+                entry['mtime'] = result['mtime']
+            else:
+                entry['data'] = result.get('data')
+            yield pack_header(entry)
+            if len(data):
+                self.current = data
+                yield data
+                self.current = None
+        yield END_ENTRY
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        part = next(self.parts)
+        self.produced += len(part)
+        return part
+    
+    def __len__(self):
+        return self.produced
+    
+    def close(self):
+        close_payload(self.current)
+        self.parts.close()
+
+class LimitedReader:
+    """The next size bytes of another reader, e.g. one file of a MUPLOAD body"""
+    def __init__(self, raw, size):
+        self.raw = raw
+        self.remaining = size
+    
+    def readinto(self, view):
+        if self.remaining <= 0:
+            return 0
+        n = self.raw.readinto(view[:min(len(view), self.remaining)])
+        if not n:
+            raise ConnectionError(f"Body ended {self.remaining} bytes early")
+        self.remaining -= n
+        return n
+    
+    def discard(self):
+        buf = memoryview(bytearray(min(self.remaining, CHUNK_SIZE)))
+        while self.readinto(buf):
+            pass
+
+def close_payload(payload):
+    """Release a payload that will not be (fully) sent"""
+    if hasattr(payload, 'close'):
+        payload.close()
+
+class BodyReader:
+    """File-like view of a v2 request body still sitting in the socket.
+    
+    size None means the length is not known up front (a chunked body), and
+    reads are only bounded by the ChunkedReader wrapped around this reader.
+    """
+    def __init__(self, connection, size):
+        self.connection = connection
+        self.remaining = size
+        self.received = 0
+    
+    def readinto(self, view):
+        """Receive up to len(view) body bytes into view; returns 0 once the body is consumed"""
+        if self.remaining is None:
+            n = self.connection.recv_into(view, len(view))
+            if not n:
+                raise ConnectionError("Connection closed in the middle of a chunked body")
+            self.received += n
+            return n
+        if self.remaining <= 0:
+            return 0
+        n = self.connection.recv_into(view, min(len(view), self.remaining))
+        if not n:
+            raise ConnectionError(f"Connection closed with {self.remaining} body bytes outstanding")
+        self.remaining -= n
+        self.received += n
+        return n
+    
+    def discard(self):
+        """Drop whatever the handler did not consume"""
+        buf = memoryview(bytearray(min(self.remaining, CHUNK_SIZE)))
+        while self.readinto(buf):
+            pass
+
+class ChunkedReader:
+    """Decodes a chunked, optionally compressed body from a raw reader; readinto gives the plain bytes"""
+    def __init__(self, raw, codec=None):
+        self.raw = raw
+        self.codec = codec
+        self.chunk = memoryview(b'')
+        self.done = False
+    
+    @property
+    def remaining(self):
+        return 0 if self.done else 1
+    
+    def _next_chunk(self):
+        flag, length = struct.unpack('!BI', read_exact(self.raw, 5))
+        if length > 2 * CHUNK_SIZE:
+            raise ValueError(f"Chunk of {length} bytes exceeds the protocol limit")
+        if length == 0:
+            self.done = True
+            return
+        self.chunk = memoryview(decode_chunk(flag, read_exact(self.raw, length), self.codec))
+    
+    def readinto(self, view):
+        while not self.chunk and not self.done:
+            self._next_chunk()
+        n = min(len(view), len(self.chunk))
+        view[:n] = self.chunk[:n]
+        self.chunk = self.chunk[n:]
+        return n
+    
+    def discard(self):
+        while not self.done:
+            self._next_chunk()
+
+def request_body(header, raw):
+    """Wrap the raw body reader according to the request's transfer encoding"""
+    if header.get('chunked'):
+        return ChunkedReader(raw, header.get('encoding'))
+    return raw
+
+def busy_response(retry_after=BUSY_RETRY_AFTER):
+    """Response for a request the server refused under load; the client should retry later"""
+    return dict(status='BUSY', data='Server busy, retry later', retry_after=retry_after)
+
+class FileProtocol:
+    def __init__(self, metrics=None):
+        self.file = FileInterface()
+        self.metrics = metrics
+    
+    def stats(self):
+        """Server metrics (if the server keeps them) and file cache counters, for STATS"""
+        stats = self.metrics.snapshot() if self.metrics is not None else {}
+        stats['cache'] = self.file.cache.stats()
+        return stats
+    
+    def legacy_response_size(self, string_datamasuk):
+        """Approximate size of a legacy GET response (the whole file as base64 in JSON); 0 for other commands"""
+        # Only the start is split: splitting copies, and an UPLOAD command holds a whole file
+        parts = string_datamasuk[:MAX_HEADER_SIZE].split(None, 2)
+        if len(parts) < 2 or parts[0].lower() != 'get':
+            return 0
+        try:
+            return os.path.getsize(self.file.storage.path(parts[1])) * 4 // 3
+        except OSError:
+            return 0
+    
+    def proses_string(self, string_datamasuk='', trace=None):
+        """Process a legacy text command; returns the JSON response string.
+        
+        trace (a file_metrics.Trace, or None) gets the parse, execute and encode timings.
+        """
+        return self.proses_legacy(string_datamasuk, trace)[0]
+    
+    def proses_legacy(self, string_datamasuk='', trace=None):
+        """proses_string, also returning the response's status: (JSON string, status)"""
+        try:
+            logging.debug("Processing command of length: %d", len(string_datamasuk))
+            
+            # Handle UPLOAD command specially due to base64 content
+            if string_datamasuk.upper().startswith('UPLOAD'):
+                parts = string_datamasuk.split(' ', 2)
+                if len(parts) >= 3:
+                    command = parts[0].strip().lower()
+                    filename = parts[1].strip()
+                    filedata = parts[2].strip()
+                    params = [filename, filedata]
+                else:
+                    return json.dumps(dict(status='ERROR', data='Invalid UPLOAD command format')), 'ERROR'
+            else:
+                c = shlex.split(string_datamasuk)
+                if not c:
+                    return json.dumps(dict(status='ERROR', data='Empty command')), 'ERROR'
+                command = c[0].strip().lower()
+                params = c[1:] if len(c) > 1 else []
+            
+            logging.debug("Processing request: %s with %d params", command, len(params))
+            if trace is not None:
+                trace.mark('parse')
+            
+            if command not in LEGACY_COMMANDS:
+                return json.dumps(dict(status='ERROR', data=f'Unknown command: {command}')), 'ERROR'
+            
+            method = getattr(self.file, command)
+            result = method(params)
+            if trace is not None:
+                trace.mark('execute')
+            hasil = json.dumps(result)
+            if trace is not None:
+                trace.mark('encode')
+            return hasil, result.get('status')
+        
+        except Exception as e:
+            logging.error(f"Error processing command: {e}")
+            return json.dumps(dict(status='ERROR', data=f'Processing error: {str(e)}')), 'ERROR'
+    
+    def multi_upload(self, body):
+        """Store every file of a MUPLOAD body as it arrives; returns per-file results"""
+        results = []
+        while True:
+            length = struct.unpack('!I', read_exact(body, 4))[0]
+            if not length:
+                break
+            if length > MAX_HEADER_SIZE:
+                raise ValueError(f"Entry header too large ({length} bytes)")
+            entry = unpack_header(read_exact(body, length))
+            content = LimitedReader(body, int(entry.get('size', 0)))
+            result = self.file.upload_stream([entry.get('name', '')], content)
+            if content.remaining:
+                content.discard()  # the upload failed part way; skip to the next entry
+            results.append(dict(name=entry.get('name'), status=result['status'], data=result.get('data')))
+        return results
+    
+    def proses_request(self, header, body=b'', trace=None):
+        """Process a v2 request; returns (response header, payload).
+        
+        body is the request body as bytes or a BodyReader, so uploads can be
+        written to disk while they are still arriving. The payload is bytes, a
+        FileRegion, or (for a chunked response) an EncodedPayload; the
+        caller streams it and closes it with close_payload. trace (a
+        file_metrics.Trace, or None) gets the parse, execute and encode timings.
+        """
+        try:
+            command = str(header.get('command', '')).strip().lower()
+            params = list(header.get('params', []))
+            if isinstance(body, (bytes, bytearray)):
+                body = io.BytesIO(body)
+            
+            logging.debug("Processing binary request: %s with %d params, body: %s bytes",
+                          command, len(params), header.get('size', 0))
+            if trace is not None:
+                trace.mark('parse')
+            
+            if command == 'list':
+                result = self.file.list(params, header.get('prefix', ''), header.get('after'),
+                                        header.get('limit'), header.get('detail', False))
+            elif command == 'get':
+                result = self.file.get_stream(params, header.get('offset', 0), header.get('length'))
+            elif command == 'upload':
+                result = self.file.upload_stream(params, body, header.get('offset', 0), header.get('total'))
+            elif command == 'stat':
+                result = self.file.stat(params, header.get('checksum', False))
+            elif command == 'signatures':
+                result = self.file.signatures(params, header.get('block_size'))
+            elif command == 'delta':
+                result = self.file.apply_delta(params, body, header.get('version'), header.get('block_size'),
+                                               header.get('total'))
+            elif command == 'have':
+                result = self.file.have(params, header.get('sha256', ''))
+            elif command == 'mget':
+                # Per-file status travels in the body; the batch itself is OK
+                result = dict(status='OK', batch=True, count=len(params))
+                return result, BatchPayload(self.file, params)
+            elif command == 'mupload':
+                results = self.multi_upload(body)
+                failed = sum(1 for r in results if r['status'] != 'OK')
+                result = dict(status='OK', count=len(results), failed=failed,
+                              data_file=json.dumps(results).encode('utf-8'))
+            elif command == 'stats':
+                result = dict(status='OK', stats=self.stats())
+            elif command == 'hello':
+                result = dict(status='OK', protocol=2, codecs=list(CODECS), dedup=self.file.store is not None)
+            else:
+                result = dict(status='ERROR', data=f'Unknown command: {command}')
+            if trace is not None:
+                trace.mark('execute')
+            
+            payload = result.pop('data_file', b'')
+            codec = choose_codec(header.get('accept_encoding'))
+            if codec and len(payload):
+                # Size of the encoded body is not known up front: send it chunked
+                result.update(chunked=True, encoding=codec)
+                return result, EncodedPayload(payload, codec)
+            result['size'] = len(payload)
+            return result, payload
+        
+        except Exception as e:
+            logging.error(f"Error processing binary request: {e}")
+            return dict(status='ERROR', data=f'Processing error: {str(e)}', size=0), b''
+
+if __name__ == '__main__':
+    import base64
+    logging.basicConfig(level=logging.WARNING)
+    fp = FileProtocol()
+    print(fp.proses_string("LIST"))
+    print(fp.proses_string("GET 10mb.mp4"))
+    print(fp.proses_string("UPLOAD test.txt " + base64.b64encode(b'test data').decode()))
+    print(fp.proses_request(dict(command='UPLOAD', params=['test.txt'], size=9), b'test data'))
+    print(fp.proses_request(dict(command='GET', params=['test.txt'])))
@@ -0,0 +1,212 @@
+# file_proxy.py - TCP proxy that shapes traffic like a WAN link, for benchmarking on one machine
+import sys
+import random
+import socket
+import asyncio
+import logging
+import argparse
+import threading
+
+READ_SIZE = 64 * 1024  # largest piece forwarded at once when packets are not chunked
+PIPE_BYTES = 4 * 1024 * 1024  # bytes in flight per direction of a connection (the "bytes on the wire")
+MIN_SLEEP = 0.002  # shorter waits are batched: event loop timers are only about 1ms accurate
+
+class Link:
+    """One direction of a shaped link, shared by every connection through the proxy.
+    
+    transmit(n) waits until n bytes have been serialized at rate bytes/s after
+    everything sent before them, so concurrent connections share the bandwidth.
+    Waits under MIN_SLEEP are carried over instead of slept, so small packets
+    are paced in bursts of a few milliseconds at the right average rate.
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.free_at = 0.0
+        self.bytes = 0
+    
+    async def transmit(self, size):
+        self.bytes += size
+        if not self.rate:
+            return
+        now = asyncio.get_running_loop().time()
+        self.free_at = max(now, self.free_at) + size / self.rate
+        if self.free_at - now >= MIN_SLEEP:
+            await asyncio.sleep(self.free_at - now)
+
+class Window:
+    """Bytes in flight on one direction of a connection; reserve() waits while size of them are"""
+    def __init__(self, size):
+        self.size = size
+        self.used = 0
+        self.freed = asyncio.Event()
+    
+    async def reserve(self, n):
+        while self.used and self.used + n > self.size:
+            self.freed.clear()
+            await self.freed.wait()
+        self.used += n
+    
+    def release(self, n):
+        self.used -= n
+        self.freed.set()
+
+class ShapingProxy:
+    """Forward connections to upstream with added latency, jitter, a bandwidth cap and packet chunking.
+    
+    latency and jitter (seconds) delay every piece of data one way: each piece
+    arrives latency +/- jitter after it was sent, never before the piece in
+    front of it, as on a TCP connection. bandwidth (bytes/s) caps each
+    direction of the link, shared by all connections. chunk_size splits the
+    stream into pieces of at most that many bytes, each written separately,
+    like packets of a small MTU. Each direction of a connection holds at
+    most PIPE_BYTES in flight, or twice the bandwidth-delay product if that
+    is more. start() serves from a background thread and sets address to
+    where clients should connect.
+    """
+    def __init__(self, upstream, port=0, host='127.0.0.1', latency=0.0, jitter=0.0, bandwidth=None, chunk_size=None):
+        self.upstream = upstream
+        self.address = (host, port)
+        self.latency = latency
+        self.jitter = min(jitter, latency)  # a piece never arrives before it was sent
+        self.chunk_size = chunk_size
+        self.up = Link(bandwidth)  # client -> server
+        self.down = Link(bandwidth)  # server -> client
+        self.connections = 0
+        self.active = {}  # handler task -> its two writers, closed on stop
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.stopped = None
+        self.error = None  # why serve() could not start
+    
+    def __repr__(self):
+        rate = f"{self.up.rate * 8 / 1e6:g}Mbit/s" if self.up.rate else "unlimited"
+        return (f"ShapingProxy({self.address[0]}:{self.address[1]} -> {self.upstream[0]}:{self.upstream[1]}, "
+                f"{self.latency * 1000:g}ms +/- {self.jitter * 1000:g}ms, {rate}, chunk {self.chunk_size})")
+    
+    def start(self):
+        """Start serving in a daemon thread; returns once the proxy is listening"""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.serve(ready),), daemon=True)
+        self.thread.start()
+        ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            raise self.error
+        return self.address
+    
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+            self.thread.join(timeout=10)
+    
+    def stats(self):
+        return dict(connections=self.connections, bytes_up=self.up.bytes, bytes_down=self.down.bytes)
+    
+    async def serve(self, ready=None):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        try:
+            self.server = await asyncio.start_server(self.handle, *self.address, backlog=1024)
+        except OSError as e:
+            self.loop = None
+            if ready is None:
+                raise
+            self.error = e  # start() raises it in the caller's thread
+            ready.set()
+            return
+        self.address = self.server.sockets[0].getsockname()[:2]
+        logging.warning(f"Proxy listening: {self}")
+        if ready is not None:
+            ready.set()
+        async with self.server:
+            await self.stopped.wait()
+            # End open connections ourselves rather than leaving asyncio.run to cancel their tasks
+            for writers in list(self.active.values()):
+                for writer in writers:
+                    writer.close()
+            await asyncio.gather(*self.active, return_exceptions=True)
+    
+    async def handle(self, client_reader, client_writer):
+        self.connections += 1
+        try:
+            server_reader, server_writer = await asyncio.open_connection(*self.upstream)
+        except OSError as e:
+            logging.error(f"Proxy cannot reach {self.upstream}: {e}")
+            client_writer.close()
+            return
+        for writer in (client_writer, server_writer):
+            writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        task = asyncio.current_task()
+        self.active[task] = (client_writer, server_writer)
+        try:
+            await asyncio.gather(self.pipe(client_reader, server_writer, self.up),
+                                 self.pipe(server_reader, client_writer, self.down))
+        except (ConnectionError, OSError) as e:
+            logging.debug("Proxied connection ended: %s", e)
+        finally:
+            del self.active[task]
+            client_writer.close()
+            server_writer.close()
+    
+    async def pipe(self, reader, writer, link):
+        """Copy one direction: read, pay for the bandwidth, then deliver after the latency"""
+        queue = asyncio.Queue()
+        window = Window(max(PIPE_BYTES, 2 * (link.rate or 0) * (self.latency + self.jitter)))
+        delivery = asyncio.create_task(self.deliver(queue, writer, window))
+        last = 0.0
+        try:
+            while data := await reader.read(self.chunk_size or READ_SIZE):
+                await window.reserve(len(data))
+                await link.transmit(len(data))
+                due = self.loop.time() + self.latency + random.uniform(-self.jitter, self.jitter)
+                last = max(last, due)
+                await queue.put((last, data))
+        finally:
+            await queue.put(None)
+            await delivery
+    
+    async def deliver(self, queue, writer, window):
+        error = None
+        while (item := await queue.get()) is not None:
+            due, data = item
+            window.release(len(data))  # out of the queue: pipe() may read on
+            if error is not None:
+                continue  # keep draining, so pipe() never blocks on a full window
+            delay = due - self.loop.time()
+            if delay >= MIN_SLEEP:
+                await asyncio.sleep(delay)
+            try:
+                writer.write(data)
+                await writer.drain()
+            except (ConnectionError, OSError) as e:
+                error = e
+        if error is not None:
+            raise error
+        # The sender finished: pass the half-close on
+        if writer.can_write_eof() and not writer.is_closing():
+            writer.write_eof()
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TCP proxy with WAN-like latency, jitter, bandwidth and packet size")
+    parser.add_argument('--listen', type=parse_address, default=('127.0.0.1', 7781))
+    parser.add_argument('--upstream', type=parse_address, default=('127.0.0.1', 7771))
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="one-way delay")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=None, help="per direction, shared by all connections")
+    parser.add_argument('--chunk', type=int, default=None, help="forward at most this many bytes per write, e.g. 1460")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    proxy = ShapingProxy(args.upstream, args.listen[1], args.listen[0], args.latency_ms / 1000, args.jitter_ms / 1000,
+                         args.bandwidth_mbps * 1e6 / 8 if args.bandwidth_mbps else None, args.chunk)
+    try:
+        asyncio.run(proxy.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
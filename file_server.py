@@ -1,147 +1,1085 @@
-# file_server.py - Fixed version with streaming support
-from socket import *
-import socket
-import logging
-import time
-import sys
-import struct
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from file_protocol import FileProtocol
-
-fp = FileProtocol()
-
-class ProcessTheClient:
-    def __init__(self, connection, address):
-        self.connection = connection
-        self.address = address
-        # Set longer timeout for large files
-        self.connection.settimeout(300.0)  # 5 minutes
-    
-    def receive_all(self, size):
-        """Receive exactly 'size' bytes from socket"""
-        data = b""
-        while len(data) < size:
-            try:
-                chunk = self.connection.recv(min(size - len(data), 8192))
-                if not chunk:
-                    break
-                data += chunk
-            except socket.timeout:
-                logging.error(f"Timeout receiving data from {self.address}")
-                break
-            except Exception as e:
-                logging.error(f"Error receiving chunk from {self.address}: {e}")
-                break
-        return data
-    
-    def send_all(self, data):
-        """Send all data, handling partial sends"""
-        total_sent = 0
-        while total_sent < len(data):
-            try:
-                sent = self.connection.send(data[total_sent:])
-                if sent == 0:
-                    raise RuntimeError("Socket connection broken")
-                total_sent += sent
-            except Exception as e:
-                logging.error(f"Error sending data to {self.address}: {e}")
-                return False
-        return True
-    
-    def process(self):
-        try:
-            # First, receive the command length (4 bytes)
-            length_data = self.receive_all(4)
-            if len(length_data) != 4:
-                logging.error(f"Failed to receive command length from {self.address}")
-                return
-            
-            command_length = struct.unpack('!I', length_data)[0]
-            logging.warning(f"Expecting command of length {command_length} from {self.address}")
-            
-            # Receive the full command
-            command_data = self.receive_all(command_length)
-            if len(command_data) != command_length:
-                logging.error(f"Failed to receive full command from {self.address}")
-                return
-            
-            command_str = command_data.decode('utf-8')
-            logging.warning(f"Received command from {self.address}: {command_str[:100]}...")
-            
-            # Process the command
-            hasil = fp.proses_string(command_str)
-            response_data = hasil.encode('utf-8')
-            
-            # Send response length first
-            response_length = len(response_data)
-            length_bytes = struct.pack('!I', response_length)
-            
-            if not self.send_all(length_bytes):
-                return
-            
-            # Send response data
-            if not self.send_all(response_data):
-                return
-            
-            logging.warning(f"Sent response to {self.address}, length: {response_length}")
-            
-        except Exception as e:
-            logging.error(f"Error processing client {self.address}: {e}")
-        finally:
-            try:
-                self.connection.close()
-            except:
-                pass
-
-class Server:
-    def __init__(self, ipaddress='0.0.0.0', port=7777, max_workers=5, pool_type='thread'):
-        self.ipinfo = (ipaddress, port)
-        self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.my_socket.settimeout(1.0)
-        self.pool_type = pool_type
-        self.max_workers = max_workers
-        self.executor = None
-        self.running = True
-    
-    def start(self):
-        logging.warning(f"Server running at {self.ipinfo} with {self.pool_type} pool, max_workers={self.max_workers}")
-        self.my_socket.bind(self.ipinfo)
-        self.my_socket.listen(50)
-        
-        if self.pool_type == 'thread':
-            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
-        elif self.pool_type == 'process':
-            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
-        
-        while self.running:
-            try:
-                connection, client_address = self.my_socket.accept()
-                logging.warning(f"Connection from {client_address}")
-                client_handler = ProcessTheClient(connection, client_address)
-                self.executor.submit(client_handler.process)
-            except socket.timeout:
-                continue
-            except Exception as e:
-                if self.running:
-                    logging.error(f"Server error: {e}")
-    
-    def stop(self):
-        self.running = False
-        if self.executor:
-            self.executor.shutdown(wait=True)
-        self.my_socket.close()
-
-def main(max_workers=5, pool_type='thread'):
-    svr = Server(ipaddress='0.0.0.0', port=7771, max_workers=max_workers, pool_type=pool_type)
-    try:
-        svr.start()
-    except KeyboardInterrupt:
-        svr.stop()
-
-if __name__ == "__main__":
-    import sys
-    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 5
-    pool_type = sys.argv[2] if len(sys.argv) > 2 else 'thread'
-    logging.basicConfig(level=logging.WARNING)
-    main(max_workers, pool_type)
\ No newline at end of file
+# file_server.py - Fixed version with streaming support
+from socket import *
+import socket
+import logging
+import time
+import sys
+import struct
+import json
+import select
+import selectors
+import asyncio
+import io
+import os
+import stat
+import signal
+import multiprocessing
+import multiprocessing.connection
+import threading
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from file_protocol import (FileProtocol, BodyReader, CHUNK_SIZE, PROTOCOL_V2_MAGIC, MAX_HEADER_SIZE,
+                           MAX_LEGACY_MESSAGE, pack_header, unpack_header, request_body, close_payload, busy_response,
+                           decode_chunk)
+from file_interface import FileRegion, StorageLayout
+from file_metrics import Metrics, Instrumentation
+from file_framing import recv_exact, send_buffers, send_with_fds, tune_socket, SOCKET_BUFFER_SIZE
+
+metrics = Metrics()
+instrumentation = Instrumentation()
+fp = FileProtocol(metrics)
+
+# Admission control defaults. A legacy request is buffered whole, and decoding
+# and building the reply copy it a couple of times; v2 bodies are streamed, so
+# a v2 request only holds a few CHUNK_SIZE buffers.
+DEFAULT_MAX_BUFFERED_BYTES = 1024 * 1024 * 1024
+DEFAULT_ADMISSION_BACKLOG = 128
+DEFAULT_QUEUE_TIMEOUT = 30.0
+LEGACY_COST_FACTOR = 3
+V2_REQUEST_COST = 2 * CHUNK_SIZE
+SPOOL_MEMORY_BYTES = CHUNK_SIZE  # asyncio mode: larger request bodies are spooled to disk before the handler runs
+
+class AdmissionControl:
+    """Caps concurrent requests and the bytes they may buffer.
+    
+    A request that does not fit waits in a FIFO backlog of at most backlog
+    requests for up to queue_timeout seconds; beyond that it is refused and the
+    client gets a BUSY response. A request costing more than max_bytes is
+    charged max_bytes, i.e. it only runs when nothing else holds memory. A
+    request reserves everything it will need in one admit(): waiting for more
+    while holding a reservation could wait forever.
+    """
+    def __init__(self, max_requests=None, max_bytes=DEFAULT_MAX_BUFFERED_BYTES,
+                 backlog=DEFAULT_ADMISSION_BACKLOG, queue_timeout=DEFAULT_QUEUE_TIMEOUT):
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.backlog = backlog
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.bytes = 0
+        self.waiters = deque()  # [cost, wake, granted]
+        self.admitted = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+    
+    def _cost(self, cost):
+        return min(cost, self.max_bytes) if self.max_bytes else cost
+    
+    def _fits(self, cost):
+        if self.max_requests and self.active >= self.max_requests:
+            return False
+        return not self.max_bytes or self.bytes + cost <= self.max_bytes
+    
+    def _grant(self, cost):
+        self.active += 1
+        self.bytes += cost
+        self.admitted += 1
+    
+    def _enter(self, cost, wake):
+        """Admit now (True), queue (the waiter entry) or refuse (False); called with the lock held"""
+        if not self.waiters and self._fits(cost):
+            self._grant(cost)
+            return True
+        if len(self.waiters) >= self.backlog:
+            self.rejected += 1
+            return False
+        waiter = [cost, wake, False]
+        self.waiters.append(waiter)
+        return waiter
+    
+    def _give_up(self, waiter):
+        """A waiter timed out; True if it was granted just before"""
+        with self.lock:
+            if waiter[2]:
+                return True
+            self.waiters.remove(waiter)
+            self.rejected += 1
+            self._wake_waiters()
+            return False
+    
+    def admit(self, cost):
+        """Reserve a request slot and cost bytes for the calling thread; False means reply BUSY"""
+        cost = self._cost(cost)
+        event = threading.Event()
+        with self.lock:
+            waiter = self._enter(cost, event.set)
+        if not isinstance(waiter, list):
+            return waiter
+        if event.wait(self.queue_timeout):
+            return True
+        return self._give_up(waiter)
+    
+    async def admit_async(self, cost):
+        """admit() for the event loop: waits without blocking it"""
+        cost = self._cost(cost)
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        wake = lambda: loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+        with self.lock:
+            waiter = self._enter(cost, wake)
+        if not isinstance(waiter, list):
+            return waiter
+        try:
+            return await asyncio.wait_for(granted, self.queue_timeout)
+        except asyncio.TimeoutError:
+            return self._give_up(waiter)
+    
+    def release(self, cost):
+        with self.lock:
+            self.active -= 1
+            self.bytes -= self._cost(cost)
+            self._wake_waiters()
+    
+    def _wake_waiters(self):
+        # Strict FIFO: a big request at the head is not starved by small ones behind it
+        while self.waiters and self._fits(self.waiters[0][0]):
+            waiter = self.waiters.popleft()
+            self._grant(waiter[0])
+            waiter[2] = True
+            waiter[1]()
+    
+    def stats(self):
+        with self.lock:
+            return dict(active=self.active, bytes=self.bytes, waiting=len(self.waiters),
+                        admitted=self.admitted, rejected=self.rejected,
+                        max_requests=self.max_requests, max_bytes=self.max_bytes, backlog=self.backlog)
+
+class ProcessTheClient:
+    def __init__(self, connection, address, on_idle=None, idle_timeout=60.0, admission=None):
+        self.connection = connection
+        self.address = address
+        self.admission = admission or AdmissionControl(max_bytes=None)
+        # Set longer timeout for large files
+        self.timeout = 300.0  # 5 minutes
+        self.connection.settimeout(self.timeout)
+        # Connections stay open between requests. When on_idle is set, a quiet
+        # connection is handed back to it instead of blocking this worker.
+        self.on_idle = on_idle
+        self.idle_timeout = idle_timeout
+        self.parked_at = None
+        self.queued_at = None  # when the server handed this connection to the executor
+        # Same-host clients on the unix socket may get a GET's open file instead of its bytes
+        self.passes_fds = connection.family == socket.AF_UNIX
+        metrics.connection_opened()
+    
+    def receive_all(self, size):
+        """Receive exactly 'size' bytes from socket; fewer if it closed or failed"""
+        try:
+            return recv_exact(self.connection, size)
+        except socket.timeout:
+            logging.error(f"Timeout receiving data from {self.address}")
+        except Exception as e:
+            logging.error(f"Error receiving data from {self.address}: {e}")
+        return b""
+    
+    def send_all(self, *buffers):
+        """Send the buffers back to back, in one scatter-gather write where possible"""
+        try:
+            send_buffers(self.connection, buffers)
+        except Exception as e:
+            logging.error(f"Error sending data to {self.address}: {e}")
+            return False
+        return True
+    
+    def send_file(self, region):
+        """Stream a FileRegion with os.sendfile, falling back to chunked reads"""
+        if region.length == 0:
+            return True
+        try:
+            sent = self.connection.sendfile(region.fileobj, region.offset, region.length)
+            if sent != region.length:
+                raise RuntimeError(f"File truncated while sending ({sent} of {region.length} bytes)")
+        except Exception as e:
+            logging.error(f"Error sending file to {self.address}: {e}")
+            return False
+        return True
+    
+    def send_payload(self, payload):
+        if isinstance(payload, FileRegion):
+            try:
+                return self.send_file(payload)
+            finally:
+                payload.close()
+        if isinstance(payload, (bytes, bytearray, memoryview)):
+            return self.send_all(payload)
+        # Chunked or batch response: parts are produced (read, compressed) as they are sent
+        try:
+            for part in payload:
+                if not self.send_payload(part):
+                    return False
+            return True
+        finally:
+            payload.close()
+    
+    def process(self):
+        if self.queued_at is not None:
+            metrics.queued(time.perf_counter() - self.queued_at)
+        keep_alive = False
+        error = False
+        try:
+            while self.handle_request():
+                if self.on_idle is not None and not self.data_pending():
+                    keep_alive = True
+                    break
+        except Exception as e:
+            logging.error(f"Error processing client {self.address}: {e}")
+            error = True
+        finally:
+            if keep_alive:
+                self.on_idle(self)
+            else:
+                self.close(error)
+    
+    def close(self, error=False):
+        try:
+            self.connection.close()
+        except:
+            pass
+        metrics.connection_closed(error)
+    
+    def data_pending(self):
+        """True if the client already sent (part of) its next request"""
+        readable, _, _ = select.select([self.connection], [], [], 0)
+        return bool(readable)
+    
+    def handle_request(self):
+        """Serve one framed request; returns False once the connection should be closed"""
+        # Wait for the next request; a quiet client is dropped after idle_timeout
+        self.connection.settimeout(self.idle_timeout)
+        try:
+            first = self.connection.recv(4)
+        except socket.timeout:
+            logging.warning(f"Closing idle connection from {self.address}")
+            return False
+        if not first:
+            return False
+        self.connection.settimeout(self.timeout)
+        
+        # First, receive the command length (4 bytes)
+        length_data = first + self.receive_all(4 - len(first))
+        if len(length_data) != 4:
+            logging.error(f"Failed to receive command length from {self.address}")
+            return False
+        
+        if length_data == PROTOCOL_V2_MAGIC:
+            return self.process_binary()
+        return self.process_legacy(length_data)
+    
+    def process_legacy(self, length_data):
+        """Handle a legacy request: length-prefixed text command, JSON response"""
+        trace = instrumentation.begin()
+        command_length = struct.unpack('!I', length_data)[0]
+        logging.debug("Expecting command of length %d from %s", command_length, self.address)
+        if command_length > MAX_LEGACY_MESSAGE:
+            logging.error(f"Command too long ({command_length} bytes) from {self.address}")
+            self.send_legacy_response(json.dumps(too_long_response(command_length)))
+            return False
+        
+        # A short command (every GET is one) is read first, so that a GET reserves memory for its
+        # response in the same admit(); a long one (an UPLOAD) is admitted before any of it is buffered
+        command_str = None
+        if command_length <= MAX_HEADER_SIZE:
+            command_str = self.receive_command(command_length, trace)
+            if command_str is None:
+                return False
+        cost = legacy_cost(command_length, command_str)
+        if not self.admission.admit(cost):
+            # An unread long command is not drained: answer and drop the connection
+            self.send_legacy_response(json.dumps(busy_response()))
+            return command_str is not None
+        try:
+            if trace is not None:
+                trace.mark('queue')
+            if command_str is None:
+                command_str = self.receive_command(command_length, trace)
+                if command_str is None:
+                    return False
+            return self.serve_legacy(command_length, command_str, trace)
+        finally:
+            self.admission.release(cost)
+    
+    def receive_command(self, command_length, trace=None):
+        """The text of a legacy command; None if the connection failed first"""
+        command_data = self.receive_all(command_length)
+        if len(command_data) != command_length:
+            logging.error(f"Failed to receive full command from {self.address}")
+            return None
+        
+        command_str = command_data.decode('utf-8')
+        logging.debug("Received command from %s: %.100s...", self.address, command_str)
+        if trace is not None:
+            trace.mark('receive')
+        return command_str
+    
+    def serve_legacy(self, command_length, command_str, trace=None):
+        started = time.perf_counter()
+        hasil, status = traced(trace, run_legacy_command, command_length, command_str)
+        if not self.send_legacy_response(hasil, trace):
+            return False
+        
+        record_legacy(command_str, status, time.perf_counter() - started, 4 + command_length, 4 + len(hasil), trace)
+        return True
+    
+    def send_legacy_response(self, hasil, trace=None):
+        response_data = hasil.encode('utf-8')
+        if trace is not None:
+            trace.mark('encode')
+        
+        # Length prefix and response in one write
+        response_length = len(response_data)
+        if not self.send_all(struct.pack('!I', response_length), response_data):
+            return False
+        
+        logging.debug("Sent response to %s, length: %d", self.address, response_length)
+        if trace is not None:
+            trace.mark('send')
+        return True
+    
+    def process_binary(self):
+        """Handle a protocol v2 request: small JSON header followed by raw body bytes"""
+        trace = instrumentation.begin()
+        length_data = self.receive_all(4)
+        if len(length_data) != 4:
+            logging.error(f"Failed to receive header length from {self.address}")
+            return False
+        
+        header_length = struct.unpack('!I', length_data)[0]
+        if header_length > MAX_HEADER_SIZE:
+            logging.error(f"Header too large ({header_length} bytes) from {self.address}")
+            return False
+        
+        header_data = self.receive_all(header_length)
+        if len(header_data) != header_length:
+            logging.error(f"Failed to receive full header from {self.address}")
+            return False
+        
+        if trace is not None:
+            trace.mark('receive')
+        header = unpack_header(header_data)
+        body_size = None if header.get('chunked') else int(header.get('size', 0))
+        logging.debug("Received binary request from %s: %s, body: %s bytes",
+                      self.address, header.get('command'), body_size or 0)
+        started = time.perf_counter()
+        if trace is not None:
+            trace.mark('parse')
+        
+        # The body is left in the socket; handlers pull it through the reader
+        raw = BodyReader(self.connection, body_size)
+        body = request_body(header, raw)
+        if self.admission.admit(V2_REQUEST_COST):
+            try:
+                if trace is not None:
+                    trace.mark('queue')
+                response, payload = traced(trace, fp.proses_request, header, body)
+            finally:
+                self.admission.release(V2_REQUEST_COST)
+        else:
+            # Refused before any work. Reading the body just to drop it would cost the
+            # bandwidth BUSY is meant to save: answer, and close the connection instead
+            response, payload = dict(busy_response(), size=0, close=bool(body.remaining)), b''
+        try:
+            if body.remaining and not response.get('close'):
+                body.discard()
+        except Exception:
+            close_payload(payload)
+            raise
+        if trace is not None:
+            trace.mark('receive')
+        
+        pass_fd = header.get('pass_fd') and self.passes_fds and isinstance(payload, FileRegion)
+        if pass_fd:
+            # The client reads the range straight from the file; no data crosses the socket
+            response = dict(response, size=0, fd=True, length=payload.length)
+        response_header = pack_header(response)
+        if trace is not None:
+            trace.mark('encode')
+        if pass_fd:
+            try:
+                send_with_fds(self.connection, response_header, [payload.fileobj.fileno()])
+            except Exception as e:
+                logging.error(f"Error passing file to {self.address}: {e}")
+                return False
+            finally:
+                payload.close()
+            payload = b''
+        elif isinstance(payload, (bytes, bytearray, memoryview)):
+            # Header and an in-memory body go out together
+            if not self.send_all(response_header, payload):
+                return False
+        else:
+            if not self.send_all(response_header):
+                close_payload(payload)
+                return False
+            if not self.send_payload(payload):
+                return False
+        
+        metrics.request(header.get('command'), time.perf_counter() - started,
+                        8 + header_length + raw.received, len(response_header) + len(payload),
+                        response.get('status') != 'OK')
+        logging.debug("Sent binary response to %s, body: %s", self.address, response.get('size', 'chunked'))
+        if trace is not None:
+            trace.mark('send')
+            instrumentation.end(trace, header.get('command'), response.get('status'))
+        return not response.get('close')
+
+class AsyncProcessTheClient:
+    """asyncio counterpart of ProcessTheClient.
+    
+    Waiting for requests, reading request bodies and streaming responses
+    happens on the event loop; FileProtocol calls and other disk I/O run in the
+    executor, so a slow client holds no executor thread while its bytes trickle in.
+    """
+    def __init__(self, reader, writer, executor, idle_timeout=60.0, admission=None):
+        self.reader = reader
+        self.writer = writer
+        self.executor = executor
+        self.admission = admission or AdmissionControl(max_bytes=None)
+        self.address = writer.get_extra_info('peername')
+        self.timeout = 300.0
+        self.idle_timeout = idle_timeout
+        self.loop = asyncio.get_running_loop()
+    
+    async def process(self):
+        metrics.connection_opened()
+        error = False
+        try:
+            while await self.handle_request():
+                pass
+        except Exception as e:
+            logging.error(f"Error processing client {self.address}: {e}")
+            error = True
+        finally:
+            self.writer.close()
+            metrics.connection_closed(error)
+    
+    async def receive_all(self, size, timeout=None):
+        return await asyncio.wait_for(self.reader.readexactly(size), timeout or self.timeout)
+    
+    async def handle_request(self):
+        try:
+            length_data = await self.receive_all(4, self.idle_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Closing idle connection from {self.address}")
+            return False
+        except asyncio.IncompleteReadError:
+            return False
+        
+        if length_data == PROTOCOL_V2_MAGIC:
+            return await self.process_binary()
+        return await self.process_legacy(length_data)
+    
+    async def process_legacy(self, length_data):
+        trace = instrumentation.begin()
+        command_length = struct.unpack('!I', length_data)[0]
+        logging.debug("Expecting command of length %d from %s", command_length, self.address)
+        if command_length > MAX_LEGACY_MESSAGE:
+            logging.error(f"Command too long ({command_length} bytes) from {self.address}")
+            await self.send_legacy_response(json.dumps(too_long_response(command_length)))
+            return False
+        
+        # As in ProcessTheClient.process_legacy: one reservation, made before a long command is read
+        command_str = None
+        if command_length <= MAX_HEADER_SIZE:
+            command_str = await self.receive_command(command_length, trace)
+        cost = legacy_cost(command_length, command_str)
+        if not await self.admission.admit_async(cost):
+            await self.send_legacy_response(json.dumps(busy_response()))
+            return command_str is not None
+        try:
+            if trace is not None:
+                trace.mark('queue')
+            if command_str is None:
+                command_str = await self.receive_command(command_length, trace)
+            return await self.serve_legacy(command_length, command_str, trace)
+        finally:
+            self.admission.release(cost)
+    
+    async def receive_command(self, command_length, trace=None):
+        command_str = (await self.receive_all(command_length)).decode('utf-8')
+        logging.debug("Received command from %s: %.100s...", self.address, command_str)
+        if trace is not None:
+            trace.mark('receive')
+        return command_str
+    
+    async def serve_legacy(self, command_length, command_str, trace=None):
+        started = time.perf_counter()
+        hasil, status = await self.loop.run_in_executor(self.executor, self.run_legacy, command_length, command_str,
+                                                        started, trace)
+        await self.send_legacy_response(hasil, trace)
+        record_legacy(command_str, status, time.perf_counter() - started, 4 + command_length, 4 + len(hasil), trace)
+        return True
+    
+    async def send_legacy_response(self, hasil, trace=None):
+        response_data = hasil.encode('utf-8')
+        if trace is not None:
+            trace.mark('encode')
+        
+        self.writer.write(struct.pack('!I', len(response_data)))
+        self.writer.write(response_data)
+        await self.writer.drain()
+        
+        logging.debug("Sent response to %s, length: %d", self.address, len(response_data))
+        if trace is not None:
+            trace.mark('send')
+        return True
+    
+    async def process_binary(self):
+        trace = instrumentation.begin()
+        header_length = struct.unpack('!I', await self.receive_all(4))[0]
+        if header_length > MAX_HEADER_SIZE:
+            logging.error(f"Header too large ({header_length} bytes) from {self.address}")
+            return False
+        
+        header_data = await self.receive_all(header_length)
+        if trace is not None:
+            trace.mark('receive')
+        header = unpack_header(header_data)
+        body_size = None if header.get('chunked') else int(header.get('size', 0))
+        logging.debug("Received binary request from %s: %s, body: %s bytes",
+                      self.address, header.get('command'), body_size or 0)
+        started = time.perf_counter()
+        if trace is not None:
+            trace.mark('parse')
+        
+        if await self.admission.admit_async(V2_REQUEST_COST):
+            try:
+                if str(header.get('command', '')).strip().lower() == 'upload':
+                    response, received = await self.receive_upload(header, body_size, trace)
+                    payload = b''
+                else:
+                    raw, received = await self.spool_body(header, body_size)
+                    if trace is not None:
+                        trace.mark('receive')
+                    try:
+                        response, payload = await self.loop.run_in_executor(self.executor, self.run_request,
+                                                                            header, request_body(header, raw),
+                                                                            time.perf_counter(), trace)
+                    finally:
+                        raw.close()
+            finally:
+                self.admission.release(V2_REQUEST_COST)
+        else:
+            # Refused before any work: answer without reading the body, and close if there is one
+            received = 0
+            response, payload = dict(busy_response(), size=0, close=body_size != 0), b''
+        try:
+            response_header = pack_header(response)
+            if trace is not None:
+                trace.mark('encode')
+            self.writer.write(response_header)
+            await self.send_payload(payload)
+        finally:
+            close_payload(payload)
+        
+        metrics.request(header.get('command'), time.perf_counter() - started,
+                        8 + header_length + received, len(response_header) + len(payload),
+                        response.get('status') != 'OK')
+        logging.debug("Sent binary response to %s, body: %s", self.address, response.get('size', 'chunked'))
+        if trace is not None:
+            trace.mark('send')
+            instrumentation.end(trace, header.get('command'), response.get('status'))
+        return not response.get('close')
+    
+    async def body_parts(self, header, size):
+        """The raw request body as it arrives, as (frame, data) pairs.
+        
+        A plain body comes as size bytes in pieces with an empty frame; a
+        chunked one as each frame's 5-byte header and its data, up to the end
+        frame.
+        """
+        if not header.get('chunked'):
+            while size > 0:
+                data = await asyncio.wait_for(self.reader.read(min(size, CHUNK_SIZE)), self.timeout)
+                if not data:
+                    raise ConnectionError(f"Connection closed with {size} body bytes outstanding")
+                size -= len(data)
+                yield b'', data
+            return
+        while True:
+            frame = await self.receive_all(5)
+            length = struct.unpack('!BI', frame)[1]
+            if length > 2 * CHUNK_SIZE:
+                raise ValueError(f"Chunk of {length} bytes exceeds the protocol limit")
+            yield frame, (await self.receive_all(length) if length else b'')
+            if not length:
+                return
+    
+    async def receive_upload(self, header, size, trace=None):
+        """Write an UPLOAD body into its file as it arrives; returns (response, raw bytes received).
+        
+        Each piece is written from the executor as soon as it is read, so no
+        thread waits on the network, the body reaches the disk once, and a
+        resumable upload cut off part way keeps what arrived, as in thread mode.
+        """
+        upload = await self.loop.run_in_executor(self.executor, self.open_upload, header, time.perf_counter(), trace)
+        if isinstance(upload, dict):
+            # Refused before reading the body: close the connection if there is one
+            return dict(upload, size=0, close=size != 0), 0
+        codec = header.get('encoding')
+        received = 0
+        complete = False
+        try:
+            async for frame, data in self.body_parts(header, size):
+                received += len(frame) + len(data)
+                if data:
+                    await self.loop.run_in_executor(self.executor, write_piece, upload, frame, data, codec)
+            complete = True
+            if trace is not None:
+                trace.mark('receive')
+            response = await self.loop.run_in_executor(self.executor, upload.finish)
+        except (ConnectionError, EOFError, asyncio.TimeoutError, asyncio.CancelledError):
+            upload.abort()  # a close, and an unlink unless the partial is kept
+            raise
+        except Exception as e:
+            upload.abort()
+            logging.error(f"Error in upload from {self.address}: {e}")
+            return dict(status='ERROR', data=str(e), size=0, close=not complete), received
+        if trace is not None:
+            trace.mark('execute')
+        return dict(response, size=0), received
+    
+    async def spool_body(self, header, size):
+        """Read a request body on the event loop; returns (a file-like copy of it, its raw size).
+        
+        Up to SPOOL_MEMORY_BYTES stay in memory. A larger body goes to a temp
+        file in the first storage root, written from the executor, and the
+        handler then reads that copy at disk speed.
+        """
+        spool = io.BytesIO()
+        received = 0
+        try:
+            async for frame, data in self.body_parts(header, size):
+                if isinstance(spool, io.BytesIO) and received + len(frame) + len(data) > SPOOL_MEMORY_BYTES:
+                    spool = await self.loop.run_in_executor(self.executor, self.spool_file, spool)
+                spool.write(frame)
+                if isinstance(spool, io.BytesIO):
+                    spool.write(data)
+                else:
+                    await self.loop.run_in_executor(self.executor, spool.write, data)
+                received += len(frame) + len(data)
+            spool.seek(0)
+        except BaseException:
+            spool.close()
+            raise
+        return spool, received
+    
+    @staticmethod
+    def spool_file(buffered):
+        """Move an in-memory spool to an anonymous temp file on the storage disk"""
+        spool = tempfile.TemporaryFile(dir=fp.file.storage.roots[0], prefix='.spool.')
+        spool.write(buffered.getbuffer())
+        buffered.close()
+        return spool
+    
+    @staticmethod
+    def run_legacy(command_length, command_str, queued_at, trace=None):
+        metrics.queued(time.perf_counter() - queued_at)
+        if trace is not None:
+            trace.mark('queue')
+        return traced(trace, run_legacy_command, command_length, command_str)
+    
+    @staticmethod
+    def open_upload(header, queued_at, trace=None):
+        """Executor side of starting an UPLOAD; its body is then written a piece at a time"""
+        metrics.queued(time.perf_counter() - queued_at)
+        if trace is not None:
+            trace.mark('queue')
+        return fp.file.open_upload(list(header.get('params', [])), header.get('offset', 0), header.get('total'))
+    
+    @staticmethod
+    def run_request(header, body, queued_at, trace=None):
+        """Executor side of a request: the handler, reading the already received body"""
+        metrics.queued(time.perf_counter() - queued_at)
+        if trace is not None:
+            trace.mark('queue')
+        return traced(trace, fp.proses_request, header, body)
+    
+    async def send_payload(self, payload):
+        if isinstance(payload, FileRegion):
+            if payload.length:
+                # Uses os.sendfile on the transport's socket where possible
+                await self.loop.sendfile(self.writer.transport, payload.fileobj, payload.offset, payload.length)
+        elif isinstance(payload, (bytes, bytearray, memoryview)):
+            self.writer.write(payload)
+        else:
+            # Chunked or batch response: producing each part (disk reads, compression) is blocking work
+            while (part := await self.loop.run_in_executor(self.executor, next, payload, None)) is not None:
+                try:
+                    await self.send_payload(part)
+                finally:
+                    close_payload(part)
+        await self.writer.drain()
+
+def too_long_response(command_length):
+    """Answer to a legacy command longer than MAX_LEGACY_MESSAGE; it is never read"""
+    return dict(status='ERROR', data=f"Command of {command_length} bytes exceeds {MAX_LEGACY_MESSAGE}")
+
+def legacy_cost(command_length, command_str=None):
+    """Bytes a legacy request may buffer; command_str None means the command is not read yet.
+    
+    The command is copied a couple of times while it is decoded, and a GET
+    builds the whole file as base64 JSON, which is encoded once more.
+    """
+    response_size = fp.legacy_response_size(command_str) if command_str is not None else 0
+    return LEGACY_COST_FACTOR * (command_length + response_size)
+
+def run_legacy_command(command_length, command_str, trace=None):
+    """FileProtocol.proses_legacy, except for a GET whose response admission did not reserve for"""
+    if command_length > MAX_HEADER_SIZE and fp.legacy_response_size(command_str):
+        # Only a command read before admission reserved its response; no real GET is this long
+        return json.dumps(dict(status='ERROR', data='Command too long')), 'ERROR'
+    return fp.proses_legacy(command_str, trace)
+
+def write_piece(upload, frame, data, codec):
+    """Write one received piece of an upload body: plain bytes, or a chunked frame's data"""
+    upload.write(decode_chunk(frame[0], data, codec) if frame else data)
+
+def record_legacy(command_str, status, latency, bytes_in, bytes_out, trace=None):
+    """Metrics for a legacy text command answered with status"""
+    command = command_str.split(' ', 1)[0]
+    metrics.request(command, latency, bytes_in, bytes_out, status != 'OK')
+    if trace is not None:
+        instrumentation.end(trace, command, status)
+
+def traced(trace, method, *args):
+    """Call a FileProtocol method with the request's trace, under the profiler if it was sampled"""
+    if trace is None or not trace.sampled:
+        return method(*args, trace)
+    with instrumentation.capture(trace):
+        return method(*args, trace)
+
+def run_worker(ipaddress, port, max_workers, pool_type, idle_timeout, listen_socket=None, dedup=False,
+               stats_file=None, stats_interval=60.0, admission_options=None, profile_options=None, durability='none',
+               socket_buffer=SOCKET_BUFFER_SIZE, unix_socket=None, storage_roots=None, shards=0):
+    """Entry point of a pre-forked worker process in pool_type='process' mode"""
+    if stats_file:
+        # One dump per worker: each keeps its own metrics
+        root, ext = os.path.splitext(stats_file)
+        stats_file = f"{root}.{os.getpid()}{ext}"
+    svr = Server(ipaddress, port, max_workers, pool_type, idle_timeout,
+                 reuse_port=listen_socket is None, listen_socket=listen_socket, dedup=dedup, durability=durability,
+                 socket_buffer=socket_buffer, unix_socket=unix_socket, storage_roots=storage_roots, shards=shards,
+                 stats_file=stats_file, stats_interval=stats_interval, **(admission_options or {}),
+                 **(profile_options or {}))
+    # SIGTERM from the supervisor: stop accepting, finish in-flight requests
+    signal.signal(signal.SIGTERM, lambda signum, frame: setattr(svr, 'running', False))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    svr.start()
+    svr.stop()
+
+class Server:
+    def __init__(self, ipaddress='0.0.0.0', port=7777, max_workers=5, pool_type='thread', idle_timeout=60.0,
+                 processes=None, worker_pool_type='thread', reuse_port=False, listen_socket=None, dedup=False,
+                 stats_file=None, stats_interval=60.0, max_requests=None,
+                 max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES, admission_backlog=DEFAULT_ADMISSION_BACKLOG,
+                 queue_timeout=DEFAULT_QUEUE_TIMEOUT, profile_every=0, profile_dir='profiles',
+                 profile_memory=False, durability='none', socket_buffer=SOCKET_BUFFER_SIZE, unix_path=None,
+                 unix_socket=None, storage_roots=None, shards=0):
+        self.ipinfo = (ipaddress, port)
+        self.listening = listen_socket is not None
+        if listen_socket is not None:
+            self.my_socket = listen_socket
+        else:
+            self.my_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                self.my_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            if socket_buffer:
+                # Set before listen() so accepted connections start with it
+                tune_socket(self.my_socket, socket_buffer)
+        self.my_socket.settimeout(1.0)
+        self.pool_type = pool_type
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        # pool_type='process': number of pre-forked worker processes, each
+        # running its own accept loop with a worker_pool_type handler pool
+        self.processes = processes or os.cpu_count() or 1
+        self.worker_pool_type = worker_pool_type
+        # Files spread over storage_roots (one per disk) and shards hashed subdirectories of each
+        self.storage_roots = storage_roots
+        self.shards = shards
+        if storage_roots or shards:
+            fp.file.set_storage(StorageLayout(storage_roots or fp.file.storage.roots, shards))
+        # Store uploads content-addressed, so identical files share one copy on disk
+        self.dedup = dedup
+        if dedup and fp.file.store is None:
+            fp.file.enable_dedup()
+        # When an acknowledged upload is on stable storage: 'none', 'fsync' or 'group'
+        self.durability = durability
+        fp.file.set_durability(durability)
+        if durability == 'group':
+            metrics.add_source('group_commit', fp.file.group_commit.stats)
+        # Metrics are served by STATS; with stats_file they are also dumped there periodically
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        # Overload protection: at most max_requests requests and max_buffered_bytes of
+        # buffers in flight (per worker process); the rest wait or get BUSY
+        self.admission_options = dict(max_requests=max_requests, max_buffered_bytes=max_buffered_bytes,
+                                      admission_backlog=admission_backlog, queue_timeout=queue_timeout)
+        self.admission = AdmissionControl(max_requests, max_buffered_bytes, admission_backlog, queue_timeout)
+        metrics.add_source('admission', self.admission.stats)
+        # Per-stage timings and hooks; with profile_every=N every Nth request is
+        # also profiled (and its allocations traced with profile_memory) into profile_dir
+        self.profile_options = dict(profile_every=profile_every, profile_dir=profile_dir,
+                                    profile_memory=profile_memory)
+        instrumentation.configure(profile_every, profile_dir, profile_memory)
+        metrics.add_source('instrumentation', instrumentation.stats)
+        # SO_SNDBUF/SO_RCVBUF of client connections; None keeps kernel autotuning
+        self.socket_buffer = socket_buffer
+        # Optional second listener for same-host clients: an AF_UNIX socket at unix_path
+        # (unix_socket is the supervisor's, already listening, in a worker process)
+        self.unix_path = unix_path
+        self.unix_socket = unix_socket
+        self.workers = []
+        self.executor = None
+        self.running = True
+        # Idle persistent connections wait in the accept loop's selector rather
+        # than holding a worker; workers hand them back through self.parked.
+        self.selector = selectors.DefaultSelector()
+        self.parked = deque()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+    
+    def start(self):
+        logging.warning(f"Server running at {self.ipinfo} with {self.pool_type} pool, max_workers={self.max_workers}")
+        if self.pool_type == 'process':
+            self.supervise()
+            return
+        if self.stats_file:
+            threading.Thread(target=self.dump_stats, daemon=True).start()
+        
+        if not self.listening:
+            self.my_socket.bind(self.ipinfo)
+            self.my_socket.listen(50)
+        if self.unix_socket is None and self.unix_path:
+            self.unix_socket = self.listen_unix()
+        
+        if self.pool_type == 'asyncio':
+            asyncio.run(self.serve_async())
+            return
+        
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        
+        self.selector.register(self.my_socket, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+        if self.unix_socket is not None:
+            self.selector.register(self.unix_socket, selectors.EVENT_READ)
+        
+        while self.running:
+            try:
+                for key, _ in self.selector.select(timeout=1.0):
+                    if key.fileobj is self.my_socket or key.fileobj is self.unix_socket:
+                        self.accept(key.fileobj)
+                    elif key.fileobj is self.wakeup_r:
+                        self.register_parked()
+                    else:
+                        self.resume(key.data)
+                self.close_idle()
+            except Exception as e:
+                if self.running:
+                    logging.error(f"Server error: {e}")
+    
+    def supervise(self):
+        """Run self.processes worker processes on one port and restart any that die"""
+        listen_socket = None
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            # No SO_REUSEPORT: bind once here and let the workers share the socket
+            self.my_socket.bind(self.ipinfo)
+            self.my_socket.listen(50)
+            self.my_socket.setblocking(False)  # shared, like the unix socket (see listen_unix)
+            listen_socket = self.my_socket
+        if self.unix_path:
+            # One unix socket, shared by all workers
+            self.unix_socket = self.listen_unix()
+        
+        logging.warning(f"Starting {self.processes} worker processes ({self.worker_pool_type} pool, max_workers={self.max_workers} each)")
+        self.workers = [self.spawn_worker(listen_socket) for _ in range(self.processes)]
+        
+        while self.running:
+            multiprocessing.connection.wait([w.sentinel for w in self.workers], timeout=1.0)
+            for i, worker in enumerate(self.workers):
+                if self.running and not worker.is_alive():
+                    logging.error(f"Worker process {worker.pid} exited with code {worker.exitcode}, restarting")
+                    worker.join()
+                    self.workers[i] = self.spawn_worker(listen_socket)
+                    time.sleep(0.1)  # avoid a tight loop if workers die on startup
+    
+    def spawn_worker(self, listen_socket):
+        worker = multiprocessing.Process(target=run_worker, daemon=True,
+                                         args=(self.ipinfo[0], self.ipinfo[1], self.max_workers,
+                                               self.worker_pool_type, self.idle_timeout, listen_socket, self.dedup,
+                                               self.stats_file, self.stats_interval, self.admission_options,
+                                               self.profile_options, self.durability, self.socket_buffer,
+                                               self.unix_socket, self.storage_roots, self.shards))
+        worker.start()
+        return worker
+    
+    def listen_unix(self):
+        """Bind and listen on unix_path, replacing a socket file left behind by an earlier run"""
+        try:
+            if stat.S_ISSOCK(os.stat(self.unix_path).st_mode):
+                os.remove(self.unix_path)
+        except FileNotFoundError:
+            pass
+        unix_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix_socket.bind(self.unix_path)
+        unix_socket.listen(50)
+        # Shared by every worker process: all are woken per connection and the losers must not block in accept()
+        unix_socket.setblocking(False)
+        logging.warning(f"Also listening on unix socket {self.unix_path}")
+        return unix_socket
+    
+    def dump_stats(self):
+        while self.running:
+            time.sleep(self.stats_interval)
+            try:
+                metrics.dump(self.stats_file, dict(cache=fp.file.cache.stats()))
+            except OSError as e:
+                logging.error(f"Failed to write stats to {self.stats_file}: {e}")
+    
+    async def serve_async(self):
+        """Event-loop server: one coroutine per connection, max_workers threads for disk I/O"""
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        server = await asyncio.start_server(self.handle_async_client, sock=self.my_socket, backlog=1024)
+        unix_server = None
+        if self.unix_socket is not None:
+            unix_server = await asyncio.start_unix_server(self.handle_async_client, sock=self.unix_socket)
+        async with server:
+            while self.running:
+                await asyncio.sleep(1.0)
+        if unix_server is not None:
+            unix_server.close()
+        self.executor.shutdown(wait=False)
+    
+    async def handle_async_client(self, reader, writer):
+        logging.info(f"Connection from {writer.get_extra_info('peername')}")
+        tune_socket(writer.get_extra_info('socket'), self.socket_buffer)
+        await AsyncProcessTheClient(reader, writer, self.executor, self.idle_timeout, self.admission).process()
+    
+    def accept(self, listener=None):
+        try:
+            connection, client_address = (listener or self.my_socket).accept()
+        except (BlockingIOError, socket.timeout):
+            return  # another worker process took it
+        logging.info(f"Connection from {client_address}")
+        tune_socket(connection, self.socket_buffer)
+        on_idle = self.park if self.pool_type == 'thread' else None
+        client_handler = ProcessTheClient(connection, client_address, on_idle, self.idle_timeout, self.admission)
+        client_handler.queued_at = time.perf_counter()
+        self.executor.submit(client_handler.process)
+    
+    def park(self, client_handler):
+        """Called by a worker when a persistent connection goes quiet"""
+        client_handler.parked_at = time.monotonic()
+        self.parked.append(client_handler)
+        try:
+            self.wakeup_w.send(b'\0')
+        except BlockingIOError:
+            pass  # a wakeup is already pending
+    
+    def register_parked(self):
+        try:
+            while self.wakeup_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self.parked:
+            client_handler = self.parked.popleft()
+            self.selector.register(client_handler.connection, selectors.EVENT_READ, client_handler)
+    
+    def resume(self, client_handler):
+        """The client sent its next request; serve it on a worker again"""
+        self.selector.unregister(client_handler.connection)
+        client_handler.queued_at = time.perf_counter()
+        self.executor.submit(client_handler.process)
+    
+    def close_idle(self):
+        now = time.monotonic()
+        for key in list(self.selector.get_map().values()):
+            client_handler = key.data
+            if client_handler is not None and now - client_handler.parked_at > self.idle_timeout:
+                logging.warning(f"Closing idle connection from {client_handler.address}")
+                self.selector.unregister(client_handler.connection)
+                client_handler.close()
+    
+    def stop(self):
+        self.running = False
+        if self.pool_type == 'process':
+            for worker in self.workers:
+                worker.terminate()
+            for worker in self.workers:
+                worker.join(timeout=10)
+                if worker.is_alive():
+                    worker.kill()
+            self.my_socket.close()
+            self.close_unix()
+            return
+        if self.pool_type == 'asyncio':
+            self.close_unix(remove_only=True)
+            return  # serve_async notices within a second and closes everything
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                key.data.close()
+        self.selector.close()
+        self.my_socket.close()
+        self.close_unix()
+    
+    def close_unix(self, remove_only=False):
+        """Close the unix listener and remove its socket file (workers leave that to the supervisor)"""
+        if self.unix_socket is not None and not remove_only:
+            self.unix_socket.close()
+        if self.unix_path:
+            try:
+                os.remove(self.unix_path)
+            except OSError:
+                pass
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main(max_workers=5, pool_type='thread', processes=None, dedup=False, stats_file=None, max_requests=None,
+         max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES, profile_every=0, profile_dir='profiles', profile_memory=False,
+         durability='none', socket_buffer=SOCKET_BUFFER_SIZE, unix_path=None, storage_roots=None, shards=0,
+         port=7771):
+    svr = Server(ipaddress='0.0.0.0', port=port, max_workers=max_workers, pool_type=pool_type, processes=processes,
+                 dedup=dedup, stats_file=stats_file, max_requests=max_requests, max_buffered_bytes=max_buffered_bytes,
+                 profile_every=profile_every, profile_dir=profile_dir, profile_memory=profile_memory,
+                 durability=durability, socket_buffer=socket_buffer, unix_path=unix_path,
+                 storage_roots=storage_roots, shards=shards)
+    # Let the stress test's terminate() shut the supervisor and its workers down cleanly
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        svr.start()
+    except KeyboardInterrupt:
+        svr.stop()
+
+if __name__ == "__main__":
+    import sys
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    max_workers = int(args[0]) if len(args) > 0 else 5
+    pool_type = args[1] if len(args) > 1 else 'thread'
+    processes = int(args[2]) if len(args) > 2 else None
+    dedup = '--dedup' in sys.argv[1:]
+    options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    stats_file = options.get('stats-file')
+    max_requests = int(options['max-requests']) if 'max-requests' in options else None
+    max_buffered_bytes = int(float(options.get('max-buffered-mb', DEFAULT_MAX_BUFFERED_BYTES / 2 ** 20)) * 2 ** 20)
+    # e.g. --profile-every=1000 --profile-memory; per-request logging needs --log-level=DEBUG
+    profile_every = int(options.get('profile-every', 0))
+    profile_dir = options.get('profile-dir', 'profiles')
+    profile_memory = '--profile-memory' in sys.argv[1:]
+    durability = options.get('durability', 'none')  # none, fsync or group
+    socket_buffer = int(options['socket-buffer-kb']) * 1024 if 'socket-buffer-kb' in options else SOCKET_BUFFER_SIZE
+    unix_path = options.get('unix-socket')  # e.g. --unix-socket=/tmp/file_server.sock for same-host clients
+    # e.g. --storage=/disk1/files,/disk2/files --shards=256
+    storage_roots = options['storage'].split(',') if 'storage' in options else None
+    shards = int(options.get('shards', 0))
+    port = int(options.get('port', 7771))  # e.g. several local cluster nodes, see file_cluster.py
+    logging.basicConfig(level=options.get('log-level', 'WARNING').upper())
+    main(max_workers, pool_type, processes, dedup, stats_file, max_requests, max_buffered_bytes,
+         profile_every, profile_dir, profile_memory, durability, socket_buffer, unix_path, storage_roots, shards,
+         port)
@@ -1,251 +1,578 @@
-# stress_test.py - Enhanced version with proper CSV output
-import os
-import time
-import logging
-import subprocess
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from file_client_cli import remote_get, remote_upload, remote_list
-import pandas as pd
-from datetime import datetime
-import signal
-
-# Konfigurasi
-OPERATIONS = ['upload']
-FILE_SIZES = {
-    50 * 1024 * 1024: '50mb.txt',
-    100 * 1024 * 1024: '100mb.pdf'
-}
-CLIENT_WORKERS = [1, 5, 50]
-SERVER_WORKERS = [1, 5, 50]
-POOL_TYPES = ['thread', 'process']
-
-def log_to_backlog(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open('backlog.txt', 'a') as f:
-        f.write(f"[{timestamp}] {message}\n")
-
-def run_server(max_workers, pool_type):
-    log_to_backlog(f"Starting server with {max_workers} workers, pool type: {pool_type}")
-    proc = subprocess.Popen(['python', 'file_server.py', str(max_workers), pool_type])
-    time.sleep(5)  # Give server more time to start
-    return proc
-
-def kill_server(proc):
-    try:
-        proc.terminate()
-        proc.wait(timeout=10)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        proc.wait()
-
-def run_stress_test(operation, file_size, client_workers, server_workers, pool_type):
-    filename = FILE_SIZES[file_size]
-    filepath = os.path.join('files', filename)
-    
-    log_to_backlog(f"Running test: operation={operation}, file={filename}, client_workers={client_workers}, server_workers={server_workers}, pool_type={pool_type}")
-    
-    if not os.path.exists(filepath):
-        log_to_backlog(f"Error: File {filepath} tidak ditemukan")
-        return create_failed_result(operation, file_size, client_workers, server_workers)
-    
-    server_proc = run_server(server_workers, pool_type)
-    
-    try:
-        # Test connection
-        log_to_backlog("Testing server connection")
-        list_success = remote_list()
-        if not list_success:
-            log_to_backlog("Server connection failed")
-            return create_failed_result(operation, file_size, client_workers, server_workers)
-        
-        log_to_backlog("Server connection successful")
-        
-        # Track individual worker results
-        worker_results = []
-        
-        def worker():
-            try:
-                if operation == 'download':
-                    log_to_backlog(f"Worker starting download for {filename}")
-                    success, duration, throughput = remote_get(filename)
-                else:
-                    log_to_backlog(f"Worker starting upload for {filename}")
-                    success, duration, throughput = remote_upload(filename)
-                
-                result = {
-                    'success': success,
-                    'duration': duration,
-                    'throughput': throughput
-                }
-                worker_results.append(result)
-                
-                if success:
-                    log_to_backlog(f"Worker completed: Success, Duration={duration:.2f}s, Throughput={throughput:.2f} B/s")
-                else:
-                    log_to_backlog("Worker completed: Failed")
-                
-                return result
-                    
-            except Exception as e:
-                log_to_backlog(f"Worker error: {str(e)}")
-                result = {'success': False, 'duration': 0, 'throughput': 0}
-                worker_results.append(result)
-                return result
-        
-        # Execute workers
-        if pool_type == 'thread':
-            with ThreadPoolExecutor(max_workers=client_workers) as executor:
-                futures = [executor.submit(worker) for _ in range(client_workers)]
-                for future in futures:
-                    try:
-                        future.result(timeout=600)  # 10 minute timeout per worker
-                    except Exception as e:
-                        log_to_backlog(f"Worker future error: {e}")
-                        worker_results.append({'success': False, 'duration': 0, 'throughput': 0})
-        else:
-            with ProcessPoolExecutor(max_workers=client_workers) as executor:
-                futures = [executor.submit(worker) for _ in range(client_workers)]
-                for future in futures:
-                    try:
-                        future.result(timeout=600)
-                    except Exception as e:
-                        log_to_backlog(f"Worker future error: {e}")
-                        worker_results.append({'success': False, 'duration': 0, 'throughput': 0})
-        
-        # Calculate results
-        success_count = sum(1 for r in worker_results if r['success'])
-        failure_count = len(worker_results) - success_count
-        
-        successful_durations = [r['duration'] for r in worker_results if r['success']]
-        successful_throughputs = [r['throughput'] for r in worker_results if r['success']]
-        
-        avg_duration = sum(successful_durations) / len(successful_durations) if successful_durations else 0
-        avg_throughput = sum(successful_throughputs) / len(successful_throughputs) if successful_throughputs else 0
-        
-        result = {
-            'Operation': operation,
-            'File Size (MB)': file_size // (1024 * 1024),
-            'Client Workers': client_workers,
-            'Server Workers': server_workers,
-            'Avg Duration (s)': round(avg_duration, 2),
-            'Avg Throughput (B/s)': round(avg_throughput, 2),
-            'Client Success': success_count,
-            'Client Failure': failure_count,
-            'Server Success': server_workers if success_count > 0 else 0,
-            'Server Failure': 0 if success_count > 0 else server_workers
-        }
-        
-        log_to_backlog(f"Test result: {result}")
-        return result
-        
-    except Exception as e:
-        log_to_backlog(f"Test error: {str(e)}")
-        return create_failed_result(operation, file_size, client_workers, server_workers)
-    finally:
-        kill_server(server_proc)
-        log_to_backlog("Server terminated")
-        time.sleep(3)
-
-def create_failed_result(operation, file_size, client_workers, server_workers):
-    return {
-        'Operation': operation,
-        'File Size (MB)': file_size // (1024 * 1024),
-        'Client Workers': client_workers,
-        'Server Workers': server_workers,
-        'Avg Duration (s)': 0,
-        'Avg Throughput (B/s)': 0,
-        'Client Success': 0,
-        'Client Failure': client_workers,
-        'Server Success': 0,
-        'Server Failure': server_workers
-    }
-
-def create_test_files():
-    """Create test files if they don't exist"""
-    os.makedirs('files', exist_ok=True)
-    
-    for size, filename in FILE_SIZES.items():
-        filepath = os.path.join('files', filename)
-        if not os.path.exists(filepath):
-            log_to_backlog(f"Creating test file: {filename} ({size} bytes)")
-            with open(filepath, 'wb') as f:
-                # Write dummy data in chunks to avoid memory issues
-                chunk_size = 1024 * 1024  # 1MB chunks
-                remaining = size
-                chunk_data = b'A' * chunk_size
-                
-                while remaining > 0:
-                    write_size = min(chunk_size, remaining)
-                    if write_size < chunk_size:
-                        chunk_data = b'A' * write_size
-                    f.write(chunk_data)
-                    remaining -= write_size
-
-def main():
-    # Clean backlog
-    if os.path.exists('backlog.txt'):
-        os.remove('backlog.txt')
-    
-    log_to_backlog("Starting stress test")
-    
-    # Create test files
-    create_test_files()
-    
-    results = []
-    test_number = 1
-    
-    for pool_type in POOL_TYPES:
-        for operation in OPERATIONS:
-            for file_size in FILE_SIZES:
-                for client_workers in CLIENT_WORKERS:
-                    for server_workers in SERVER_WORKERS:
-                        logging.warning(f"Running test {test_number}: {operation}, {file_size} bytes, {client_workers} clients, {server_workers} servers, {pool_type}")
-                        
-                        result = run_stress_test(operation, file_size, client_workers, server_workers, pool_type)
-                        result['Test Number'] = test_number
-                        result['Pool Type'] = pool_type
-                        results.append(result)
-                        test_number += 1
-    
-    # Create DataFrame with specified columns
-    df = pd.DataFrame(results)
-    
-    # Reorder columns according to requirements
-    df = df[['Test Number', 'Operation', 'File Size (MB)', 'Client Workers', 'Server Workers',
-             'Avg Duration (s)', 'Avg Throughput (B/s)', 'Client Success', 'Client Failure',
-             'Server Success', 'Server Failure', 'Pool Type']]
-    
-    # Rename columns to match requirements
-    df.columns = [
-        'Nomor',
-        'Operasi', 
-        'Volume (MB)',
-        'Jumlah Client Worker Pool',
-        'Jumlah Server Worker Pool',
-        'Waktu Total per Client (s)',
-        'Throughput per Client (B/s)',
-        'Client Worker Sukses',
-        'Client Worker Gagal',
-        'Server Worker Sukses', 
-        'Server Worker Gagal',
-        'Pool Type'
-    ]
-    
-    # Save to CSV
-    df.to_csv('stress_test_results.csv', index=False)
-    print("=== HASIL STRESS TEST ===")
-    print(df.to_string(index=False))
-    
-    # Summary statistics
-    print("\n=== RINGKASAN ===")
-    print(f"Total tests: {len(df)}")
-    print(f"Successful operations: {df['Client Worker Sukses'].sum()}")
-    print(f"Failed operations: {df['Client Worker Gagal'].sum()}")
-    print(f"Average throughput: {df[df['Throughput per Client (B/s)'] > 0]['Throughput per Client (B/s)'].mean():.2f} B/s")
-    
-    log_to_backlog("Stress test completed")
-    return df
-
-if __name__ == '__main__':
-    logging.basicConfig(level=logging.WARNING)
-    main()
\ No newline at end of file
+# stress_test.py - Benchmark harness: latency percentiles, throughput and server-side counts
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import struct
+import logging
+import argparse
+import asyncio
+import platform
+import contextlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+import file_client_cli
+from file_client_cli import FileClient, AsyncFileClient
+from file_protocol import PROTOCOL_V2_MAGIC, pack_header, unpack_header
+from file_framing import connect, recv_exact, send_buffers
+from file_cluster import ClusterClient, start_local_nodes, REPLICAS
+from file_proxy import ShapingProxy
+from file_metrics import Histogram
+
+# Konfigurasi
+OPERATIONS = ['upload']
+FILE_SIZES = {
+    50 * 1024 * 1024: '50mb.txt',
+    100 * 1024 * 1024: '100mb.pdf'
+}
+CLIENT_WORKERS = [1, 5, 50]
+SERVER_WORKERS = [1, 5, 50]
+POOL_TYPES = ['thread', 'process']
+CLIENT_MODES = ['pool']  # 'pool': one client per thread/process worker; 'asyncio': coroutines in one process
+DOWNLOAD_SEGMENTS = [1, 4]  # parallel range connections per download (remote_get segments=)
+LOAD_MODES = ['closed']  # 'closed': back-to-back requests per client; 'open': fixed arrival rate
+ARRIVAL_RATE = 2.0  # open loop: requests per second across all clients
+REQUESTS_PER_CLIENT = 3  # measured requests per client worker
+WARMUP_PER_CLIENT = 1  # unmeasured requests per client worker before measuring
+SERVER_ADDRESS = ('127.0.0.1', 7771)  # file_server.py main() listens on port 7771
+CLUSTER_NODES = [1]  # >1: that many local nodes on ports 7771 and up, used through a ClusterClient
+cluster_replicas = REPLICAS  # copies of each file on a cluster, set from --replicas
+SERVER_READY_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 600
+
+RESULT_COLUMNS = [
+    'Test Number', 'Operation', 'File Size (MB)', 'Client Workers', 'Server Workers', 'Pool Type', 'Client Mode',
+    'Nodes', 'Network', 'Segments',
+    'Load Mode', 'Arrival Rate (req/s)', 'Requests', 'Client Success', 'Client Failure',
+    'Latency Mean (s)', 'Latency p50 (s)', 'Latency p95 (s)', 'Latency p99 (s)', 'Latency Max (s)',
+    'Aggregate Throughput (B/s)', 'Requests per Second', 'Wall Time (s)',
+    'Server Requests', 'Server Errors', 'Server Latency p99 (ms)', 'Server Queue Wait p99 (ms)',
+    'Server Requests by Command',
+]
+
+def log_to_backlog(message):
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open('backlog.txt', 'a') as f:
+        f.write(f"[{timestamp}] {message}\n")
+
+def run_server(max_workers, pool_type, processes=None, server_options=()):
+    log_to_backlog(f"Starting server with {max_workers} workers, pool type: {pool_type} {' '.join(server_options)}")
+    args = [sys.executable, 'file_server.py', str(max_workers), pool_type]
+    if processes:
+        args.append(str(processes))
+    args.extend(server_options)
+    # Keep the server log out of the benchmark's terminal
+    with open('bench_server.log', 'ab') as log:
+        proc = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT)
+    wait_until_ready(proc, SERVER_ADDRESS)
+    return proc
+
+def run_cluster(nodes, max_workers, pool_type, server_options=()):
+    """Start nodes local servers, each with its own storage; returns their processes"""
+    log_to_backlog(f"Starting {nodes} nodes with {max_workers} workers each, pool type: {pool_type}")
+    addresses, procs = start_local_nodes(nodes, SERVER_ADDRESS[1], 'cluster',
+                                         [str(max_workers), pool_type, *server_options])
+    try:
+        for proc, address in zip(procs, addresses):
+            wait_until_ready(proc, address)
+    except RuntimeError:
+        for proc in procs:
+            kill_server(proc)
+        raise
+    return procs
+
+def cluster_addresses(nodes):
+    return [(SERVER_ADDRESS[0], SERVER_ADDRESS[1] + i) for i in range(nodes)]
+
+def probe_hello(address, timeout=2):
+    """HELLO response of the server at address; OSError while it is not listening yet"""
+    with contextlib.closing(connect(address, timeout=timeout)) as sock:
+        send_buffers(sock, (PROTOCOL_V2_MAGIC, pack_header(dict(command='HELLO'))))
+        length_data = recv_exact(sock, 4)
+        if len(length_data) != 4:
+            raise ConnectionError("Connection closed during HELLO")
+        header_length = struct.unpack('!I', length_data)[0]
+        header_data = recv_exact(sock, header_length)
+        if len(header_data) != header_length:
+            raise ConnectionError("Connection closed during HELLO")
+        return unpack_header(header_data)
+
+def wait_until_ready(proc, address, timeout=SERVER_READY_TIMEOUT):
+    """Poll the server with HELLO until it answers, instead of sleeping a fixed time.
+    
+    The probe uses a bare socket rather than a FileClient: refused connections
+    are expected while the server starts and must not be logged as errors.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited during startup with code {proc.returncode}")
+        try:
+            hasil = probe_hello(address)
+        except (OSError, ValueError):
+            hasil = {}
+        if hasil.get('status') == 'OK':
+            return hasil
+        time.sleep(0.05)
+    raise RuntimeError(f"Server at {address} not ready after {timeout}s")
+
+def kill_server(proc):
+    try:
+        proc.terminate()
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+_client = None
+
+def get_bench_client(address):
+    """One pooled FileClient per client process (threads share it).
+    
+    A dict of cluster node addresses to where to connect to each (the node
+    itself, or its proxy) gets a ClusterClient.
+    """
+    global _client
+    if isinstance(address, dict):
+        if _client is None or getattr(_client, 'endpoints', None) != address:
+            _client = ClusterClient(list(address), cluster_replicas, pool_size=max(CLIENT_WORKERS),
+                                    timeout=REQUEST_TIMEOUT, endpoints=address)
+    elif _client is None or getattr(_client, 'address', None) != address:
+        _client = FileClient(address, pool_size=max(CLIENT_WORKERS), timeout=REQUEST_TIMEOUT)
+    return _client
+
+def client_worker(worker_id, operation, filename, segments, count, address, schedule=None):
+    """Run count requests and return one record per request.
+    
+    Top-level (not a closure) so ProcessPoolExecutor can pickle it. With a
+    schedule (open loop) request i is issued at schedule[i] (wall clock) and
+    its latency includes any time spent waiting behind earlier requests.
+    """
+    client = get_bench_client(address)
+    filepath = os.path.join('files', filename)
+    records = []
+    for i in range(count):
+        if schedule is not None:
+            delay = schedule[i] - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            started = schedule[i]
+        else:
+            started = time.time()
+        
+        try:
+            if operation == 'download':
+                target = os.path.join('downloaded_files', f"bench_{os.getpid()}_{worker_id}_{filename}")
+                if segments > 1:
+                    hasil = client.download_segmented(filename, target, segments, verify=False)
+                else:
+                    hasil = client.download(filename, target)
+                size = hasil.get('total', 0)
+            else:
+                hasil = client.upload_file(f"bench_{filename}", filepath)
+                size = os.path.getsize(filepath)
+            success = hasil.get('status') == 'OK'
+            error = None if success else str(hasil.get('data'))
+        except Exception as e:
+            success, size, error = False, 0, str(e)
+        
+        records.append(dict(start=started, latency=time.time() - started,
+                            bytes=size if success else 0, success=success, error=error))
+    return records
+
+async def async_client_worker(client, worker_id, operation, filename, segments, count, schedule=None):
+    """client_worker as a coroutine on a shared AsyncFileClient"""
+    filepath = os.path.join('files', filename)
+    records = []
+    for i in range(count):
+        if schedule is not None:
+            delay = schedule[i] - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = schedule[i]
+        else:
+            started = time.time()
+        
+        try:
+            if operation == 'download':
+                target = os.path.join('downloaded_files', f"bench_{os.getpid()}_{worker_id}_{filename}")
+                if segments > 1:
+                    hasil = await client.download_segmented(filename, target, segments)
+                else:
+                    hasil = await client.download(filename, target)
+                size = hasil.get('total', 0)
+            else:
+                hasil = await client.upload_file(f"bench_{filename}", filepath)
+                size = os.path.getsize(filepath)
+            success = hasil.get('status') == 'OK'
+            error = None if success else str(hasil.get('data'))
+        except Exception as e:
+            success, size, error = False, 0, str(e)
+        
+        records.append(dict(start=started, latency=time.time() - started,
+                            bytes=size if success else 0, success=success, error=error))
+    return records
+
+async def run_async_workers(client_workers, operation, filename, segments, count, schedules, address=SERVER_ADDRESS):
+    client = AsyncFileClient(address, pool_size=client_workers * max(segments, 1), timeout=REQUEST_TIMEOUT)
+    try:
+        return await asyncio.gather(*(async_client_worker(client, w, operation, filename, segments, count,
+                                                          schedules[w])
+                                      for w in range(client_workers)), return_exceptions=True)
+    finally:
+        await client.close()
+
+def run_phase(executor, client_workers, operation, filename, segments, count, mode, rate, address=SERVER_ADDRESS):
+    """Run count requests on each client worker; returns (records, wall time).
+    
+    executor None runs the workers as coroutines of one event loop in this process.
+    address may be a list of cluster node addresses (pool client mode only).
+    """
+    schedules = [None] * client_workers
+    if mode == 'open':
+        # Arrivals every client_workers / rate seconds per worker, staggered across workers
+        interval = client_workers / rate
+        start = time.time() + 0.1
+        schedules = [[start + (i + w / client_workers) * interval for i in range(count)]
+                     for w in range(client_workers)]
+    
+    started = time.time()
+    if executor is None:
+        records = []
+        for result in asyncio.run(run_async_workers(client_workers, operation, filename, segments, count,
+                                                    schedules, address)):
+            if isinstance(result, BaseException):
+                log_to_backlog(f"Worker error: {result}")
+                result = [dict(start=started, latency=0, bytes=0, success=False, error=str(result))] * count
+            records.extend(result)
+        return records, time.time() - started
+    
+    futures = [executor.submit(client_worker, w, operation, filename, segments, count, address, schedules[w])
+               for w in range(client_workers)]
+    records = []
+    for future in futures:
+        try:
+            records.extend(future.result(timeout=REQUEST_TIMEOUT * max(count, 1)))
+        except Exception as e:
+            log_to_backlog(f"Worker future error: {e}")
+            records.extend(dict(start=started, latency=0, bytes=0, success=False, error=str(e))
+                           for _ in range(count))
+    return records, time.time() - started
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def server_stats(address, processes=1):
+    """STATS snapshots keyed by server pid.
+    
+    In process mode each worker keeps its own metrics and a connection reaches
+    one of them, so keep opening connections until every worker has answered.
+    """
+    snapshots = {}
+    for _ in range(max(processes, 1) * 20):
+        client = FileClient(address, pool_size=1)
+        try:
+            hasil = client.stats(timeout=10)
+        finally:
+            client.close()
+        if hasil.get('status') == 'OK':
+            snapshots[hasil['stats']['pid']] = hasil['stats']
+        if len(snapshots) >= processes:
+            break
+    return snapshots
+
+def cluster_stats(address, processes=1):
+    """server_stats of one server, or of every node of a cluster (pids do not collide on one host)"""
+    if not isinstance(address, list):
+        return server_stats(address, processes)
+    snapshots = {}
+    for node in address:
+        snapshots.update(server_stats(node, processes))
+    return snapshots
+
+def server_delta(before, after, commands):
+    """What the servers saw between two server_stats(): per command, and the executor queue wait.
+    
+    Returns ({command: dict(requests, errors, p99)}, queue wait p99). Histogram
+    buckets are diffed per server process and then merged, so the p99s cover
+    only the requests in between, not warmup or earlier runs.
+    """
+    totals = {command: [0, 0, Histogram()] for command in commands}
+    queue_wait = Histogram()
+    for pid, snap in after.items():
+        old = before.get(pid, {})
+        for command in commands:
+            stats = snap['commands'].get(command)
+            if not stats:
+                continue
+            old_stats = old.get('commands', {}).get(command)
+            totals[command][0] += stats['count'] - (old_stats['count'] if old_stats else 0)
+            totals[command][1] += stats['errors'] - (old_stats['errors'] if old_stats else 0)
+            totals[command][2].add(stats['latency_ms'])
+            if old_stats:
+                totals[command][2].add(old_stats['latency_ms'], -1)
+        queue_wait.add(snap['queue_wait_ms'])
+        if 'queue_wait_ms' in old:
+            queue_wait.add(old['queue_wait_ms'], -1)
+    per_command = {command: dict(requests=requests, errors=errors, p99=round(latency.percentile(99) * 1000, 3))
+                   for command, (requests, errors, latency) in totals.items()}
+    return per_command, round(queue_wait.percentile(99) * 1000, 3)
+
+def describe_network(network):
+    """Short label for the shaping a test ran under ('loopback' without the proxy)"""
+    if not network:
+        return 'loopback'
+    parts = [f"{network['latency'] * 1000:g}ms"]
+    if network['jitter']:
+        parts[0] += f"+/-{network['jitter'] * 1000:g}ms"
+    if network['bandwidth']:
+        parts.append(f"{network['bandwidth'] * 8 / 1e6:g}Mbit/s")
+    if network['chunk_size']:
+        parts.append(f"{network['chunk_size']}B packets")
+    return ' '.join(parts)
+
+def run_stress_test(operation, file_size, client_workers, server_workers, pool_type, segments=1,
+                    mode='closed', rate=ARRIVAL_RATE, requests=REQUESTS_PER_CLIENT, warmup=WARMUP_PER_CLIENT,
+                    server_options=(), client_mode='pool', nodes=1, network=None):
+    """One benchmark run; network (ShapingProxy keyword arguments) puts a shaping proxy in front of each server"""
+    filename = FILE_SIZES[file_size]
+    filepath = os.path.join('files', filename)
+    
+    log_to_backlog(f"Running test: operation={operation}, file={filename}, client_workers={client_workers}, server_workers={server_workers}, pool_type={pool_type}, client_mode={client_mode}, nodes={nodes}, network={describe_network(network)}, segments={segments}, mode={mode}")
+    
+    result = dict.fromkeys(RESULT_COLUMNS, 0)
+    result.update({'Operation': operation, 'File Size (MB)': file_size // (1024 * 1024),
+                   'Client Workers': client_workers, 'Server Workers': server_workers, 'Pool Type': pool_type,
+                   'Client Mode': client_mode, 'Nodes': nodes, 'Network': describe_network(network),
+                   'Segments': segments, 'Load Mode': mode, 'Arrival Rate (req/s)': rate if mode == 'open' else 0,
+                   'Requests': client_workers * requests, 'Client Failure': client_workers * requests})
+    
+    if not os.path.exists(filepath):
+        log_to_backlog(f"Error: File {filepath} tidak ditemukan")
+        return result
+    
+    if nodes > 1 and client_mode != 'pool':
+        log_to_backlog(f"Skipped: client mode {client_mode} has no cluster client")
+        return result
+    
+    processes = (os.cpu_count() or 1) if pool_type == 'process' else 1
+    # One address, or the list of cluster nodes (see client_address below for what the clients get)
+    address = cluster_addresses(nodes) if nodes > 1 else SERVER_ADDRESS
+    try:
+        if nodes > 1:
+            server_procs = run_cluster(nodes, server_workers, pool_type, server_options)
+        else:
+            server_procs = [run_server(server_workers, pool_type, server_options=server_options)]
+    except RuntimeError as e:
+        log_to_backlog(f"Server failed to start: {e}")
+        return result
+    
+    # Clients go through the proxies; seeding and STATS below stay direct
+    proxies = [ShapingProxy(node, **network) for node in (address if nodes > 1 else [address])] if network else []
+    # The v2 commands a run generates, for the server-side counts; the first is the transfer itself
+    commands = ['GET', 'STAT'] if operation == 'download' else ['UPLOAD', 'STAT', 'HAVE']
+    executor_class = ThreadPoolExecutor if pool_type == 'thread' else ProcessPoolExecutor
+    try:
+        os.makedirs('downloaded_files', exist_ok=True)
+        if operation == 'download':
+            # A server with its own --storage roots (e.g. a cluster node) does not see files/:
+            # give it the test file first
+            seeder = ClusterClient(address, cluster_replicas) if nodes > 1 else FileClient(address)
+            if not seeder.stat(filename).get('exists'):
+                log_to_backlog(f"Uploading {filename} to the server for the download test")
+                seeder.upload_file(filename, filepath)
+            seeder.close()
+        endpoints = [proxy.start() for proxy in proxies] if proxies else (address if nodes > 1 else [address])
+        # A cluster is hashed on its node addresses whichever way the clients connect, as the seeder did
+        client_address = dict(zip(address, endpoints)) if nodes > 1 else endpoints[0]
+        
+        # asyncio client mode: no executor, the workers are coroutines (see run_phase)
+        with (executor_class(max_workers=client_workers) if client_mode == 'pool'
+              else contextlib.nullcontext()) as executor:
+            if warmup:
+                records, _ = run_phase(executor, client_workers, operation, filename, segments, warmup, 'closed', rate,
+                                       client_address)
+                log_to_backlog(f"Warmup: {sum(r['success'] for r in records)}/{len(records)} succeeded")
+            
+            before = cluster_stats(address, processes)
+            records, wall_time = run_phase(executor, client_workers, operation, filename, segments, requests, mode, rate,
+                                           client_address)
+            after = cluster_stats(address, processes)
+        
+        ok = [r for r in records if r['success']]
+        latencies = sorted(r['latency'] for r in ok)
+        per_command, queue_p99 = server_delta(before, after, commands)
+        transfers = per_command[commands[0]]
+        result.update({
+            'Client Success': len(ok),
+            'Client Failure': len(records) - len(ok),
+            'Latency Mean (s)': round(sum(latencies) / len(latencies), 4) if latencies else 0,
+            'Latency p50 (s)': round(percentile(latencies, 50), 4),
+            'Latency p95 (s)': round(percentile(latencies, 95), 4),
+            'Latency p99 (s)': round(percentile(latencies, 99), 4),
+            'Latency Max (s)': round(latencies[-1], 4) if latencies else 0,
+            'Aggregate Throughput (B/s)': round(sum(r['bytes'] for r in ok) / wall_time, 2) if wall_time else 0,
+            'Requests per Second': round(len(ok) / wall_time, 3) if wall_time else 0,
+            'Wall Time (s)': round(wall_time, 3),
+            'Server Requests': transfers['requests'],
+            'Server Errors': transfers['errors'],
+            'Server Latency p99 (ms)': transfers['p99'],
+            'Server Queue Wait p99 (ms)': queue_p99,
+            'Server Requests by Command': ' '.join(f"{command}={stats['requests']}/{stats['errors']}err/p99={stats['p99']}ms"
+                                                   for command, stats in per_command.items()),
+        })
+        for error in sorted({r['error'] for r in records if r['error']}):
+            log_to_backlog(f"Client error: {error}")
+        
+        log_to_backlog(f"Test result: {result}")
+        return result
+    
+    except Exception as e:
+        log_to_backlog(f"Test error: {str(e)}")
+        return result
+    finally:
+        for proxy in proxies:
+            proxy.stop()
+        for proc in server_procs:
+            kill_server(proc)
+        log_to_backlog("Server terminated")
+
+def create_test_files():
+    """Create test files if they don't exist"""
+    os.makedirs('files', exist_ok=True)
+    
+    for size, filename in FILE_SIZES.items():
+        filepath = os.path.join('files', filename)
+        if not os.path.exists(filepath):
+            log_to_backlog(f"Creating test file: {filename} ({size} bytes)")
+            with open(filepath, 'wb') as f:
+                # Write dummy data in chunks to avoid memory issues
+                chunk_size = 1024 * 1024  # 1MB chunks
+                remaining = size
+                chunk_data = b'A' * chunk_size
+                
+                while remaining > 0:
+                    write_size = min(chunk_size, remaining)
+                    if write_size < chunk_size:
+                        chunk_data = b'A' * write_size
+                    f.write(chunk_data)
+                    remaining -= write_size
+
+def write_results(results, json_path, csv_path, config):
+    """Machine-readable output: JSON with run metadata for comparing runs, CSV for spreadsheets"""
+    with open(json_path, 'w') as f:
+        json.dump(dict(timestamp=datetime.now().isoformat(timespec='seconds'), host=socket.gethostname(),
+                       python=platform.python_version(), cpus=os.cpu_count(), config=config, results=results),
+                  f, indent=2)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(results)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the file server over a matrix of configurations")
+    parser.add_argument('--operations', nargs='+', default=OPERATIONS, choices=['upload', 'download'])
+    parser.add_argument('--client-workers', nargs='+', type=int, default=CLIENT_WORKERS)
+    parser.add_argument('--server-workers', nargs='+', type=int, default=SERVER_WORKERS)
+    parser.add_argument('--pool-types', nargs='+', default=POOL_TYPES, choices=['thread', 'process', 'asyncio'])
+    parser.add_argument('--modes', nargs='+', default=LOAD_MODES, choices=['closed', 'open'])
+    parser.add_argument('--client-modes', nargs='+', default=CLIENT_MODES, choices=['pool', 'asyncio'],
+                        help="asyncio drives all client workers from one event loop, e.g. --client-workers 200")
+    parser.add_argument('--rate', type=float, default=ARRIVAL_RATE, help="open loop: requests/s across all clients")
+    parser.add_argument('--requests', type=int, default=REQUESTS_PER_CLIENT, help="measured requests per client")
+    parser.add_argument('--warmup', type=int, default=WARMUP_PER_CLIENT, help="warmup requests per client")
+    parser.add_argument('--durability', default='none', choices=['none', 'fsync', 'group'],
+                        help="server durability policy for uploads")
+    parser.add_argument('--storage', nargs='+', help="server storage roots, e.g. one directory per disk")
+    parser.add_argument('--shards', type=int, default=0, help="hashed subdirectories per storage root")
+    parser.add_argument('--nodes', nargs='+', type=int, default=CLUSTER_NODES,
+                        help="server nodes; more than one runs a local cluster on consecutive ports")
+    parser.add_argument('--replicas', type=int, default=REPLICAS, help="copies of each file on a cluster")
+    # Any of these runs the clients through a file_proxy.ShapingProxy instead of plain loopback
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="one-way delay added by the proxy")
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--bandwidth-mbps', type=float, default=None, help="link rate per direction")
+    parser.add_argument('--packet-size', type=int, default=None, help="split traffic into pieces of this size")
+    parser.add_argument('--json', default='benchmark_results.json')
+    parser.add_argument('--csv', default='stress_test_results.csv')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    global cluster_replicas
+    args = parse_args(argv)
+    file_client_cli.server_address = SERVER_ADDRESS
+    cluster_replicas = args.replicas
+    network = None
+    if args.latency_ms or args.jitter_ms or args.bandwidth_mbps or args.packet_size:
+        network = dict(latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                       bandwidth=args.bandwidth_mbps * 1e6 / 8 if args.bandwidth_mbps else None,
+                       chunk_size=args.packet_size)
+    server_options = [f"--durability={args.durability}", f"--shards={args.shards}"]
+    if args.storage:
+        server_options.append(f"--storage={','.join(args.storage)}")
+    
+    # Clean backlog
+    if os.path.exists('backlog.txt'):
+        os.remove('backlog.txt')
+    
+    log_to_backlog("Starting stress test")
+    
+    # Create test files
+    create_test_files()
+    
+    results = []
+    test_number = 1
+    
+    for pool_type in args.pool_types:
+        for operation in args.operations:
+            for file_size in FILE_SIZES:
+                for client_workers in args.client_workers:
+                    for server_workers in args.server_workers:
+                        for segments in (DOWNLOAD_SEGMENTS if operation == 'download' else [1]):
+                            for mode in args.modes:
+                                for client_mode in args.client_modes:
+                                    for nodes in args.nodes:
+                                        logging.warning(f"Running test {test_number}: {operation}, {file_size} bytes, {client_workers} clients ({client_mode}), {server_workers} servers x {nodes} nodes, {pool_type}, {segments} segments, {mode} loop")
+                                        
+                                        result = run_stress_test(operation, file_size, client_workers, server_workers,
+                                                                 pool_type, segments, mode, args.rate, args.requests,
+                                                                 args.warmup, server_options, client_mode, nodes,
+                                                                 network)
+                                        result['Test Number'] = test_number
+                                        results.append(result)
+                                        test_number += 1
+    
+    write_results(results, args.json, args.csv, vars(args))
+    
+    print("=== HASIL STRESS TEST ===")
+    for result in results:
+        print(f"#{result['Test Number']} {result['Operation']} {result['File Size (MB)']}MB "
+              f"clients={result['Client Workers']} ({result['Client Mode']}) servers={result['Server Workers']} "
+              f"nodes={result['Nodes']} network={result['Network']} "
+              f"{result['Pool Type']} "
+              f"segments={result['Segments']} {result['Load Mode']}: "
+              f"ok={result['Client Success']}/{result['Requests']} "
+              f"p50={result['Latency p50 (s)']}s p95={result['Latency p95 (s)']}s p99={result['Latency p99 (s)']}s "
+              f"throughput={result['Aggregate Throughput (B/s)']:.0f} B/s "
+              f"server={result['Server Requests']} req/{result['Server Errors']} err")
+    
+    # Summary statistics
+    print("\n=== RINGKASAN ===")
+    print(f"Total tests: {len(results)}")
+    print(f"Successful operations: {sum(r['Client Success'] for r in results)}")
+    print(f"Failed operations: {sum(r['Client Failure'] for r in results)}")
+    print(f"Results: {args.json}, {args.csv}")
+    
+    log_to_backlog("Stress test completed")
+    return results
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    main()